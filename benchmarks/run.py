@@ -0,0 +1,433 @@
+"""
+Benchmarks of gigaspoon: every validator, `CSRF`, `process_flat_form()` over
+forms of different shapes, `u.validate_item()` and compiled schemas over
+nested `List()`/`Dict()`/`Map()` trees, and whole requests through a Flask
+test client.
+
+Every benchmark is timed with `timeit`: the amount of calls per run is
+chosen so that a run takes at least 0.2 seconds, and the best and median
+time per call of `--repeat` runs are reported. Results can be written as
+JSON with `--json`, and compared with the results of an earlier run with
+`--compare`, so that releases can be compared on the same machine.
+
+The script benchmarks the checkout it is in, or with `--installed`, the
+installed gigaspoon, so that the same script can benchmark older releases.
+Benchmarks of features missing from the benchmarked version are skipped.
+
+:usage:
+    python benchmarks/run.py --json current.json
+    python -m venv old && old/bin/pip install <older gigaspoon>
+    old/bin/python benchmarks/run.py --installed --compare current.json
+    python benchmarks/run.py -k process_flat_form
+"""
+
+import argparse
+import datetime
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+
+import flask
+from werkzeug.datastructures import MultiDict
+
+if "--installed" not in sys.argv[1:]:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+        __file__))))
+
+import gigaspoon as gs  # noqa: E402
+
+try:
+    from gigaspoon import compiler  # noqa: E402
+except ImportError:
+    compiler = None
+
+try:
+    import importlib.metadata as metadata
+except ImportError:
+    metadata = None
+
+BENCHMARKS = {}
+
+
+class Unavailable(Exception):
+    """
+    Raised by the setup of a benchmark when the benchmarked version of
+    gigaspoon lacks the feature it needs.
+    """
+
+
+def _require(available, feature):
+    if not available:
+        raise Unavailable(feature)
+
+
+def _accepts(function, argument):
+    return argument in inspect.signature(function).parameters
+
+
+def benchmark(name):
+    """
+    Register a benchmark; the decorated function sets up the benchmark and
+    returns a function taking no arguments, which is timed.
+    """
+    def register(setup):
+        assert name not in BENCHMARKS, name
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def _validate(validator, value, key="input"):
+    return lambda: validator.validate(key, value)
+
+
+# Validators
+
+
+def _email_domains():
+    _require(_accepts(gs.v.Email, "domains"), "Email(domains=...)")
+    return gs.v.Email(domains=["tenant%d.example.com" % index
+                               for index in range(1000)])
+
+
+def _ipaddress_networks():
+    _require(_accepts(gs.v.IPAddress, "networks"), "IPAddress(networks=...)")
+    return gs.v.IPAddress(networks=["10.%d.0.0/16" % index
+                                    for index in range(256)])
+
+
+def _register_validators():
+    # Validators taking options which older versions lack are created by a
+    # function when the benchmark is set up
+    cases = {
+        "Bool": (gs.v.Bool(), "yes"),
+        "Date": (gs.v.Date("%Y-%m-%d"), "2020-04-10"),
+        "Date.isoformat": (gs.v.Date(use_isoformat=True), "2020-04-10"),
+        "Email": (gs.v.Email(), "someone@example.com"),
+        "Email.domains": (_email_domains, "someone@tenant999.example.com"),
+        "Exists": (gs.v.Exists(), "value"),
+        "IPAddress.ipv4": (gs.v.IPAddress(), "192.168.0.1"),
+        "IPAddress.ipv6": (gs.v.IPAddress(["ipv4", "ipv6"]), "2001:db8::1"),
+        "IPAddress.networks": (_ipaddress_networks, "10.255.3.4"),
+        "LambdaFilter": (gs.v.LambdaFilter(lambda value: value.isalpha()),
+                         "value"),
+        "LambdaMap": (gs.v.LambdaMap(int), "42"),
+        "Length": (gs.v.Length(min=2, max=64), "value"),
+        "Regex": (gs.v.Regex("^[a-z]+[0-9]*$"), "value123"),
+        "Select": (gs.v.Select(["option%d" % index for index in range(100)]),
+                   "option99"),
+        "Time": (gs.v.Time("%H:%M:%S"), "12:30:00"),
+        "Time.isoformat": (gs.v.Time(use_isoformat=True), "12:30:00"),
+        "List": (gs.v.List(gs.v.Length(max=8)),
+                 ["item%d" % index for index in range(100)]),
+        "Dict": (gs.v.Dict(**{"field%d" % index: gs.v.Length(max=8)
+                              for index in range(10)}),
+                 {"field%d" % index: "value" for index in range(10)}),
+        "Map": (gs.v.Map(gs.v.Length(max=8)),
+                {"key%d" % index: "value" for index in range(100)}),
+    }
+    for name, (validator, value) in cases.items():
+        benchmark("validators.%s" % name)(
+            lambda validator=validator, value=value: _validate(
+                validator if isinstance(validator, gs.v.Validator)
+                else validator(), value))
+
+
+_register_validators()
+
+
+def _csrf(stateless):
+    app = flask.Flask("benchmark")
+    app.secret_key = "benchmark"
+    if stateless:
+        _require(_accepts(gs.flask.CSRF, "stateless"), "CSRF(stateless=...)")
+        validator = gs.flask.CSRF(stateless=True, identity=lambda: "user")
+    else:
+        validator = gs.flask.CSRF()
+    context = app.test_request_context()
+    context.push()
+    token = validator.populate("csrf")["token"]
+    return _validate(validator, token, "csrf")
+
+
+@benchmark("validators.CSRF.session")
+def _csrf_session():
+    return _csrf(stateless=False)
+
+
+@benchmark("validators.CSRF.stateless")
+def _csrf_stateless():
+    return _csrf(stateless=True)
+
+
+# process_flat_form
+
+
+@benchmark("process_flat_form.flat")
+def _flat_form_flat():
+    form = {"field%d" % index: "value" for index in range(200)}
+    return lambda: gs.flask.process_flat_form(form)
+
+
+@benchmark("process_flat_form.deep")
+def _flat_form_deep():
+    form = {"a.b.c.d.e.f.g.field%d" % index: "value" for index in range(200)}
+    return lambda: gs.flask.process_flat_form(form)
+
+
+@benchmark("process_flat_form.indexed_rows")
+def _flat_form_indexed_rows():
+    form = {}
+    for index in range(1000):
+        form["rows.%d.id" % index] = str(index)
+        form["rows.%d.name" % index] = "name"
+        form["rows.%d.tags.%d" % (index, index % 3)] = "tag"
+    return lambda: gs.flask.process_flat_form(form)
+
+
+@benchmark("process_flat_form.repeated")
+def _flat_form_repeated():
+    form = MultiDict([("tags[]", "tag%d" % index) for index in range(500)] +
+                     [("ids", str(index)) for index in range(500)])
+    return lambda: gs.flask.process_flat_form(form)
+
+
+# Nested validator trees; the validators do not transform values, so values
+# validated in place can be validated again
+
+
+TREE = gs.v.Dict(
+    name=gs.v.Length(min=1, max=32),
+    rows=gs.v.List(gs.v.Dict(
+        id=gs.v.Regex("^[0-9]+$"),
+        kind=gs.v.Select(["a", "b", "c"]),
+        tags=gs.v.Map(gs.v.Length(max=8)),
+        values=gs.v.List(gs.v.Length(max=8)))))
+
+
+def _tree_value(rows):
+    return {
+        "name": "tree",
+        "rows": [{"id": str(index), "kind": "abc"[index % 3],
+                  "tags": {"x": "1", "y": "2"},
+                  "values": ["a", "b", "c", "d"]}
+                 for index in range(rows)],
+    }
+
+
+@benchmark("validate_item.tree")
+def _validate_item_tree():
+    value = _tree_value(100)
+    return lambda: gs.u.validate_item(TREE, "tree", value)
+
+
+@benchmark("compile_validator.tree")
+def _compiled_tree():
+    _require(compiler is not None, "gigaspoon.compiler")
+    value = _tree_value(100)
+    validate = compiler.compile_validator(TREE)
+    return lambda: validate("tree", value)
+
+
+@benchmark("validate_item.deep")
+def _validate_item_deep():
+    validator, value = gs.v.Length(max=8), "leaf"
+    for _ in range(20):
+        validator, value = gs.v.Dict(child=validator), {"child": value}
+    return lambda: gs.u.validate_item(validator, "deep", value)
+
+
+# Requests
+
+
+def _client(validators, **options):
+    app = flask.Flask("benchmark")
+    app.secret_key = "benchmark"
+
+    @app.route("/", methods=["GET", "POST"])
+    @gs.flask.validator(validators, **options)
+    @gs.flask.base
+    def index(form):
+        return "ok" if form.is_form() else "form"
+
+    @app.errorhandler(gs.e.FormError)
+    def handle_form_error(exc):
+        return str(exc), 400
+
+    return app.test_client()
+
+
+def _request(client, method, **kwargs):
+    def run():
+        response = client.open("/", method=method, **kwargs)
+        assert response.status_code == 200, response.data
+    return run
+
+
+REQUEST_SCHEMA = {
+    "name": [gs.v.Length(min=1, max=32), gs.v.Regex("^[a-z]+$")],
+    "email": gs.v.Email(),
+    "fruit": gs.v.Select(["apples", "bananas"]),
+    "active": gs.v.Bool(),
+    "rows": gs.v.List(gs.v.Dict(id=gs.v.Regex("^[0-9]+$"),
+                                note=gs.v.Length(max=16))),
+}
+
+
+def _request_form(rows):
+    form = {"name": "spoon", "email": "someone@example.com",
+            "fruit": "apples", "active": "yes"}
+    for index in range(rows):
+        form["rows.%d.id" % index] = str(index)
+        form["rows.%d.note" % index] = "note"
+    return form
+
+
+@benchmark("request.get")
+def _request_get():
+    return _request(_client(REQUEST_SCHEMA), "GET")
+
+
+@benchmark("request.form")
+def _request_post_form():
+    return _request(_client(REQUEST_SCHEMA), "POST", data=_request_form(10))
+
+
+@benchmark("request.form.rows")
+def _request_post_form_rows():
+    return _request(_client(REQUEST_SCHEMA), "POST", data=_request_form(500))
+
+
+@benchmark("request.json")
+def _request_post_json():
+    form = gs.flask.process_flat_form(_request_form(10))
+    return _request(_client(REQUEST_SCHEMA), "POST", json=form)
+
+
+@benchmark("request.csrf")
+def _request_csrf():
+    client = _client({"csrf": gs.flask.CSRF()})
+    with client.session_transaction() as session:
+        session["_csrf_token"] = "token"
+    return _request(client, "POST", data={"csrf": "token"})
+
+
+# Running
+
+
+def run_benchmark(setup, repeat):
+    """
+    Time the benchmark set up by `setup`, raising `Unavailable` if it can not
+    run on the benchmarked version.
+    """
+    function = setup()
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    number = max(number, 1)
+    times = [elapsed / number * 1e9 for elapsed in
+             timer.repeat(repeat=repeat, number=number)]
+    return {"number": number, "best_ns": min(times),
+            "median_ns": statistics.median(times)}
+
+
+def _version(package):
+    if metadata is not None:
+        try:
+            return metadata.version(package)
+        except metadata.PackageNotFoundError:
+            return None
+    try:
+        import pkg_resources
+    except ImportError:
+        return None
+    try:
+        return pkg_resources.get_distribution(package).version
+    except pkg_resources.DistributionNotFound:
+        return None
+
+
+def environment():
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(gs.__file__)),
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "revision": revision,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "gigaspoon": _version("gigaspoon") or getattr(gs, "__version__",
+                                                       None),
+        "gigaspoon_path": os.path.dirname(os.path.abspath(gs.__file__)),
+        "flask": _version("flask"),
+        "werkzeug": _version("werkzeug"),
+    }
+
+
+def _format_ns(value):
+    for unit, scale in [("s", 1e9), ("ms", 1e6), ("us", 1e3)]:
+        if value >= scale:
+            return "%.2f %s" % (value / scale, unit)
+    return "%.0f ns" % value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-k", dest="filter", default="",
+                        help="only run benchmarks containing this string")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs of every benchmark (default: 5)")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare",
+                        help="compare with results written by --json")
+    parser.add_argument("--list", action="store_true",
+                        help="list benchmarks without running them")
+    parser.add_argument("--installed", action="store_true",
+                        help="benchmark the installed gigaspoon instead of "
+                             "this checkout")
+    args = parser.parse_args(argv)
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    if args.list:
+        print("\n".join(names))
+        return 0
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+
+    results = {}
+    for name in names:
+        try:
+            result = results[name] = run_benchmark(BENCHMARKS[name],
+                                                   args.repeat)
+        except Unavailable as err:
+            print("%-40s %12s  (requires %s)" % (name, "skipped", err),
+                  flush=True)
+            continue
+        line = "%-40s %12s" % (name, _format_ns(result["best_ns"]))
+        if name in baseline:
+            line += "  %6.2fx" % (result["best_ns"] /
+                                  baseline[name]["best_ns"])
+        print(line, flush=True)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"environment": environment(), "results": results},
+                      file, indent=2, sort_keys=True)
+            file.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,9 @@
 from . import validators as v
 from . import errors as e
+from . import metrics  # noqa
+from . import options  # noqa
+from . import parallel  # noqa
+from . import stream  # noqa
 
 try:
     from .integrations import flask_integration as flask  # noqa
@@ -0,0 +1,294 @@
+"""
+This module compiles validator trees into specialized Python functions. The
+generic path (`u.validate_item`) walks every validator object on every call;
+a compiled schema is generated once, with loops unrolled per field and the
+checks of built-in validators inlined into the generated source.
+
+Validators that are not built-in (or that are subclassed) are called through
+their `validate()` method exactly as `u.validate_item` would call them, with
+names formatted as strings.
+"""
+
+import itertools
+import re
+
+from . import errors as e
+from . import validators as v
+from . import u
+
+
+# Types whose repr() can be embedded directly into generated source
+_LITERAL_TYPES = (bool, int, str, type(None))
+
+
+class _Generator(object):
+    """
+    Accumulates generated source lines and the namespace the generated
+    function will be executed in.
+    """
+
+    def __init__(self):
+        self.namespace = {"FormKeyError": e.FormKeyError, "Path": u.Path}
+        self.lines = []
+        self._counter = itertools.count()
+
+    def name(self, prefix):
+        return "%s%d" % (prefix, next(self._counter))
+
+    def bind(self, obj, prefix="_c"):
+        name = self.name(prefix)
+        self.namespace[name] = obj
+        return name
+
+    def const(self, obj):
+        if type(obj) in _LITERAL_TYPES:
+            return repr(obj)
+        return self.bind(obj)
+
+    def emit(self, indent, line):
+        self.lines.append("    " * indent + line)
+
+    def chain(self, validators, key, var, indent):
+        """
+        Emit code validating the local variable `var` against `validators`,
+        replacing `var` with transformed values. `key` is a source expression
+        evaluating to the name of the value; nested values are named by a
+        `u.Path` which is only formatted if an error is raised.
+        """
+        for fusable, group in itertools.groupby(
+                v.wrap_validator_list(validators), _fusable_regex):
+            group = list(group)
+            if fusable and len(group) > 1:
+                _inline_regexes(self, group, key, var, indent)
+                continue
+            for validator in group:
+                assert isinstance(validator, v.Validator)
+                inline = _INLINERS.get(type(validator))
+                if inline is None or not inline(self, validator, key, var,
+                                                indent):
+                    self.call(validator, key, var, indent)
+
+    def call(self, validator, key, var, indent):
+        validator_name = self.bind(validator, "_v")
+        if not u._builtin(validator):
+            # As in `u.name_for()`, other validators are passed strings
+            key = "(str(%s) if type(%s) is Path else %s)" % (key, key, key)
+        self.emit(indent, "r = %s.validate(%s, %s)" % (validator_name, key,
+                                                       var))
+        self.emit(indent, "if r is not None:")
+        self.emit(indent + 1, "%s = r" % var)
+
+    def compile(self, source_name, function_name):
+        source = "\n".join(self.lines) + "\n"
+        exec(compile(source, source_name, "exec"), self.namespace)
+        function = self.namespace[function_name]
+        function._source = source
+        return function
+
+
+# Inliners; each emits the equivalent of `validator.validate()` and returns
+# True, or returns False to fall back to calling the validator.
+
+
+def _inline_list(gen, validator, key, var, indent):
+    if validator.parallel is not None:
+        return False
+    validator_name = gen.bind(validator, "_v")
+    index, item, path = gen.name("i"), gen.name("x"), gen.name("p")
+    gen.emit(indent, "if not isinstance(%s, list):" % var)
+    gen.emit(indent + 1, "%s.raise_error(%s, %s, message=%r)" % (
+        validator_name, key, var, "Form field is not a list"))
+    if validator.max_items is not None:
+        gen.emit(indent, "if len(%s) > %d:" % (var, validator.max_items))
+        gen.emit(indent + 1, "%s.raise_error(%s, %s, message=%s._too_many(%s))"
+                 % (validator_name, key, var, validator_name, var))
+    gen.emit(indent, "%s = Path(%s, %r)" % (path, key, u.Path.INDEX))
+    gen.emit(indent, "for %s in range(len(%s)):" % (index, var))
+    gen.emit(indent + 1, "%s.key = %s" % (path, index))
+    gen.emit(indent + 1, "%s = %s[%s]" % (item, var, index))
+    gen.chain(validator.validator, path, item, indent + 1)
+    gen.emit(indent + 1, "%s[%s] = %s" % (var, index, item))
+    return True
+
+
+def _inline_dict(gen, validator, key, var, indent):
+    validator_name = gen.bind(validator, "_v")
+    path = gen.name("p")
+    gen.emit(indent, "if not isinstance(%s, dict):" % var)
+    gen.emit(indent + 1, "%s.raise_error(%s, %s, message=%r)" % (
+        validator_name, key, var, "Form field is not a dict"))
+    gen.emit(indent, "%s = Path(%s, %r)" % (path, key, u.Path.ATTRIBUTE))
+    for dict_key, validators in validator.fields.items():
+        item = gen.name("x")
+        gen.emit(indent, "%s.key = %r" % (path, dict_key))
+        gen.emit(indent, "try:")
+        gen.emit(indent + 1, "%s = %s[%r]" % (item, var, dict_key))
+        gen.emit(indent, "except KeyError:")
+        gen.emit(indent + 1, "raise FormKeyError(%s)" % path)
+        gen.chain(validators, path, item, indent)
+        gen.emit(indent, "%s[%r] = %s" % (var, dict_key, item))
+    return True
+
+
+def _inline_map(gen, validator, key, var, indent):
+    validator_name = gen.bind(validator, "_v")
+    map_key, item, path = gen.name("k"), gen.name("x"), gen.name("p")
+    gen.emit(indent, "if not isinstance(%s, dict):" % var)
+    gen.emit(indent + 1, "%s.raise_error(%s, %s, message=%r)" % (
+        validator_name, key, var, "Form field is not a dict"))
+    gen.emit(indent, "%s = Path(%s, %r)" % (path, key, u.Path.INDEX))
+    gen.emit(indent, "for %s, %s in %s.items():" % (map_key, item, var))
+    gen.emit(indent + 1, "%s.key = %s" % (path, map_key))
+    gen.chain(validator.validator, path, item, indent + 1)
+    gen.emit(indent + 1, "%s[%s] = %s" % (var, map_key, item))
+    return True
+
+
+def _inline_lambdamap(gen, validator, key, var, indent):
+    validator_name = gen.bind(validator, "_v")
+    function_name = gen.bind(validator._lambda, "_f")
+    gen.emit(indent, "try:")
+    gen.emit(indent + 1, "r = %s(%s)" % (function_name, var))
+    gen.emit(indent, "except Exception as exc:")
+    gen.emit(indent + 1, "%s.raise_error(%s, %s, exception=exc)" % (
+        validator_name, key, var))
+    gen.emit(indent, "if r is not None:")
+    gen.emit(indent + 1, "%s = r" % var)
+    return True
+
+
+def _inline_bool(gen, validator, key, var, indent):
+    validator_name = gen.bind(validator, "_v")
+    lowered = gen.name("b")
+    gen.emit(indent, "%s = %s.lower()" % (lowered, var))
+    gen.emit(indent, "if %s in ('yes', 'true', 'on'):" % lowered)
+    gen.emit(indent + 1, "%s = True" % var)
+    gen.emit(indent, "elif %s in ('no', 'false', 'off'):" % lowered)
+    gen.emit(indent + 1, "%s = False" % var)
+    gen.emit(indent, "else:")
+    gen.emit(indent + 1, "%s.raise_error(%s, %s, message=%r)" % (
+        validator_name, key, lowered, "Value does not appear to be a bool"))
+    return True
+
+
+def _inline_exists(gen, validator, key, var, indent):
+    return True
+
+
+def _inline_length(gen, validator, key, var, indent):
+    if validator._min is None and validator._max is None:
+        return True
+    validator_name = gen.bind(validator, "_v")
+    length = gen.name("n")
+    gen.emit(indent, "%s = len(%s)" % (length, var))
+    for bound, word, operator in [(validator._min, "short", "<"),
+                                  (validator._max, "long", ">")]:
+        if bound is None:
+            continue
+        bound = gen.const(bound)
+        gen.emit(indent, "if %s %s %s:" % (length, operator, bound))
+        gen.emit(indent + 1, "%s.raise_error(%s, %s, message=%r %% (%s, %s))"
+                 % (validator_name, key, var,
+                    "value too %s (%%s %s %%s)" % (word, operator),
+                    length, bound))
+    return True
+
+
+def _inline_regex(gen, validator, key, var, indent):
+    if validator.timeout is not None or validator.max_length is not None:
+        return False
+    validator_name = gen.bind(validator, "_v")
+    match = gen.bind(validator.pattern.match, "_m")
+    gen.emit(indent, "if not %s(%s):" % (match, var))
+    gen.emit(indent + 1, "%s.raise_error(%s, %s, message=%s.pattern)" % (
+        validator_name, key, var, validator_name))
+    return True
+
+
+def _fusable_regex(validator):
+    return type(validator) is v.Regex and validator._fusable
+
+
+def _inline_regexes(gen, validators, key, var, indent):
+    # Consecutive patterns are fused into one pattern of optional lookaheads,
+    # each followed by an empty marker group; the match always succeeds, and
+    # a marker which did not participate names the first failing pattern
+    parts, markers, group = [], [], 0
+    for validator in validators:
+        parts.append("(?:(?=(?:%s))()|)" % validator.pattern.pattern)
+        group += validator.pattern.groups + 1
+        markers.append(group)
+    match = gen.bind(re.compile("".join(parts)).match, "_m")
+    result = gen.name("m")
+    gen.emit(indent, "%s = %s(%s)" % (result, match, var))
+    for validator, marker in zip(validators, markers):
+        validator_name = gen.bind(validator, "_v")
+        gen.emit(indent, "if %s[%d] is None:" % (result, marker))
+        gen.emit(indent + 1, "%s.raise_error(%s, %s, message=%s.pattern)" % (
+            validator_name, key, var, validator_name))
+
+
+def _inline_select(gen, validator, key, var, indent):
+    validator_name = gen.bind(validator, "_v")
+    options = gen.bind(validator._options, "_s")
+    gen.emit(indent, "if %s not in %s:" % (var, options))
+    gen.emit(indent + 1, "%s.raise_error(%s, %s)" % (validator_name, key,
+                                                      var))
+    return True
+
+
+_INLINERS = {
+    v.List: _inline_list,
+    v.Dict: _inline_dict,
+    v.Map: _inline_map,
+    v.LambdaMap: _inline_lambdamap,
+    v.Bool: _inline_bool,
+    v.Exists: _inline_exists,
+    v.Length: _inline_length,
+    v.Regex: _inline_regex,
+    v.Select: _inline_select,
+}
+
+
+def compile_validator(validators):
+    """
+    Compile a validator (or list of validators) into a function taking the
+    arguments `(key, value)` and returning the validated value, with the same
+    behavior as `u.validate_item(validators, key, value)`.
+    """
+    gen = _Generator()
+    gen.emit(0, "def validate_item(key, x):")
+    gen.chain(validators, "key", "x", 1)
+    gen.emit(1, "return x")
+    return gen.compile("<gigaspoon validator>", "validate_item")
+
+
+def compile_schema(validators):
+    """
+    Compile a mapping of form keys to a validator (or list of validators) into
+    a function taking the arguments `(values, output=None)`. Every key is
+    looked up in `values` (raising `FormKeyError` if it is missing) and
+    validated, in order, and the validated values are stored in `output`,
+    which is then returned.
+
+    :usage:
+        check = compile_schema({
+            "username": v.Length(min=6, max=30),
+            "email": [v.Length(max=100), v.Email()],
+        })
+        form = check({"username": "example", "email": "me@example.com"})
+    """
+    gen = _Generator()
+    gen.emit(0, "def check(values, output=None):")
+    gen.emit(1, "if output is None:")
+    gen.emit(2, "output = {}")
+    for name, validator_list in validators.items():
+        item = gen.name("x")
+        gen.emit(1, "try:")
+        gen.emit(2, "%s = values[%r]" % (item, name))
+        gen.emit(1, "except KeyError:")
+        gen.emit(2, "raise FormKeyError(%r)" % name)
+        gen.chain(validator_list, repr(name), item, 1)
+        gen.emit(1, "output[%r] = %s" % (name, item))
+    gen.emit(1, "return output")
+    return gen.compile("<gigaspoon schema>", "check")
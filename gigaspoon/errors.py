@@ -1,3 +1,13 @@
+from . import u
+
+
+def _resolve_key(key):
+    # Paths are only formatted once an error actually exists
+    if isinstance(key, u.Path):
+        return str(key)
+    return key
+
+
 class FormError(Exception):
     """
     Base error class for all form validation errors. This can be handled
@@ -15,7 +25,10 @@ class FormKeyError(FormError):
     """
 
     def __init__(self, key):
-        self.key = key
+        self.key = _resolve_key(key)
+
+    def __reduce__(self):
+        return type(self), (self.key,)
 
     def __str__(self):
         return "Expected key %r for form" % self.key
@@ -30,12 +43,16 @@ class ValidationError(FormError):
     """
 
     def __init__(self, key, value, validator, message=None, exception=None):
-        self.key = key
+        self.key = _resolve_key(key)
         self.value = value
         self.message = message
         self.exception = exception
         self._validator = validator
 
+    def __reduce__(self):
+        return type(self), (self.key, self.value, self._validator,
+                            self.message, self.exception)
+
     def __str__(self):
         post = ""
         if self.message is not None:
@@ -44,3 +61,86 @@ class ValidationError(FormError):
             post += " <%r>" % self.exception
         return "%r: %r failed test for %s%s" % (
             self.key, self.value, type(self._validator), post)
+
+
+class FormLimitError(FormError):
+    """
+    This error is raised while form data is being received, if a field is
+    not expected by the validators of a page or is larger than they could
+    ever accept, so that the rest of the request does not have to be read.
+    """
+
+    def __init__(self, key, message):
+        self.key = _resolve_key(key)
+        self.message = message
+
+    def __reduce__(self):
+        return type(self), (self.key, self.message)
+
+    def __str__(self):
+        return "%r: %s" % (self.key, self.message)
+
+
+class FormStructureError(FormLimitError):
+    """
+    This error is raised if the keys of a flat form describe a structure
+    larger than the validators of a page accept, such as keys nested too
+    deeply or arrays with too many items.
+    """
+    pass
+
+
+class UnsafePatternWarning(UserWarning):
+    """
+    This warning is emitted by the Regex() validator if its pattern may take
+    exponential (or polynomial) time to match some inputs, which could be
+    used to occupy a worker with a single request.
+    """
+    pass
+
+
+class Invalid(object):
+    """
+    Lightweight record of an invalid value, collected by validators instead
+    of raising an error when validating in a non-raising mode (see
+    `Validator.check()`). The matching error can be created with
+    `to_error()`.
+    """
+    __slots__ = ("key", "value", "message", "exception", "error_class",
+                 "_validator", "_error")
+
+    def __init__(self, key, value, validator, message=None, exception=None,
+                 error_class=ValidationError):
+        self.key = _resolve_key(key)
+        self.value = value
+        self.message = message
+        self.exception = exception
+        self.error_class = error_class
+        self._validator = validator
+        self._error = None
+
+    @classmethod
+    def from_error(cls, error):
+        invalid = cls(getattr(error, "key", None),
+                      getattr(error, "value", None),
+                      getattr(error, "_validator", None),
+                      message=getattr(error, "message", None),
+                      exception=getattr(error, "exception", None),
+                      error_class=type(error))
+        invalid._error = error
+        return invalid
+
+    def to_error(self):
+        if self._error is not None:
+            return self._error
+        if issubclass(self.error_class, ValidationError):
+            return self.error_class(self.key, self.value, self._validator,
+                                    message=self.message,
+                                    exception=self.exception)
+        return self.error_class(self.key)
+
+    def __str__(self):
+        return str(self.to_error())
+
+    def __repr__(self):
+        return "<Invalid %s>" % self
@@ -2,17 +2,30 @@ from typing import List, Callable
 from collections.abc import Iterable
 
 import base64
+import collections
+import concurrent.futures
+import contextvars
+import copy
+import hashlib
+import hmac
 import os
 import functools
+import inspect
+import threading
+import time
+import urllib.parse
 
 import flask
+from werkzeug.formparser import FormDataParser
 
+from .. import compiler
+from .. import stream as s
 from .. import validators as v
 from .. import errors as e
 from .. import u
 
 
-def process_flat_form(input_form):
+def process_flat_form(input_form, structure=None, fields=None):
     """
     Function adapted from https://github.com/marrow/WebCore
 
@@ -60,39 +73,88 @@ def process_flat_form(input_form):
     be able to be preserved if there are voids; Python lists are not sparse.
 
     No validation of values is performed.
+
+    Every key is split once, arrays are tracked by identity and ordered with
+    a pass over their indexes, so the cost of the transformation is linear in
+    the total length of the submitted keys (plus sorting the indexes of very
+    sparse arrays). Repeated values of a MultiDict are all kept.
+
+    If `structure` (a `FormStructure`) is passed, keys exceeding its limits
+    raise `e.FormStructureError`.
+
+    If `fields` (a set of names) is passed, keys whose first part (before any
+    `.` or `[]`) is not one of the names are skipped without being parsed,
+    and are not counted by `structure`.
     """
 
-    ordered_arrays = []
+    ordered_arrays = {}
     output = {}
 
+    if structure is None:
+        structure = FormStructure()
+    max_depth, max_keys, max_items = (structure.max_depth, structure.max_keys,
+                                      structure.max_items)
+
+    # MultiDict.items() only returns the first value of every key
+    if hasattr(input_form, "getlist"):
+        items = input_form.items(multi=True)
+    else:
+        items = input_form.items()
+
     # Process arguments one at a time and apply them to the output passed in.
 
-    for name, value in input_form.items():
+    count = 0
+    for key, value in items:
+        if fields is not None:
+            field = key.partition('.')[0]
+            if field.endswith('[]'):
+                field = field[:-2]
+            if field not in fields:
+                continue
+
+        count += 1
+        if max_keys is not None and count > max_keys:
+            raise e.FormStructureError(key, "too many fields (> %d)" %
+                                       max_keys)
         container = output
+        name = key
 
         if '.' in name:
             parts = name.split('.')
-            name = name.rpartition('.')[2]
-
-            for target, following in zip(parts[:-1], parts[1:]):
-                if following.isnumeric():  # Prepare any use of numeric IDs.
-                    container.setdefault(target, [{}])
-                    if container[target] not in ordered_arrays:
-                        ordered_arrays.append(container[target])
-                    container = container[target][0]
+            if max_depth is not None and len(parts) > max_depth:
+                raise e.FormStructureError(key, "too deeply nested (> %d)" %
+                                           max_depth)
+            name = parts[-1]
+            indexed = False
+
+            for depth in range(len(parts) - 1):
+                target = parts[depth]
+                if indexed:  # Elements of an array are keyed by number
+                    target = structure.index(key, target)
+
+                indexed = parts[depth + 1].isdecimal()
+                if indexed:  # Prepare any use of numeric IDs.
+                    array = container.get(target)
+                    if array is None:
+                        array = container[target] = [{}]
+                        ordered_arrays[id(array)] = (array, parts[:depth + 1])
+                    container = array[0]
                     continue
 
                 container = container.setdefault(target, {})
 
         if name.endswith('[]'):  # `foo[]` or `foo.bar[]` etc.
             name = name[:-2]
-            container.setdefault(name, [])
-            container[name].append(value)
+            values = container.setdefault(name, [])
+            values.append(value)
+            if max_items is not None and len(values) > max_items:
+                raise e.FormStructureError(key, "too many items (> %d)" %
+                                           max_items)
             continue
 
         # trailing identifiers, `foo.<id>`
-        if name.isnumeric() and container is not output:
-            container[int(name)] = value
+        if name.isdecimal() and container is not output:
+            container[structure.index(key, name)] = value
             continue
 
         if name in container:
@@ -100,18 +162,157 @@ def process_flat_form(input_form):
                 container[name] = [container[name]]
 
             container[name].append(value)
+            if max_items is not None and len(container[name]) > max_items:
+                raise e.FormStructureError(key, "too many items (> %d)" %
+                                           max_items)
             continue
 
         container[name] = value
 
-    for container in ordered_arrays:
+    for container, parts in ordered_arrays.values():
         elements = container[0]
+        if max_items is not None and len(elements) > max_items:
+            raise e.FormStructureError(".".join(parts),
+                                       "too many items (> %d)" % max_items)
         del container[:]
-        container.extend(value for name, value in sorted(elements.items()))
+        container.extend(_ordered_values(elements))
 
     return output
 
 
+def _ordered_values(elements):
+    """
+    Return the values of a dict keyed by array indexes, ordered by index.
+    Dense indexes are placed in slots in linear time; sparse indexes are
+    sorted instead, to avoid allocating for every possible index.
+    """
+    if not elements:
+        return []
+
+    highest = max(elements)
+    if highest >= 2 * len(elements):
+        return [elements[index] for index in sorted(elements)]
+
+    missing = object()
+    slots = [missing] * (highest + 1)
+    for index, value in elements.items():
+        slots[index] = value
+    return [value for value in slots if value is not missing]
+
+
+class FormStructure(object):
+    """
+    Limits of the structure `process_flat_form()` builds from the keys of a
+    form: the most parts a key can have (`max_depth`), the most keys which
+    are not skipped (`max_keys`), the largest index of an array
+    (`max_index`), and the most items an array can have (`max_items`).
+    Limits which are None are not checked.
+
+    `from_schema()` derives limits from validators, as is done by default by
+    `validator()`.
+    """
+
+    # Limits used for parts of schemas with no bounds
+    DEFAULT_MAX_DEPTH = 32
+    DEFAULT_MAX_KEYS = 10000
+    DEFAULT_MAX_INDEX = 100000
+    DEFAULT_MAX_ITEMS = 10000
+
+    def __init__(self, max_depth=None, max_keys=None, max_index=None,
+                 max_items=None):
+        self.max_depth = max_depth
+        self.max_keys = max_keys
+        self.max_index = max_index
+        self.max_items = max_items
+        self._index_digits = None if max_index is None else len(
+            str(max_index))
+
+    def index(self, key, part):
+        """
+        Convert a numeric part of `key` to an index, checking its value.
+        """
+        if self.max_index is not None and (
+                len(part) > self._index_digits or
+                int(part) > self.max_index):
+            raise e.FormStructureError(key, "index too large (> %d)" %
+                                       self.max_index)
+        return int(part)
+
+    @classmethod
+    def from_schema(cls, validators):
+        """
+        Derive limits from a mapping of form keys to validators: the depth
+        and amount of keys of nested `Dict()` and `List()` validators, with
+        room for one more level and some fields that are not validated, and
+        the largest `max_items` (or `Length()` maximum) of `List()`
+        validators. Indexes may be up to ten times the largest list size, to
+        allow for gaps. The class defaults are used for values with no bound,
+        such as those of `Map()` or `Exists()` validators.
+
+        Limits never reject forms the validators could accept: a key
+        repeated for a field validated by `Length()`, which is folded into a
+        list, may be repeated up to the maximum of the `Length()` (or the
+        class default, without one).
+        """
+        depth, keys, items = _combine_shapes(
+            [_shape(validator_list) for validator_list in validators.values()],
+            sum)
+        return cls(
+            max_depth=cls.DEFAULT_MAX_DEPTH if depth is None else depth + 2,
+            max_keys=cls.DEFAULT_MAX_KEYS if keys is None else 2 * keys + 16,
+            max_index=(cls.DEFAULT_MAX_INDEX if items is None
+                       else 10 * max(items, 1)),
+            max_items=(cls.DEFAULT_MAX_ITEMS if items is None
+                       else max(items, 1)))
+
+
+def _combine_shapes(shapes, combine_keys):
+    # Combine shapes of values, where None is unbounded
+    def combine(values, function):
+        if not values:
+            return 0
+        if None in values:
+            return None
+        return function(values)
+
+    return (combine([shape[0] for shape in shapes], max),
+            combine([shape[1] for shape in shapes], combine_keys),
+            combine([shape[2] for shape in shapes], max))
+
+
+def _shape(validator_list):
+    """
+    Find `(depth, keys, items)` of values validated by `validator_list`: the
+    most key parts below the value, the most keys the value can take, and
+    the most items of any list in it, where None is unbounded.
+    """
+    validator_list = v.wrap_validator_list(validator_list)
+    shapes = []
+    for validator in validator_list:
+        if isinstance(validator, v.List):
+            depth, keys, items = _shape(validator.validator)
+            size = _max_items(validator_list, validator)
+            shapes.append((
+                None if depth is None else depth + 1,
+                None if keys is None or size is None else max(keys, 1) * size,
+                None if items is None or size is None else max(items, size)))
+        elif isinstance(validator, v.Dict):
+            depth, keys, items = _combine_shapes(
+                [_shape(field) for field in validator.fields.values()], sum)
+            shapes.append((None if depth is None else depth + 1, keys, items))
+        elif isinstance(validator, v.Map) or _accepts_structures(validator):
+            shapes.append((None, None, None))
+    if not shapes:  # a single value
+        # Repeated keys of a field are folded into a list, which Length()
+        # accepts up to its maximum
+        if any(isinstance(validator, v.Length)
+               for validator in validator_list):
+            size = _max_length(validator_list)
+            return 0, None if size is None else max(size, 1), size
+        return 0, 1, 0
+    return _combine_shapes(shapes, max)
+
+
 class Form(dict):
     """Dictionary with extra utilities for checking Flask form status
 
@@ -128,6 +329,8 @@ class Form(dict):
     def __init__(self, methods: List[str]):
         super(Form, self).__init__()
         self._methods = methods
+        # Invalid fields, for validators that collect errors
+        self.errors = []
 
     # Check if the current Flask request is in the set_methods() values
     def is_form(self):
@@ -146,8 +349,816 @@ def get_form(methods: List[str] = ["POST"]):
     return form
 
 
-# Prototype decorator for validating incoming requests
-def _validator_prototype(func: Callable, validators, *args, **kwargs):
+class _RequestValues(object):
+    """
+    Look up fields from the processed request form, falling back to the JSON
+    body of the request unless `use_json` is False. Raises KeyError for
+    fields that exist in neither.
+    """
+
+    def __init__(self, request_form, use_json=True):
+        self._request_form = request_form
+        self._use_json = use_json
+
+    def __getitem__(self, name):
+        item = self._request_form.get(name)
+        if item is None:
+            if not self._use_json:
+                raise KeyError(name)
+            json = flask.request.get_json(silent=True)
+            if json is None or json.get(name) is None:
+                raise KeyError(name)
+            item = json[name]
+        return item
+
+
+class _Populate(object):
+    """
+    Populate flask.g.[{name}_validator] with the values of every validator.
+    Values of validators that are not `dynamic` are computed on the first
+    request and shared, read-only, between requests.
+    """
+
+    def __init__(self, validators):
+        self._validators = validators
+        self._static = None
+        self._dynamic = {
+            name: [validator for validator in validator_list
+                   if validator.dynamic]
+            for name, validator_list in validators.items()}
+
+    def _populate_static(self):
+        static = {}
+        for name, validator_list in self._validators.items():
+            values = {}
+            for validator in validator_list:
+                if not validator.dynamic:
+                    values.update(u.sanitize(validator.name,
+                                             validator.populate(name)))
+            static[name] = u.ReadOnlyDict(values)
+        return static
+
+    def __call__(self):
+        if self._static is None:
+            self._static = self._populate_static()
+
+        for name, static_values in self._static.items():
+            populated_name = f"{name}_validator"
+            dynamic = self._dynamic[name]
+            values = getattr(flask.g, populated_name, None)
+            if values is None and not dynamic:
+                values = static_values
+            else:
+                # Copy values set by other validators instead of modifying
+                # them, as they may be shared
+                values = dict(values or {})
+                values.update(static_values)
+                for validator in dynamic:
+                    values.update(u.sanitize(validator.name,
+                                             validator.populate(name)))
+            setattr(flask.g, populated_name, values)
+            # Data is now accessible under something akin to:
+            # flask.g.email_validator["email_domain"]
+
+
+_shared_executor = None
+_shared_executor_lock = threading.Lock()
+
+
+# Create the thread pool shared by all views using `executor=True`
+def _get_shared_executor():
+    global _shared_executor
+    with _shared_executor_lock:
+        if _shared_executor is None:
+            _shared_executor = concurrent.futures.ThreadPoolExecutor(
+                thread_name_prefix="gigaspoon")
+    return _shared_executor
+
+
+def _run_completed(function, *args):
+    # Run a function in the current thread, returning its outcome as a Future
+    future = concurrent.futures.Future()
+    try:
+        future.set_result(function(*args))
+    except Exception as exc:  # pylint: disable=W0703
+        future.set_exception(exc)
+    return future
+
+
+def _check_task(validator_list, key, item, first_only):
+    errors = u.Errors(first_only=first_only)
+    return u.check_item(validator_list, key, item, errors), errors
+
+
+def _missing_key_task(key):
+    raise e.FormKeyError(key)
+
+
+def _missing_key_check_task(key, validator=None):
+    return u.INVALID, [e.Invalid(key, None, validator,
+                                 error_class=e.FormKeyError)]
+
+
+def _request_contexts():
+    # Flask 2.2+ keeps the request context in context variables, which tasks
+    # see through `contextvars.copy_context()`; older versions keep it in
+    # stacks local to every thread, which tasks push themselves
+    if hasattr(flask.globals, "_cv_request"):
+        return None
+    return flask._app_ctx_stack.top, flask._request_ctx_stack.top
+
+
+def _run_with_contexts(contexts, function, *args):
+    if contexts is None or flask.has_request_context():
+        return function(*args)
+    # Push the contexts of the request as they are, without the side effects
+    # of `RequestContext.push()` (opening the session, teardown, ...)
+    app_context, request_context = contexts
+    flask._app_ctx_stack.push(app_context)
+    flask._request_ctx_stack.push(request_context)
+    try:
+        return function(*args)
+    finally:
+        flask._request_ctx_stack.pop()
+        flask._app_ctx_stack.pop()
+
+
+class _ExecutorCheck(object):
+    """
+    Validate the fields of a request in an executor. Every field is a task,
+    except for fields validated by a single Dict, where every entry of the
+    Dict is a task. Outcomes are applied in the order of the schema, so that
+    the same values and errors result as when validating in order.
+
+    Tasks run with a copy of the context of the request, so that validators
+    can use `flask.request` and `flask.g`. Once an error ends validation,
+    the tasks which have not started yet are cancelled.
+    """
+
+    def __init__(self, validators, executor):
+        self._executor = executor
+        self._fields = []
+        for name, validator_list in validators.items():
+            entries = None
+            if len(validator_list) == 1 and type(validator_list[0]) is v.Dict:
+                entries = [(dict_key, entry_validators,
+                            compiler.compile_validator(entry_validators))
+                           for dict_key, entry_validators
+                           in validator_list[0].fields.items()]
+            self._fields.append((name, validator_list,
+                                 compiler.compile_validator(validator_list),
+                                 entries))
+
+    # Find the tasks of every field, as (name, item, [(key, task)]); the
+    # outcome of a task with a key is stored in the item under that key,
+    # otherwise it is the validated item
+    def _tasks(self, values, first_only):
+        collect = first_only is not None
+        for name, validator_list, validate, entries in self._fields:
+            try:
+                item = values[name]
+            except KeyError:
+                task = (_missing_key_check_task if collect
+                        else _missing_key_task, name)
+                yield name, None, [(None, task)]
+                continue
+
+            if entries is None or not isinstance(item, dict):
+                if collect:
+                    task = (_check_task, validator_list, name, item,
+                            first_only)
+                else:
+                    task = (validate, name, item)
+                yield name, item, [(None, task)]
+                continue
+
+            tasks = []
+            for dict_key, entry_validators, validate_entry in entries:
+                path = u.Path(name, u.Path.ATTRIBUTE, dict_key)
+                if dict_key not in item:
+                    task = ((_missing_key_check_task, path, validator_list[0])
+                            if collect else (_missing_key_task, path))
+                elif collect:
+                    task = (_check_task, entry_validators, path,
+                            item[dict_key], first_only)
+                else:
+                    task = (validate_entry, path, item[dict_key])
+                tasks.append((dict_key, task))
+            yield name, item, tasks
+
+    def __call__(self, values, output, errors=None):
+        """
+        Validate `values` into `output`, raising the first error, or if
+        `errors` is passed, collecting errors as `u.check_fields()` would.
+        """
+        first_only = None if errors is None else errors.first_only
+        fields = list(self._tasks(values, first_only))
+
+        # Submit every task but the last, which runs in this thread
+        tasks = [task for _, _, field_tasks in fields
+                 for _, task in field_tasks]
+        contexts = _request_contexts()
+        futures = []
+        for task in tasks[:-1]:
+            context = contextvars.copy_context()
+            futures.append(self._executor.submit(
+                context.run, _run_with_contexts, contexts, *task))
+        if tasks:
+            futures.append(_run_completed(*tasks[-1]))
+
+        try:
+            self._apply(fields, iter(futures), output, errors)
+        finally:
+            # Once the outcome is known, skip the tasks which are left
+            for future in futures:
+                future.cancel()
+        return output
+
+    @staticmethod
+    def _apply(fields, futures, output, errors):
+        first_only = errors is not None and errors.first_only
+        for name, item, field_tasks in fields:
+            field_errors = []
+            for key, _ in field_tasks:
+                result = next(futures).result()
+                if errors is not None:
+                    result, task_errors = result
+                    field_errors.extend(task_errors)
+                if key is None:
+                    item = result
+                elif result is not u.INVALID:
+                    item[key] = result
+
+            if not field_errors:
+                output[name] = item
+                continue
+            errors.extend(field_errors[:1] if first_only else field_errors)
+            if first_only:
+                break
+
+
+class _ObservedCheck(object):
+    """
+    Validate fields one at a time, recording the time taken and the error of
+    every field in a metrics sink, like `compiler.compile_schema()` (or
+    `u.check_fields()` if passed `errors`) over all fields.
+    """
+
+    def __init__(self, validators, sink):
+        self._fields = [
+            (name, {name: validator_list},
+             compiler.compile_schema({name: validator_list}))
+            for name, validator_list in validators.items()]
+        self._sink = sink
+
+    def __call__(self, route, values, output, errors=None):
+        for name, field, check in self._fields:
+            error = None
+            start = time.perf_counter()
+            try:
+                if errors is None:
+                    check(values, output)
+                else:
+                    count = len(errors)
+                    u.check_fields(field, values, errors, output)
+                    if len(errors) > count:
+                        error = errors[count].error_class.__name__
+            except Exception as err:
+                error = type(err).__name__
+                raise
+            finally:
+                self._sink.observe_field(route, name,
+                                         time.perf_counter() - start, error)
+            if error is not None and errors.first_only:
+                break
+        return output
+
+
+def _observe_request(metrics, validate, form, timer):
+    # Validate a request with `validate(form, route, timer)`, recording it in
+    # the sink of `metrics`
+    route = flask.request.endpoint or ""
+    sampled = metrics.sampled()
+    count = len(form.errors)
+    error = None
+    start = time.perf_counter()
+    try:
+        return validate(form, route if sampled else None, timer)
+    except Exception as err:
+        error = type(err).__name__
+        raise
+    finally:
+        if error is None and len(form.errors) > count:
+            error = form.errors[count].error_class.__name__
+        metrics.sink.observe_request(
+            route, time.perf_counter() - start if sampled else None, error)
+
+
+class _Timer(object):
+    """
+    Measure phases of validating a request, adding the nanoseconds taken by
+    every phase to `timing`. A phase lasts until the next phase is started,
+    or until the timer is stopped.
+    """
+
+    def __init__(self, timing):
+        self._timing = timing
+        self._phase = None
+        self._start = None
+
+    def start(self, phase):
+        now = time.perf_counter_ns()
+        if self._phase is not None:
+            self._timing[self._phase] = self._timing.get(self._phase, 0) + \
+                now - self._start
+        self._phase, self._start = phase, now
+
+    def stop(self):
+        self.start(None)
+
+
+class _NoTimer(object):
+    # Timer of requests which are not timed
+    def start(self, phase):
+        pass
+
+    def stop(self):
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+def _request_timer():
+    # Timer adding to `flask.g.server_timing` for the current request, which
+    # is sent in a Server-Timing header with the response
+    timing = flask.g.get("server_timing")
+    if timing is None:
+        timing = flask.g.server_timing = {}
+
+        @flask.after_this_request
+        def add_server_timing(response):
+            if timing:
+                response.headers.add("Server-Timing", ", ".join(
+                    "gigaspoon-%s;dur=%.3f" % (phase, duration / 1e6)
+                    for phase, duration in timing.items()))
+            return response
+    return _Timer(timing)
+
+
+class RetryCache(object):
+    """
+    Cache of the validated values of request payloads, for
+    `validator(retry_cache=...)`, so that retried requests with an identical
+    payload are not parsed and validated again. Payloads are identified by
+    a digest of the method, endpoint, query string, content type and body
+    of the request, and up to `maxsize` payloads are kept for `ttl` seconds.
+
+    Digests read the whole body, so a retry cache can not be combined with
+    `limits` on the same decorator or a decorator below it; limits set on an
+    outer decorator apply, as a URL-encoded form parsed there is digested
+    instead of the body. Multipart payloads, which may hold large uploads,
+    are never cached.
+
+    Only payloads whose fields are all valid are cached. Fields validated by
+    `dynamic` validators (such as `CSRF()`), whose outcome may depend on the
+    session, and the fields named in `exclude` are validated for every
+    request; exclude any other field whose outcome depends on more than the
+    payload, such as a check that a username is not taken.
+
+    :usage:
+        @app.route("/upload", methods=["GET", "POST"])
+        @sb.flask.validator({
+            "csrf": sb.flask.CSRF(),
+            "rows": sb.v.List(row_validator),
+        }, retry_cache=sb.flask.RetryCache(ttl=30))
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, exclude=()):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.exclude = frozenset(exclude)
+        self._payloads = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest():
+        """
+        Digest of the payload of the current request, or None for multipart
+        payloads; reads the body, unless it is a form which is already
+        parsed.
+        """
+        request = flask.request
+        if request.mimetype == "multipart/form-data":
+            return None
+        digest = hashlib.sha256()
+        for part in [request.method, request.endpoint or "",
+                     request.content_type or ""]:
+            digest.update(part.encode("utf8") + b"\0")
+        digest.update(request.query_string + b"\0")
+        if request.mimetype == "application/x-www-form-urlencoded" and \
+                "form" in request.__dict__:
+            # The body was consumed by parsing the form; other bodies are
+            # left to be read
+            for key, value in request.form.items(multi=True):
+                digest.update(key.encode("utf8") + b"\0" +
+                              value.encode("utf8") + b"\0")
+        else:
+            digest.update(request.get_data(cache=True))
+        return digest.digest()
+
+    def get(self, digest):
+        """
+        Copy of the values cached for a digest, or None.
+        """
+        with self._lock:
+            entry = self._payloads.get(digest)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._payloads[digest]
+                return None
+            self._payloads.move_to_end(digest)
+        return copy.deepcopy(entry[1])
+
+    def put(self, digest, values):
+        """
+        Cache a copy of the values validated for a digest.
+        """
+        entry = (time.monotonic() + self.ttl, copy.deepcopy(values))
+        with self._lock:
+            self._payloads[digest] = entry
+            self._payloads.move_to_end(digest)
+            while len(self._payloads) > self.maxsize:
+                self._payloads.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._payloads.clear()
+
+
+def _stream_items(list_validator, name, stream):
+    # Decode the elements of a JSON array from the body of the request
+    try:
+        yield from s.iter_json_array(stream)
+    except ValueError as exc:
+        list_validator.raise_error(name, None, message="invalid JSON array",
+                                   exception=exc)
+
+
+# Longest accepted field name, when limiting forms
+_MAX_KEY_LENGTH = 1024
+
+# UTF-8 continuation bytes, which do not start a new character
+_CONTINUATION_BYTES = bytes(range(0x80, 0xC0))
+
+
+def _max_length(validator_list):
+    # Smallest maximum of the Length() validators in a list
+    limits = [validator._max for validator in validator_list
+              if isinstance(validator, v.Length) and
+              validator._max is not None]
+    return min(limits) if limits else None
+
+
+def _max_items(validator_list, list_validator):
+    # Most items a list can have, from the List() and Length() validators
+    limits = [_max_length(validator_list), list_validator.max_items]
+    limits = [limit for limit in limits if limit is not None]
+    return min(limits) if limits else None
+
+
+def _accepts_structures(validator):
+    # Whether a validator may accept nested values, as validators which are
+    # not built-in may
+    if isinstance(validator, (v.Exists, v.LambdaMap, v.LambdaFilter)):
+        return True
+    return type(validator).__module__ != v.__name__
+
+
+class FormLimits(object):
+    """
+    Limits of the form data accepted by a page, derived from its validators,
+    which are checked while form data is received (see `validator()`):
+
+    - The first part of every key (before any `.` or `[]`) must be a
+      validated field, and nested keys must be entries of `Dict()`
+      validators, indexes of `List()` validators or keys of `Map()`
+      validators.
+    - Values can not be longer than the maximum of a `Length()` validator
+      of the value.
+    - Lists can not have more items than their `List()` validator's
+      `max_items`, or the maximum of a `Length()` validator of the list,
+      counting repeated keys and distinct indexes.
+
+    Values with no such limit are limited by `max_field_length`, and the
+    total amount of fields by `max_fields`, if set.
+    """
+
+    def __init__(self, validators, max_field_length=None, max_fields=None):
+        self._validators = {
+            name: v.wrap_validator_list(validator_list)
+            for name, validator_list in validators.items()}
+        self.max_field_length = max_field_length
+        self.max_fields = max_fields
+        self._cache = {}
+
+    def _resolve(self, pattern):
+        """
+        Find the limits of keys with the given parts, where indexes are
+        replaced by None. Returns `(lists, max_length)`, where `lists` is a
+        list of `(depth, max_items)` for every list the value is in, or
+        raises KeyError if the key is not expected.
+        """
+        def find(validator_type):
+            for validator in validator_list:
+                if isinstance(validator, validator_type):
+                    return validator
+            return None
+
+        validator_list = self._validators[pattern[0]]
+        lists = []
+        for depth, part in enumerate(pattern[1:], 1):
+            list_validator, dict_validator, map_validator = \
+                find(v.List), find(v.Dict), find(v.Map)
+            if part is None and list_validator is not None:
+                lists.append((depth, _max_items(validator_list,
+                                                list_validator)))
+                validator_list = list_validator.validator
+            elif dict_validator is not None and part in dict_validator.fields:
+                validator_list = dict_validator.fields[part]
+            elif map_validator is not None:
+                validator_list = map_validator.validator
+            elif all(_accepts_structures(validator)
+                     for validator in validator_list):
+                # Validated as a whole, by validators which are not known
+                return lists, None
+            else:
+                raise KeyError(part)
+            validator_list = v.wrap_validator_list(validator_list)
+
+        # Repeated keys, and keys ending with [], are items of a list
+        list_validator = find(v.List)
+        if list_validator is not None:
+            lists.append((len(pattern), _max_items(validator_list,
+                                                   list_validator)))
+            validator_list = v.wrap_validator_list(list_validator.validator)
+        return lists, _max_length(validator_list)
+
+    def field(self, key):
+        """
+        Return `(lists, max_length)` for a key, where `lists` is a list of
+        `(prefix, index, max_items)` for every list the value is in, and
+        `index` is None for items of repeated keys. Raises
+        `e.FormLimitError` if the key is not expected.
+        """
+        if len(key) > _MAX_KEY_LENGTH:
+            raise e.FormLimitError(key[:64], "field name is too long")
+        parts = key[:-2].split(".") if key.endswith("[]") else key.split(".")
+        pattern = tuple(None if part.isdecimal() and index else part
+                        for index, part in enumerate(parts))
+        try:
+            lists, max_length = self._cache[pattern]
+        except KeyError:
+            try:
+                lists, max_length = self._resolve(pattern)
+            except KeyError:
+                raise e.FormLimitError(key, "unexpected field")
+            if len(self._cache) < 1024:
+                self._cache[pattern] = (lists, max_length)
+
+        if max_length is None:
+            max_length = self.max_field_length
+        return [(".".join(parts[:depth]),
+                 parts[depth] if depth < len(parts) else None, max_items)
+                for depth, max_items in lists], max_length
+
+
+class _FormLimitState(object):
+    """
+    Counts the fields and list items of a single request.
+    """
+
+    def __init__(self, limits):
+        self.limits = limits
+        self._fields = 0
+        self._items = {}
+
+    def start(self, key):
+        """
+        Count a new field with the given key, returning its maximum length.
+        """
+        self._fields += 1
+        if self.limits.max_fields is not None and \
+                self._fields > self.limits.max_fields:
+            raise e.FormLimitError(key, "too many fields")
+
+        lists, max_length = self.limits.field(key)
+        for prefix, index, max_items in lists:
+            if max_items is None:
+                continue
+            if index is not None:  # `prefix.<index>`; count distinct indexes
+                items = self._items.setdefault(prefix, set())
+                items.add(index)
+                count = len(items)
+            else:  # repeated keys
+                count = self._items.get(prefix, 0) + 1
+                self._items[prefix] = count
+            if count > max_items:
+                raise e.FormLimitError(prefix, "too many items (%d > %d)" % (
+                    count, max_items))
+        return max_length
+
+
+def _check_length(key, length, max_length):
+    if max_length is not None and length > max_length:
+        raise e.FormLimitError(key, "value too long (%d > %d)" % (
+            length, max_length))
+
+
+class _UrlencodedChecker(object):
+    """
+    Checks the fields of `application/x-www-form-urlencoded` data as it is
+    received. Values are checked exactly once complete, and before then,
+    against the most bytes their maximum amount of characters could take
+    when percent-encoded.
+    """
+
+    def __init__(self, state):
+        self._state = state
+        self._pending = b""
+        self._pending_key = None
+
+    @staticmethod
+    def _unquote(data):
+        return urllib.parse.unquote_plus(data.decode("utf-8", "replace"),
+                                         errors="replace")
+
+    def _field(self, pair):
+        key, _, value = pair.partition(b"=")
+        key = self._unquote(key)
+        max_length = self._state.start(key)
+        if max_length is not None:
+            _check_length(key, len(self._unquote(value)), max_length)
+
+    def feed(self, data):
+        if not data:
+            if self._pending:
+                self._field(self._pending)
+            return
+
+        pairs = (self._pending + data).split(b"&")
+        self._pending = pairs.pop()
+        for pair in pairs:
+            if pair:
+                self._field(pair)
+
+        # Reject fields which can not fit before they are complete
+        key, separator, value = self._pending.partition(b"=")
+        if not separator:
+            if len(key) > 3 * _MAX_KEY_LENGTH:
+                raise e.FormLimitError(self._unquote(key[:192]),
+                                       "field name is too long")
+            return
+        key = self._unquote(key)
+        if key != self._pending_key:
+            self._pending_key = key
+            _, self._pending_max_length = self._state.limits.field(key)
+        if self._pending_max_length is not None:
+            # a character is at most 4 bytes, each percent-encoded
+            _check_length(key, len(value) // 12, self._pending_max_length)
+
+
+def _multipart():
+    # The sans-IO multipart decoder, which is only in Werkzeug 2.0 and later
+    try:
+        from werkzeug.sansio import multipart
+    except ImportError:
+        return None
+    return multipart
+
+
+class _MultipartChecker(object):
+    """
+    Checks the fields of `multipart/form-data` data as it is received,
+    counting the characters of text fields as their data arrives. Requires
+    Werkzeug 2.0 or later.
+    """
+
+    def __init__(self, state, boundary, multipart):
+        self._state = state
+        self._multipart = multipart
+        self._decoder = multipart.MultipartDecoder(boundary)
+        self._key = None
+        self._max_length = None
+        self._length = 0
+
+    def feed(self, data):
+        if self._decoder is None:
+            return
+        multipart = self._multipart
+        try:
+            self._decoder.receive_data(data or None)
+            event = self._decoder.next_event()
+            while not isinstance(event, (multipart.Epilogue,
+                                         multipart.NeedData)):
+                if isinstance(event, (multipart.Field, multipart.File)):
+                    self._key = event.name
+                    self._max_length = self._state.start(event.name)
+                    if isinstance(event, multipart.File):
+                        self._max_length = None
+                    self._length = 0
+                elif isinstance(event, multipart.Data) and \
+                        self._max_length is not None:
+                    self._length += len(
+                        event.data.translate(None, _CONTINUATION_BYTES))
+                    _check_length(self._key, self._length, self._max_length)
+                event = self._decoder.next_event()
+        except ValueError:
+            # Malformed data is left to the form parser to handle
+            self._decoder = None
+
+
+class _CheckedStream(object):
+    """
+    Stream passing all data read from `stream` to a checker.
+    """
+
+    def __init__(self, stream, checker):
+        self._stream = stream
+        self._checker = checker
+
+    def read(self, size=-1):
+        if size is not None and size >= 0:
+            data = self._stream.read(size)
+            self._checker.feed(data)
+            return data
+
+        chunks = []
+        while True:
+            data = self._stream.read(64 * 1024)
+            self._checker.feed(data)
+            if not data:
+                return b"".join(chunks)
+            chunks.append(data)
+
+
+class _LimitedFormDataParser(FormDataParser):
+    """
+    Form parser checking the `FormLimits` of a page while data is read.
+    Without the multipart decoder of Werkzeug 2.0, multipart data is
+    checked once it has been parsed.
+    """
+
+    def __init__(self, *args, limits, **kwargs):
+        super(_LimitedFormDataParser, self).__init__(*args, **kwargs)
+        self._limits = limits
+
+    def parse(self, stream, mimetype, content_length, options=None):
+        state = _FormLimitState(self._limits)
+        boundary = (options or {}).get("boundary", "").encode("ascii")
+        multipart = None
+        if mimetype == "application/x-www-form-urlencoded":
+            stream = _CheckedStream(stream, _UrlencodedChecker(state))
+        elif mimetype == "multipart/form-data" and boundary:
+            multipart = _multipart()
+            if multipart is not None:
+                stream = _CheckedStream(stream, _MultipartChecker(
+                    state, boundary, multipart))
+        result = super(_LimitedFormDataParser, self).parse(
+            stream, mimetype, content_length, options)
+
+        if mimetype == "multipart/form-data" and multipart is None:
+            _, form, files = result
+            for key, value in form.items(multi=True):
+                _check_length(key, len(value), state.start(key))
+            for key in files.keys():
+                for _ in files.getlist(key):
+                    state.start(key)
+        return result
+
+
+def _stacked(func):
+    # Markers of the `validator()` decorators wrapped by `func`, outermost
+    # first
+    while func is not None:
+        stacked = getattr(func, "_gigaspoon_validator", None)
+        if stacked is not None and stacked[0] is func:
+            yield stacked
+        func = getattr(func, "__wrapped__", None)
+
+
+def _stacked_validators(func):
+    # Validators of the `validator()` decorators wrapped by `func`
+    validators = {}
+    for stacked in _stacked(func):
+        for name, validator_list in stacked[2].items():
+            validators.setdefault(name, validator_list)
+    return validators
+
+
+# Wrap single validators into lists and make sure all are validators
+def _prepare_validators(validators):
     for name, validator_list in validators.items():
         if not isinstance(validator_list, Iterable):
             validator_list = [validator_list]
@@ -155,46 +1166,318 @@ def _validator_prototype(func: Callable, validators, *args, **kwargs):
         for validator in validator_list:
             assert isinstance(validator, v.Validator)
 
+
+# Prototype decorator for validating incoming requests
+def _validator_prototype(func: Callable, validators, *args, collect=None,
+                         handler=None, executor=None, stream=None,
+                         limits=None, structure=None, metrics=None,
+                         server_timing=False, retry_cache=None, **kwargs):
+    assert collect in (None, u.FIRST_ERROR, u.ALL_ERRORS)
+    _prepare_validators(validators)
+    assert not any(validator.asynchronous
+                   for validator_list in validators.values()
+                   for validator in validator_list), \
+        "asynchronous validators require async_validator()"
+
+    # Stacked decorators with the same options validate their fields in one
+    # pass, in the order they would be validated by the separate decorators.
+    # A handler stops validation at the first decorator with errors, and
+    # `FIRST_ERROR` records the first error of every decorator, so neither
+    # can be merged
+    options = dict(collect=collect, handler=handler, executor=executor,
+                   stream=stream, limits=limits, structure=structure,
+                   metrics=metrics, server_timing=server_timing,
+                   retry_cache=retry_cache)
+    stacked = getattr(func, "_gigaspoon_validator", None)
+    if stacked is not None and stacked[0] is func and handler is None and \
+            collect != u.FIRST_ERROR and stream is None and \
+            stacked[3] == options and \
+            validators.keys().isdisjoint(stacked[2]):
+        merged = dict(validators)
+        merged.update(stacked[2])
+        return _validator_prototype(stacked[1], merged, **options)
+
+    # Generate the validation function once, when decorating
+    check = compiler.compile_schema(validators)
+    populate = _Populate(validators)
+    if executor is True:
+        executor = _get_shared_executor()
+    if executor is not None:
+        executor_check = _ExecutorCheck(validators, executor)
+    if structure is None:
+        structure = FormStructure.from_schema(validators)
+    fields = frozenset(validators)
+    if limits is True:
+        # The form is parsed by the outermost decorator, so it must allow the
+        # fields of every decorator below it
+        limits = _stacked_validators(func)
+        limits.update(validators)
+        limits = FormLimits(limits)
+    if limits is not None:
+        form_data_parser_class = functools.partial(_LimitedFormDataParser,
+                                                   limits=limits)
+    if stream is not None:
+        assert collect is None, "streamed fields can not collect errors"
+        assert len(validators[stream]) == 1 and \
+            isinstance(validators[stream][0], v.List), \
+            "streamed fields must be validated by a single List()"
+        stream_list = validators[stream][0]
+        stream_check = compiler.compile_schema({
+            name: validator_list
+            for name, validator_list in validators.items()
+            if name != stream})
+
+    if metrics is not None:
+        observed_check = _ObservedCheck(validators, metrics.sink)
+    if retry_cache is not None:
+        assert stream is None, "streamed fields can not be cached"
+        assert limits is None and not any(
+            stacked[3]["limits"] is not None for stacked in _stacked(func)), \
+            "a retry cache reads the whole body, so limits must be set on " \
+            "an outer decorator"
+        excluded = {
+            name: validator_list
+            for name, validator_list in validators.items()
+            if name in retry_cache.exclude or
+            any(validator.dynamic for validator in validator_list)}
+        excluded_check = compiler.compile_schema(excluded)
+        excluded_fields = frozenset(excluded)
+
+    # Validate the request into `form`, returning the response of `handler`
+    # if errors are collected. Fields are validated one at a time by
+    # `observed_check` for sampled requests, with the name of the route, and
+    # the phases of validation are measured by `timer`
+    def validate(form, route=None, timer=_NO_TIMER):
+        if stream is not None and flask.request.is_json:
+            # Validate elements of the body only as they are used
+            timer.start("flatten")
+            request_form = process_flat_form(flask.request.args, structure,
+                                             fields)
+            timer.start("validate")
+            stream_check(_RequestValues(request_form, use_json=False), form)
+            form[stream] = stream_list.iter_validate(
+                stream, _stream_items(stream_list, stream,
+                                      flask.request.stream))
+            return None
+
+        if limits is not None:
+            flask.request.form_data_parser_class = form_data_parser_class
+        timer.start("parse")
+        request_form = flask.request.form
+        if timer is not _NO_TIMER and flask.request.is_json:
+            # Parse JSON bodies now rather than when looking up fields
+            flask.request.get_json(silent=True)
+        timer.start("flatten")
+        request_form = process_flat_form(request_form, structure, fields)
+        timer.start("validate")
+
+        # Locate items in either form or JSON and validate all fields;
+        # valid data is put into our local form
+        if collect is None and executor is None:
+            if route is None:
+                check(_RequestValues(request_form), form)
+            else:
+                observed_check(route, _RequestValues(request_form), form)
+        elif collect is None:
+            executor_check(_RequestValues(request_form), form)
+        else:
+            errors = u.Errors(first_only=collect == u.FIRST_ERROR)
+            if executor is not None:
+                executor_check(_RequestValues(request_form), form, errors)
+            elif route is None:
+                u.check_fields(validators, _RequestValues(request_form),
+                               errors, form)
+            else:
+                observed_check(route, _RequestValues(request_form), form,
+                               errors)
+            if errors:
+                form.errors.extend(errors)
+                if handler is not None:
+                    timer.stop()
+                    return handler(form.errors)
+        return None
+
+    # Validate the request like `validate()`, unless the same payload was
+    # validated before; then its values are restored from `retry_cache`, and
+    # only excluded fields are validated
+    def validate_cached(form, route=None, timer=_NO_TIMER):
+        timer.start("parse")
+        digest = retry_cache.digest()
+        if digest is None:
+            return validate(form, route, timer)
+        values = retry_cache.get(digest)
+        if values is None:
+            count = len(form.errors)
+            response = validate(form, route, timer)
+            if len(form.errors) == count:
+                retry_cache.put(digest, {
+                    name: form[name] for name in validators
+                    if name not in excluded_fields})
+            return response
+
+        if limits is not None:
+            flask.request.form_data_parser_class = form_data_parser_class
+        request_form = flask.request.form if excluded_fields else {}
+        timer.start("flatten")
+        request_form = process_flat_form(request_form, structure,
+                                         excluded_fields)
+        timer.start("validate")
+        form.update(values)
+        if collect is None:
+            excluded_check(_RequestValues(request_form), form)
+            return None
+        errors = u.Errors(first_only=collect == u.FIRST_ERROR)
+        u.check_fields(excluded, _RequestValues(request_form), errors, form)
+        if errors:
+            form.errors.extend(errors)
+            if handler is not None:
+                timer.stop()
+                return handler(form.errors)
+        return None
+
+    run = validate if retry_cache is None else validate_cached
+
     @functools.wraps(func)
     def handle_func(*args, **kwargs):
+        timer = _request_timer() if server_timing else _NO_TIMER
         form = get_form()
         if form.is_form():
-            request_form = process_flat_form(flask.request.form)
+            try:
+                if metrics is None:
+                    response = run(form, timer=timer)
+                else:
+                    response = _observe_request(metrics, run, form, timer)
+            finally:
+                timer.stop()
+            if response is not None:
+                return response
+        else:
+            timer.start("populate")
+            populate()
+            timer.stop()
+        return func(*args, **kwargs)
+    handle_func._gigaspoon_validator = (handle_func, func, validators,
+                                        options)
+    return handle_func
 
-            # Iterate through all fields
-            for name, validator_list in validators.items():
 
-                # Locate item in either form or JSON
-                item = request_form.get(name)
-                if item is None:
-                    json = flask.request.json
-                    if json is None or json.get(name) is None:
-                        raise e.FormKeyError(name)
-                    item = json[name]
+# Prototype decorator for validating incoming requests asynchronously
+def _async_validator_prototype(func: Callable, validators, *args,
+                               collect=None, handler=None, structure=None,
+                               **kwargs):
+    assert collect in (None, u.FIRST_ERROR, u.ALL_ERRORS)
+    _prepare_validators(validators)
+    populate = _Populate(validators)
+    if structure is None:
+        structure = FormStructure.from_schema(validators)
+    fields = frozenset(validators)
+
+    # Without asynchronous validators, nothing is gained by scheduling
+    check = None
+    if not any(validator.asynchronous
+               for validator_list in validators.values()
+               for validator in validator_list):
+        check = compiler.compile_schema(validators)
+
+    async def call(function, *args, **kwargs):
+        result = function(*args, **kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
 
-                # Data is valid, can put into our local form
-                form[name] = u.validate_item(validator_list, name, item)
+    @functools.wraps(func)
+    async def handle_func(*args, **kwargs):
+        form = get_form()
+        if form.is_form():
+            request_form = process_flat_form(flask.request.form, structure,
+                                             fields)
+            values = _RequestValues(request_form)
+
+            if collect is None and check is not None:
+                check(values, form)
+            elif collect is None:
+                await u.validate_fields_async(validators, values, form)
+            else:
+                errors = u.Errors(first_only=collect == u.FIRST_ERROR)
+                await u.validate_fields_async(validators, values, form,
+                                              errors)
+                if errors:
+                    form.errors.extend(errors)
+                    if handler is not None:
+                        return await call(handler, form.errors)
         else:
-            for name, validator_list in validators.items():
-                for validator in validator_list:
-                    if hasattr(validator, "populate"):
-                        # Populate flask.g.[{name}_validator] with values
-                        populated_name = f"{name}_validator"
-                        values = getattr(flask.g, populated_name, {})
-                        values.update(u.sanitize(validator.name,
-                                                 validator.populate(name)))
-                        setattr(flask.g, populated_name, values)
-                        # Data is now accessible under something akin to:
-                        # flask.g.email_validator["email_domain"]
-        return func(*args, **kwargs)
+            populate()
+        return await call(func, *args, **kwargs)
     return handle_func
 
 
 # Validate incoming Flask requests using a Validator
-def validator(validators):
+def validator(validators, collect=None, handler=None, executor=None,
+              stream=None, limits=None, structure=None, metrics=None,
+              server_timing=False, retry_cache=None):
     """
     Validate incoming Flask requests using a Validator.
 
+    By default, the first invalid field raises a `FormError`. If `collect` is
+    set to `u.FIRST_ERROR` or `u.ALL_ERRORS`, validators do not raise; the
+    first (or every) invalid field is instead recorded as an `e.Invalid` in
+    `form.errors`, and invalid fields are left out of the form. If a
+    `handler` is also passed, it is called with `form.errors` in place of the
+    view when there are errors.
+
+    Fields are validated one after another. For slow validators which
+    release the GIL (such as password hashing or network lookups), fields
+    and the entries of fields validated by a `Dict()` can instead be
+    validated at the same time in a `concurrent.futures.Executor` passed as
+    `executor`, or in a thread pool shared between views if `executor` is
+    True. The resulting form and errors are the same either way.
+
+    For JSON arrays too large to decode at once, `stream` can be set to the
+    name of a field validated by a single `List()`. The body of a JSON
+    request must then be the array of that field, and other fields are read
+    from the query string. `form[stream]` is an iterator, decoding and
+    validating one element of the array at a time as the view consumes it,
+    so that only one element is held in memory; the first invalid element
+    raises a `FormError`, and the rest of the body is not read.
+
+    If `limits` is True, or a `FormLimits`, form data is checked as it is
+    received against limits derived from the validators (see `FormLimits`),
+    and the first field exceeding them raises `e.FormLimitError` without
+    reading the rest of the request. Limits only apply if the form data of
+    the request has not been read before the view. Fields of `validator()`
+    decorators below this one are allowed. With Werkzeug older than
+    2.0, multipart data is only checked once all of it has been parsed.
+
+    The structure built from the keys of the form is limited by
+    `structure`, a `FormStructure`, which is by default derived from the
+    validators; keys exceeding it raise `e.FormStructureError`. Keys of the
+    form which do not start with the name of a validated field are skipped
+    without being parsed. Derived limits only reject forms the validators
+    would reject too; pass a `FormStructure` with no limits,
+    `FormStructure()`, to turn them off.
+
+    Stacked `validator()` decorators with the same options and no handler
+    are merged into a single decorator, so that the form is parsed and
+    validated once per request.
+
+    If `metrics` is set to a `gigaspoon.metrics.Metrics`, validated requests
+    and their errors are recorded, and sampled requests are timed, as are
+    their fields, which are then validated one at a time (not using
+    `executor`).
+
+    If `server_timing` is set, the nanoseconds taken to parse the body of
+    the request (`parse`), to restructure the flat form (`flatten`), to
+    validate fields (`validate`) and to populate `flask.g` (`populate`) are
+    stored in the `flask.g.server_timing` dict, and sent in milliseconds in
+    a `Server-Timing` response header, as `gigaspoon-parse;dur=0.052` and
+    so on. The times of stacked decorators are added together.
+
+    If `retry_cache` is set to a `RetryCache`, the values of valid payloads
+    are cached, and requests retrying an identical payload get the cached
+    values without the form being validated again, except for fields
+    excluded by the cache. It can not be combined with `limits` on the same
+    or an inner decorator, and multipart payloads are not cached.
+
     :usage:
         @app.route("/")
         @sb.flask_validator({
@@ -206,11 +1489,60 @@ def validator(validators):
             pass
     """
     return functools.partial(
-        _validator_prototype, validators=validators)
+        _validator_prototype, validators=validators, collect=collect,
+        handler=handler, executor=executor, stream=stream, limits=limits,
+        structure=structure, metrics=metrics, server_timing=server_timing,
+        retry_cache=retry_cache)
+
+
+# Validate incoming Flask requests using asynchronous Validators
+def async_validator(validators, collect=None, handler=None, structure=None):
+    """
+    Validate incoming Flask requests like `validator()`, in an async view.
+    Validators with a coroutine `validate()` method are awaited, and all
+    fields (as well as the items of List, Dict and Map validators containing
+    asynchronous validators) are validated concurrently. Synchronous
+    validators are run as usual. The decorated view and `handler` may be
+    coroutine functions or plain functions.
+
+    The resulting view is a coroutine function, which Flask runs with its
+    support for async views (the `flask[async]` extra); this also works when
+    the app is served through an ASGI adapter.
+
+    When collecting errors, only the first error of every field is recorded,
+    as fields are validated with `validate()`.
+
+    Form data is limited by `structure` as with `validator()`.
+
+    :usage:
+        class Unused(sb.v.Validator):
+            async def validate(self, key, value):
+                if await db.username_exists(value):
+                    self.raise_error(key, value, message="taken")
+
+        @app.route("/", methods=["GET", "POST"])
+        @sb.async_validator({
+            "username": [sb.v.Length(min=3), Unused()],
+        })
+        @sb.base
+        async def index(form):
+            # Your code here
+            pass
+    """
+    return functools.partial(
+        _async_validator_prototype, validators=validators, collect=collect,
+        handler=handler, structure=structure)
 
 
 # Prototype decorator for validating a form on certain HTTP methods
 def _set_methods_prototype(func, methods):
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def setup_methods_async(*args, **kwargs):
+            get_form(methods)
+            return await func(*args, **kwargs)
+        return setup_methods_async
+
     @functools.wraps(func)
     def setup_methods(*args, **kwargs):
         get_form(methods)
@@ -223,8 +1555,29 @@ def set_methods(*methods):
     return functools.partial(_set_methods_prototype, methods=methods)
 
 
+def metrics_view(registry):
+    """
+    Create a view exporting the metrics of a `gigaspoon.metrics.Registry` in
+    the Prometheus text format.
+
+    :usage:
+        app.add_url_rule("/metrics", "metrics",
+                         sb.flask.metrics_view(metrics.sink))
+    """
+    def export_metrics():
+        return flask.Response(registry.prometheus(),
+                              mimetype="text/plain; version=0.0.4")
+    return export_metrics
+
+
 # Automatically pass a `form` to the decorated function
 def base(func):
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def setup_form_async(*args, **kwargs):
+            return await func(get_form(), *args, **kwargs)
+        return setup_form_async
+
     @functools.wraps(func)
     def setup_form(*args, **kwargs):
         return func(get_form(), *args, **kwargs)
@@ -254,6 +1607,17 @@ class CSRF(v.Validator):
     Create a CSRF token and ensure that the token exists (and matches that
     of the form) when serving and processing forms.
 
+    By default, a random token is stored in the Flask session. If `stateless`
+    is set, nothing is stored; instead, tokens are signed with an HMAC over
+    the secret key of the app, an identity and an expiry time `lifetime`
+    seconds after the token was created, and are checked in constant time.
+    The identity should be different for every client: `identity` can be a
+    function returning it (such as the ID of the logged in user); otherwise,
+    a random identity is stored in the `cookie` cookie. Every rendered form
+    gets a new token, and tokens signed with keys from the app's
+    `SECRET_KEY_FALLBACKS` setting are accepted, so the secret key can be
+    rotated.
+
     Only usable with the Flask engine.
 
     :usage:
@@ -267,26 +1631,102 @@ class CSRF(v.Validator):
     """
 
     name = "csrf"
+    dynamic = True
 
-    def __init__(self):
-        pass
+    def __init__(self, stateless=False, lifetime=3600, identity=None,
+                 cookie="_csrf_id"):
+        self.stateless = stateless
+        self.lifetime = lifetime
+        self._identity = identity
+        self._cookie = cookie
 
     # Generate a CSRF token from random bytes, and store in a session
-    def populate(self, name):
+    def _session_token(self):
         if flask.session.get("_csrf_token") is None:
             token = base64.b64encode(os.urandom(24))
             flask.session["_csrf_token"] = token.decode('utf8')
+        return flask.session["_csrf_token"]
+
+    # Find the identity a token is signed for, creating one if `create`
+    def _get_identity(self, create=False):
+        if self._identity is not None:
+            identity = self._identity()
+            return None if identity is None else str(identity)
+
+        identity = flask.request.cookies.get(self._cookie)
+        if identity is None and create:
+            identity = base64.urlsafe_b64encode(os.urandom(18)).decode()
+            cookie, app = self._cookie, flask.current_app
+
+            @flask.after_this_request
+            def set_identity(response):
+                response.set_cookie(
+                    cookie, identity, httponly=True, samesite="Lax",
+                    secure=app.config.get("SESSION_COOKIE_SECURE", False))
+                return response
+        return identity
+
+    @staticmethod
+    def _sign(secret, identity, expires):
+        if isinstance(secret, str):
+            secret = secret.encode("utf8")
+        message = ("gigaspoon-csrf\0%s\0%d" % (identity, expires))
+        digest = hmac.new(secret, message.encode("utf8"), hashlib.sha256)
+        return base64.urlsafe_b64encode(digest.digest()).decode().rstrip("=")
+
+    # Sign a token for the identity of the client
+    def _signed_token(self):
+        expires = int(time.time()) + self.lifetime
+        signature = self._sign(flask.current_app.secret_key,
+                               self._get_identity(create=True), expires)
+        return "%d.%s" % (expires, signature)
+
+    def populate(self, name):
+        if self.stateless:
+            token = self._signed_token()
+        else:
+            token = self._session_token()
         return {
             "name": name,
-            "token": flask.session["_csrf_token"],
+            "token": token,
             "tag": '<input type="hidden" name="%s" value="%s" />' % (
-                name, flask.session["_csrf_token"])
+                name, token)
         }
 
-    # Verify that the CSRF token passed is the same as in the session
-    def validate(self, key, value):
-        token = flask.session.get("_csrf_token")
-        if token is None:
-            raise InvalidSessionError()
-        elif value != token:
-            self.raise_error(key, value)
+    # Verify that the CSRF token passed is the same as in the session, or
+    # is signed for the identity of the client and has not expired
+    def _check(self, key, value, errors):
+        if not self.stateless:
+            token = flask.session.get("_csrf_token")
+            if token is None:
+                return self.invalid(errors, key, value,
+                                    error_class=InvalidSessionError)
+            elif not isinstance(value, str) or not hmac.compare_digest(
+                    value.encode("utf8"), token.encode("utf8")):
+                return self.invalid(errors, key, value)
+            return
+
+        identity = self._get_identity()
+        if identity is None:
+            return self.invalid(errors, key, value,
+                                error_class=InvalidSessionError)
+
+        try:
+            expires, _, signature = value.partition(".")
+            expires = int(expires)
+        except (AttributeError, ValueError):
+            return self.invalid(errors, key, value, message="malformed token")
+        if expires < time.time():
+            return self.invalid(errors, key, value, message="expired token")
+
+        app = flask.current_app
+        secrets = [app.secret_key]
+        secrets.extend(app.config.get("SECRET_KEY_FALLBACKS") or [])
+        valid = False
+        for secret in secrets:
+            expected = self._sign(secret, identity, expires)
+            # compare every key, to take the same time for any token
+            valid |= hmac.compare_digest(expected.encode("utf8"),
+                                         signature.encode("utf8"))
+        if not valid:
+            return self.invalid(errors, key, value)
@@ -0,0 +1,180 @@
+"""
+This module records metrics of validation: counts of validated requests and
+fields, counts of failures by error type, and histograms of the time taken,
+for `validator(metrics=...)`. Metrics are passed to a `Sink`; the `Registry`
+sink keeps them in memory and exports them in the Prometheus text format.
+"""
+
+import bisect
+import collections
+import random
+import threading
+
+# Upper bounds of histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5)
+
+_HELP = {
+    "gigaspoon_requests_total": ("counter", "Requests validated."),
+    "gigaspoon_request_errors_total": (
+        "counter", "Requests failing validation, by error type."),
+    "gigaspoon_request_seconds": (
+        "histogram", "Time taken to validate sampled requests."),
+    "gigaspoon_fields_total": (
+        "counter", "Fields validated in sampled requests."),
+    "gigaspoon_field_errors_total": (
+        "counter", "Fields failing validation in sampled requests, by error "
+                   "type."),
+    "gigaspoon_field_seconds": (
+        "histogram", "Time taken to validate fields of sampled requests."),
+}
+
+
+class Metrics(object):
+    """
+    Records metrics of the requests validated by `validator()` decorators
+    passed `metrics`, to `sink` (by default, a new `Registry`).
+
+    Every request and its error type (if any) is recorded. Timing requests
+    and validating fields one at a time to time them has a cost, so only a
+    `sample_rate` fraction of requests is timed, and only those record the
+    metrics of their fields.
+
+    :usage:
+        metrics = sb.metrics.Metrics(sample_rate=0.1)
+
+        @app.route("/", methods=["GET", "POST"])
+        @sb.flask.validator({"name": sb.v.Length(max=20)}, metrics=metrics)
+        @sb.flask.base
+        def index(form):
+            pass
+
+        app.add_url_rule("/metrics", "metrics",
+                         sb.flask.metrics_view(metrics.sink))
+    """
+
+    def __init__(self, sink=None, sample_rate=1.0):
+        self.sink = Registry() if sink is None else sink
+        self.sample_rate = sample_rate
+
+    def sampled(self):
+        """
+        Whether the metrics of the current request should be sampled.
+        """
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+
+class Sink(object):
+    """
+    Base class for metric sinks. `route` is the name of the validated view,
+    and `error` is the name of the type of the first error, or None. The
+    time taken, `seconds`, is None for requests which are not sampled.
+    """
+
+    def observe_request(self, route, seconds, error):
+        raise NotImplementedError()
+
+    def observe_field(self, route, field, seconds, error):
+        raise NotImplementedError()
+
+
+class _Histogram(object):
+    __slots__ = ("counts", "sum")
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+
+
+class Registry(Sink):
+    """
+    Sink keeping counters and histograms with the upper bounds `buckets` in
+    memory, which can be exported with `prometheus()`. Safe to use from
+    multiple threads.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters = collections.defaultdict(int)
+        self._histograms = {}
+
+    def _observe(self, name, labels, seconds):
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            histogram = self._histograms[name, labels] = _Histogram(
+                len(self.buckets) + 1)
+        histogram.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        histogram.sum += seconds
+
+    def observe_request(self, route, seconds, error):
+        labels = (("route", route),)
+        with self._lock:
+            self._counters["gigaspoon_requests_total", labels] += 1
+            if error is not None:
+                self._counters["gigaspoon_request_errors_total",
+                               labels + (("error", error),)] += 1
+            if seconds is not None:
+                self._observe("gigaspoon_request_seconds", labels, seconds)
+
+    def observe_field(self, route, field, seconds, error):
+        labels = (("route", route), ("field", field))
+        with self._lock:
+            self._counters["gigaspoon_fields_total", labels] += 1
+            if error is not None:
+                self._counters["gigaspoon_field_errors_total",
+                               labels + (("error", error),)] += 1
+            if seconds is not None:
+                self._observe("gigaspoon_field_seconds", labels, seconds)
+
+    def counter(self, name, **labels):
+        """
+        Current value of a counter, such as
+        `counter("gigaspoon_requests_total", route="index")`.
+        """
+        with self._lock:
+            return self._counters.get((name, tuple(labels.items())), 0)
+
+    def prometheus(self):
+        """
+        Export all metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            samples = collections.defaultdict(list)
+            for (name, labels), value in self._counters.items():
+                samples[name].append((name, labels, value))
+            for (name, labels), histogram in self._histograms.items():
+                total = 0
+                for bound, count in zip(self.buckets + (None,),
+                                        histogram.counts):
+                    total += count
+                    samples[name].append((
+                        name + "_bucket",
+                        labels + (("le", _format_bound(bound)),), total))
+                samples[name].append((name + "_sum", labels, histogram.sum))
+                samples[name].append((name + "_count", labels, total))
+
+        lines = []
+        for name in sorted(samples):
+            kind, description = _HELP[name]
+            lines.append("# HELP %s %s" % (name, description))
+            lines.append("# TYPE %s %s" % (name, kind))
+            for sample, labels, value in samples[name]:
+                lines.append("%s{%s} %s" % (sample, ",".join(
+                    '%s="%s"' % (label, _escape(label_value))
+                    for label, label_value in labels), _format_value(value)))
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def _format_bound(bound):
+    return "+Inf" if bound is None else repr(float(bound))
+
+
+def _format_value(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace(
+        "\n", "\\n")
@@ -0,0 +1,178 @@
+"""
+This module provides option backends for the Select() validator, for option
+sets too large to keep in a Python set in every process.
+"""
+
+import hashlib
+import math
+import mmap
+
+
+class Options(object):
+    """
+    Base class for option backends. A backend must support `in` and `len()`,
+    and return pages of its options in sorted order from `page()`.
+    """
+
+    def __contains__(self, value):
+        raise NotImplementedError()
+
+    def __len__(self):
+        raise NotImplementedError()
+
+    def page(self, offset=0, limit=None):  # pylint: disable=C0111
+        raise NotImplementedError()
+
+
+class SortedLines(Options):
+    """
+    Options stored as sorted, newline-terminated, encoded lines in a buffer,
+    and searched with a binary search over the bytes of the buffer. An
+    optional `BloomFilter` rejects most values that are not options without
+    searching.
+    """
+
+    def __init__(self, data, encoding="utf8", bloom=None):
+        self._data = data
+        self._encoding = encoding
+        self._bloom = bloom
+        self._length = None
+
+    def __contains__(self, value):
+        if not isinstance(value, str) or "\n" in value:
+            return False
+        target = value.encode(self._encoding)
+        if self._bloom is not None and target not in self._bloom:
+            return False
+
+        data = self._data
+        low, high = 0, len(data)
+        while low < high:
+            middle = (low + high) // 2
+            newline = data.rfind(b"\n", low, middle)
+            start = low if newline < 0 else newline + 1
+            end = data.find(b"\n", start)
+            if end < 0:
+                end = len(data)
+            line = data[start:end]
+            if line == target:
+                return True
+            elif line < target:
+                low = end + 1
+            else:
+                high = start
+        return False
+
+    def __iter__(self):
+        data = self._data
+        start = 0
+        while start < len(data):
+            end = data.find(b"\n", start)
+            if end < 0:
+                end = len(data)
+            yield data[start:end].decode(self._encoding)
+            start = end + 1
+
+    def __len__(self):
+        if self._length is None:
+            self._length = sum(1 for _ in self)
+        return self._length
+
+    def page(self, offset=0, limit=None):
+        output = []
+        for index, option in enumerate(self):
+            if index < offset:
+                continue
+            if limit is not None and len(output) >= limit:
+                break
+            output.append(option)
+        return output
+
+
+class CompactOptions(SortedLines):
+    """
+    Options kept in a single sorted bytes buffer, which takes far less memory
+    than a set of strings. If `bloom` is set, a Bloom filter with the given
+    false positive rate is used as a prefilter.
+
+    :usage:
+        Select(CompactOptions(usernames, bloom=0.01))
+    """
+
+    def __init__(self, options, encoding="utf8", bloom=None):
+        lines = sorted({option.encode(encoding) for option in options})
+        if any(b"\n" in line for line in lines):
+            raise ValueError("Options can not contain newlines")
+        data = b"".join(line + b"\n" for line in lines)
+
+        bloom_filter = None
+        if bloom is not None:
+            bloom_filter = BloomFilter(len(lines), bloom)
+            for line in lines:
+                bloom_filter.add(line)
+
+        super(CompactOptions, self).__init__(data, encoding, bloom_filter)
+        self._length = len(lines)
+
+
+class SortedFileOptions(SortedLines):
+    """
+    Options read from a file containing one option per line, sorted by their
+    encoded bytes (for UTF-8, the same as sorting the strings). The file is
+    memory-mapped read-only, so processes using the same file share its
+    pages instead of each holding a copy of the options.
+
+    :usage:
+        # sort skus.txt with `LC_ALL=C sort -u`
+        Select(SortedFileOptions("/srv/data/skus.txt"))
+    """
+
+    def __init__(self, path, encoding="utf8", bloom=None):
+        with open(path, "rb") as file:
+            try:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty files can not be mapped
+                data = b""
+
+        bloom_filter = None
+        if bloom is not None:
+            lines = [line.encode(encoding)
+                     for line in SortedLines(data, encoding)]
+            bloom_filter = BloomFilter(len(lines), bloom)
+            for line in lines:
+                bloom_filter.add(line)
+
+        super(SortedFileOptions, self).__init__(data, encoding, bloom_filter)
+
+
+class BloomFilter(object):
+    """
+    Set membership filter for bytes, without false negatives and with a
+    `false_positive_rate` for a given `capacity`.
+    """
+
+    def __init__(self, capacity, false_positive_rate=0.01):
+        capacity = max(capacity, 1)
+        size = -capacity * math.log(false_positive_rate) / math.log(2) ** 2
+        self._size = max(int(math.ceil(size)), 8)
+        self._hashes = max(int(round(self._size / capacity * math.log(2))),
+                           1)
+        self._bits = bytearray((self._size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for index in range(self._hashes):
+            yield (first + index * second) % self._size
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
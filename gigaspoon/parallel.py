@@ -0,0 +1,130 @@
+"""
+This module provides process pools used by the List() validator to validate
+very large lists on multiple cores.
+"""
+
+import collections
+import concurrent.futures
+import os
+import threading
+
+from . import errors as e
+from . import u
+
+
+# State of a worker process, set once by `_init_worker()`
+_worker_validators = None
+_worker_validate = None
+
+
+def _init_worker(validators):
+    global _worker_validators, _worker_validate
+    from . import compiler
+    _worker_validators = validators
+    _worker_validate = compiler.compile_validator(validators)
+
+
+def _check_chunk(key, offset, items, first_only):
+    # Validate the items of a chunk, returning the transformed items and the
+    # `e.Invalid` records of invalid items; with `first_only`, validation
+    # stops at the first invalid item
+    path = u.Path(key, u.Path.INDEX)
+    if first_only:
+        for index, item in enumerate(items):
+            path.key = offset + index
+            try:
+                items[index] = _worker_validate(path, item)
+            except e.FormError as err:
+                return items, [e.Invalid.from_error(err)]
+        return items, []
+
+    errors = u.Errors()
+    for index, item in enumerate(items):
+        path.key = offset + index
+        output = u.check_item(_worker_validators, path, item, errors)
+        if output is not u.INVALID and output is not None:
+            items[index] = output
+    return items, list(errors)
+
+
+class ProcessPool(object):
+    """
+    Pool of worker processes validating the items of a List() in chunks of
+    `chunksize` items. The validators of the list are sent to every worker
+    once, when the workers are started, and compiled there; only the items
+    and the results are sent for every chunk. Lists of at most `chunksize`
+    items are validated in the current process. At most two chunks per
+    worker are sent ahead of the chunk being merged, so that chunks after an
+    error which ends validation are not validated.
+
+    A pool belongs to a single List(); items and validators must be
+    picklable.
+
+    :usage:
+        List(Dict(sku=Regex("^[A-Z0-9]{8}$"), count=LambdaMap(int)),
+             parallel=ProcessPool(chunksize=5000))
+    """
+
+    def __init__(self, processes=None, chunksize=1000, mp_context=None):
+        self.processes = processes
+        self.chunksize = chunksize
+        self._mp_context = mp_context
+        self._validators = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def bind(self, validators):
+        """
+        Set the validators run by the workers; called by List().
+        """
+        if self._validators is not None:
+            raise ValueError("A ProcessPool can only be used by one List()")
+        self._validators = validators
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.processes, mp_context=self._mp_context,
+                    initializer=_init_worker,
+                    initargs=(self._validators,))
+        return self._executor
+
+    def check(self, key, items, first_only=False):
+        """
+        Validate `items` in chunks, yielding `(offset, items, invalid)` for
+        every chunk, in order, where `invalid` is a list of `e.Invalid`
+        records. Closing the generator cancels the chunks sent ahead.
+        """
+        executor = self._get_executor()
+        window = 2 * (self.processes or os.cpu_count() or 1)
+        offsets = iter(range(0, len(items), self.chunksize))
+        pending = collections.deque()
+
+        def submit():
+            for offset in offsets:
+                pending.append((offset, executor.submit(
+                    _check_chunk, str(key), offset,
+                    items[offset:offset + self.chunksize], first_only)))
+                if len(pending) >= window:
+                    break
+
+        try:
+            submit()
+            while pending:
+                offset, future = pending.popleft()
+                chunk, invalid = future.result()
+                submit()
+                yield offset, chunk, invalid
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def close(self):
+        """
+        Shut the worker processes down; they are started again if needed.
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -0,0 +1,107 @@
+"""
+This module provides incremental decoding of JSON documents, so that very
+large request bodies can be validated without holding them in memory.
+"""
+
+import codecs
+import json
+
+_WHITESPACE = " \t\n\r"
+_NUMBER = "0123456789.eE+-"
+_DECODER = json.JSONDecoder()
+
+
+class _Reader(object):
+    """
+    Buffer of text decoded from a binary stream. Text before `position` has
+    been consumed, and is dropped from the buffer when more text is read.
+    """
+
+    def __init__(self, stream, chunk_size):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def read(self, size=None):
+        # Append the next chunk, returning False at the end of the stream
+        if self.eof:
+            return False
+        data = self._stream.read(size or self._chunk_size)
+        self.eof = not data
+        self.buffer = self.buffer[self.position:] + self._text.decode(
+            data, final=self.eof)
+        self.position = 0
+        return True
+
+    def next_char(self):
+        # Skip whitespace and return the next character, or "" at the end
+        while True:
+            buffer, position = self.buffer, self.position
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            self.position = position
+            if position < len(buffer):
+                return buffer[position]
+            if not self.read():
+                return ""
+
+    def decode_value(self):
+        self.next_char()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError as err:
+                # Values cut off by the end of the buffer fail close to its
+                # end, except for strings; anything else is malformed
+                truncated = (err.pos >= len(self.buffer) - 6 or
+                             err.msg.startswith("Unterminated string"))
+                if not truncated or not self.read(size):
+                    raise
+            else:
+                # A number could continue in the next chunk, including one
+                # cut after a partial fraction or exponent, such as `1.`
+                if self.buffer[end:].lstrip(_NUMBER) or not self.read(size):
+                    self.position = end
+                    return value
+            # Read more at a time for large values, so that a value is not
+            # decoded again for every chunk
+            size *= 2
+
+
+def iter_json_array(stream, chunk_size=65536):
+    """
+    Yield the elements of a JSON array read from the binary file-like object
+    `stream`, one at a time. Only the part of the document which has not
+    been decoded yet is buffered, so the memory used is proportional to the
+    size of a single element. Raises ValueError if the document is not a
+    JSON array or is malformed; elements before the error are still
+    yielded.
+
+    :usage:
+        for row in iter_json_array(flask.request.stream):
+            insert(row)
+    """
+    reader = _Reader(stream, chunk_size)
+    if reader.next_char() != "[":
+        raise ValueError("Expected a JSON array")
+    reader.position += 1
+
+    if reader.next_char() == "]":
+        reader.position += 1
+    else:
+        while True:
+            yield reader.decode_value()
+            char = reader.next_char()
+            reader.position += 1
+            if char == "]":
+                break
+            elif char != ",":
+                raise ValueError("Expected ',' or ']' in JSON array, not %r"
+                                 % char)
+
+    if reader.next_char() != "":
+        raise ValueError("Unexpected data after JSON array")
@@ -1,5 +1,139 @@
+import asyncio
 from collections.abc import Iterable
 
+from . import errors as e
+
+
+class Path(object):
+    """
+    Name of a value nested in a List, Dict or Map, formatted into a string
+    only when it is needed (usually when an error is created). Container
+    validators create one Path per call and update `key` as they iterate, so
+    only built-in validators are passed a Path; other validators are passed
+    the formatted string (see `name_for()`).
+
+    :usage:
+        path = Path("input", Path.INDEX)
+        path.key = 3
+        str(path)  # "input[3]"
+        str(Path(path, Path.ATTRIBUTE, "name"))  # "input[3].name"
+    """
+    __slots__ = ("parent", "format", "key")
+
+    INDEX = "%s[%s]"
+    ATTRIBUTE = "%s.%s"
+
+    def __init__(self, parent, fmt, key=None):
+        self.parent = parent
+        self.format = fmt
+        self.key = key
+
+    def __str__(self):
+        return self.format % (self.parent, self.key)
+
+    def __repr__(self):
+        return "<Path %r>" % str(self)
+
+
+def _builtin(validator):
+    return type(validator).__module__.startswith("gigaspoon.")
+
+
+def name_for(validator, name):
+    """
+    The name to pass to `validator`: built-in validators take a `Path` as
+    is, while validators defined elsewhere get it formatted as a string,
+    which they can keep or manipulate.
+    """
+    if type(name) is Path and not _builtin(validator):
+        return str(name)
+    return name
+
+
+class PathList(object):
+    """
+    Sequence of the names of values in a column, as used by batch validation.
+    Item `i` is `Path(parents[i], fmt, keys[i])`, created only when accessed.
+    """
+    __slots__ = ("parents", "format", "keys")
+
+    def __init__(self, parents, fmt, keys):
+        self.parents = parents
+        self.format = fmt
+        self.keys = keys
+
+    def __getitem__(self, index):
+        return Path(self.parents[index], self.format, self.keys[index])
+
+
+class Subset(object):
+    """
+    Sequence of the items of `sequence` at the given `positions`.
+    """
+    __slots__ = ("sequence", "positions")
+
+    def __init__(self, sequence, positions):
+        self.sequence = sequence
+        self.positions = positions
+
+    def __getitem__(self, index):
+        return self.sequence[self.positions[index]]
+
+    def __len__(self):
+        return len(self.positions)
+
+
+class _Invalid(object):
+    """
+    Returned by `Validator.check()` instead of a value, if the value is
+    invalid.
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        return "INVALID"
+
+
+INVALID = _Invalid()
+
+
+class Errors(list):
+    """
+    A list of `e.Invalid` records collected by `Validator.check()`. If
+    `first_only` is set, validators stop at the first invalid value.
+    """
+
+    def __init__(self, first_only=False):
+        super(Errors, self).__init__()
+        self.first_only = first_only
+
+
+class _RaisingErrors(Errors):
+    # Raises the error of every record instead of collecting it; this is how
+    # `Validator.validate()` is implemented
+    def append(self, invalid):
+        raise invalid.to_error()
+
+
+RAISE = _RaisingErrors(first_only=True)
+
+# Error collection modes
+FIRST_ERROR = "first"
+ALL_ERRORS = "all"
+
+
+class ReadOnlyDict(dict):
+    """
+    A dict which can not be modified, used to share precomputed data between
+    requests.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("%s is read-only" % type(self).__name__)
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
 
 def sanitize(validator_name: str, fields: dict) -> dict:
     return {f"{validator_name}_{k}": v for k, v in fields.items()}
@@ -10,7 +144,8 @@ def validate_item(validator_list, name, item):
     Validate an item across a set of validators. A name should be passed
     through representing the entire search path of the object, to make
     debugging client issues easier. For example, a value of "y" in a dict "x"
-    should have a name value of "x.y".
+    should have a name value of "x.y". The name may also be a `Path`, which is
+    formatted only if an error is raised.
     """
     if not isinstance(validator_list, Iterable):
         validator_list = [validator_list]
@@ -18,8 +153,191 @@ def validate_item(validator_list, name, item):
     # Iterate through all validators
     for validator in validator_list:
         # Check to make sure input is valid
-        opt_value = validator.validate(name, item)
+        opt_value = validator.validate(name_for(validator, name), item)
+        if opt_value is not None:
+            item = opt_value
+
+    return item
+
+
+async def validate_item_async(validator_list, name, item):
+    """
+    Asynchronous variant of `validate_item()`, awaiting validators that are
+    asynchronous (see `Validator.asynchronous`).
+    """
+    if not isinstance(validator_list, Iterable):
+        validator_list = [validator_list]
+
+    for validator in validator_list:
+        if validator.asynchronous:
+            opt_value = await validator.validate_async(
+                name_for(validator, name), item)
+        else:
+            opt_value = validator.validate(name_for(validator, name), item)
+        if opt_value is not None:
+            item = opt_value
+
+    return item
+
+
+async def gather_items(coroutines):
+    """
+    Run validation coroutines concurrently and return their results, in
+    order. Every coroutine is run to completion; if any failed, the error of
+    the first one that failed is raised, so that the same error is raised
+    however the coroutines were scheduled.
+    """
+    results = await asyncio.gather(*coroutines, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+async def validate_fields_async(validators, values, output=None,
+                                errors=None):
+    """
+    Validate a mapping of form keys to a validator (or list of validators),
+    validating all fields concurrently with `validate_item_async()`. Valid
+    values are stored in `output`, which is returned. A missing key raises a
+    `FormKeyError`, and otherwise the error of the first invalid field is
+    raised; if `errors` (a `u.Errors`) is passed, the error of every invalid
+    field (or only the first, with `first_only`) is recorded instead.
+    """
+    if output is None:
+        output = {}
+
+    async def validate_field(name, validator_list):
+        try:
+            item = values[name]
+        except KeyError:
+            raise e.FormKeyError(name)
+        return await validate_item_async(validator_list, name, item)
+
+    results = await asyncio.gather(
+        *(validate_field(name, validator_list)
+          for name, validator_list in validators.items()),
+        return_exceptions=True)
+
+    for name, result in zip(validators, results):
+        if errors is not None and isinstance(result, e.FormError):
+            errors.append(e.Invalid.from_error(result))
+            if errors.first_only:
+                break
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            output[name] = result
+
+    return output
+
+
+def check_item(validator_list, name, item, errors):
+    """
+    Non-raising variant of `validate_item()`; appends `e.Invalid` records to
+    `errors` (a `u.Errors`) and returns `INVALID` if the item is invalid.
+    """
+    if not isinstance(validator_list, Iterable):
+        validator_list = [validator_list]
+
+    for validator in validator_list:
+        opt_value = validator.check(name_for(validator, name), item, errors)
+        if opt_value is INVALID:
+            return opt_value
         if opt_value is not None:
             item = opt_value
 
     return item
+
+
+def check_fields(validators, values, errors, output=None):
+    """
+    Non-raising validation of a mapping of form keys to a validator (or list
+    of validators). Every key is looked up in `values` and checked with
+    `check_item()`; missing keys are recorded as a `FormKeyError`. Valid
+    values are stored in `output`, which is returned.
+    """
+    if output is None:
+        output = {}
+
+    for name, validator_list in validators.items():
+        try:
+            item = values[name]
+        except KeyError:
+            errors.append(e.Invalid(name, None, None,
+                                    error_class=e.FormKeyError))
+            item = INVALID
+        else:
+            item = check_item(validator_list, name, item, errors)
+
+        if item is not INVALID:
+            output[name] = item
+        elif errors.first_only:
+            break
+
+    return output
+
+
+def validate_column(validator_list, keys, values):
+    """
+    Validate a column of values across a set of validators, using the batch
+    implementation (`validate_many`) of every validator. `keys[i]` is the name
+    of `values[i]`. Values that fail a validator are not passed to the
+    following validators.
+
+    Returns a list of the validated values (None for invalid values) and a
+    dict mapping the position of every invalid value to its error.
+    """
+    if not isinstance(validator_list, Iterable):
+        validator_list = [validator_list]
+
+    values = list(values)
+    errors = {}
+    positions = range(len(values))
+
+    for validator in validator_list:
+        if not positions:
+            break
+
+        column_keys, column = keys, values
+        if len(positions) != len(values):
+            column_keys = Subset(keys, positions)
+            column = [values[p] for p in positions]
+        if not _builtin(validator):
+            column_keys = [name_for(validator, column_keys[index])
+                           for index in range(len(column))]
+        outputs, failed = validator.validate_many(column_keys, column)
+
+        for index, output in enumerate(outputs):
+            if output is not None:
+                values[positions[index]] = output
+
+        if failed:
+            for index, error in failed.items():
+                errors[positions[index]] = error
+            positions = [p for index, p in enumerate(positions)
+                         if index not in failed]
+
+    for position in errors:
+        values[position] = None
+
+    return values, errors
+
+
+def validate_many(validator_list, name, items):
+    """
+    Validate a batch of items across a set of validators, with the same
+    results as calling `validate_item()` on every item but paying the setup
+    of every validator once per batch. Item `i` is named "name[i]".
+
+    Returns a list of the validated items (None for invalid items) and a dict
+    mapping the index of every invalid item to its error.
+
+    :usage:
+        records, errors = validate_many(Dict(...), "records", records)
+        for index, error in errors.items():
+            print(index, error)
+    """
+    values = list(items)
+    keys = PathList([name] * len(values), Path.INDEX, range(len(values)))
+    return validate_column(validator_list, keys, values)
@@ -3,12 +3,32 @@ This module provides utility validators to avoid rewriting validators that
 are not usecase specific.
 """
 
+import bisect
+import collections
+import copy
 import datetime
+import functools
+import inspect
+import ipaddress
 import re
 import socket
+import threading
+import time
+import warnings
 from collections.abc import Iterable
 
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+try:
+    import regex
+except ImportError:
+    regex = None
+
 from . import errors as e
+from . import options as o
 from . import u
 
 
@@ -18,17 +38,118 @@ class Validator(object):
     this class or the handler will raise an assertion error. Usage of how
     to extend off this class is demonstrated in the `custom-validator`
     example.
+
+    The output of `populate()` of built-in validators is computed once and
+    shared between requests. Validators overriding `populate()` elsewhere
+    are `dynamic`, and `populate()` is called for every request, unless they
+    set `dynamic` to False to share its output too.
+
+    Validators that need to wait for I/O can implement `validate()` as a
+    coroutine function (`async def validate`); these can only be used with
+    asynchronous validation, such as the `async_validator` decorator.
     """
 
-    def validate(self, key, value):  # pylint: disable=C0111
+    @property
+    def dynamic(self):
+        """
+        Whether `populate()` must be called for every request; by default,
+        whether it is overridden outside of gigaspoon.
+        """
+        owner = next(cls for cls in type(self).__mro__
+                     if "populate" in cls.__dict__)
+        return not owner.__module__.startswith("gigaspoon.")
+
+    @property
+    def asynchronous(self):
+        """
+        Whether `validate()` is a coroutine function, or for containers,
+        whether any contained validator is asynchronous.
+        """
+        return inspect.iscoroutinefunction(self.validate)
+
+    def validate(self, key, value):
+        """
+        Validate a value, raising a `FormError` if it is invalid. Returns the
+        transformed value, or None if the value is not transformed.
+        """
+        return self._check(key, value, u.RAISE)
+
+    def check(self, key, value, errors):
+        """
+        Non-raising variant of `validate()`. If the value is invalid, one or
+        more `e.Invalid` records are appended to `errors` (a `u.Errors`) and
+        `u.INVALID` is returned; otherwise the result is that of `validate()`.
+        """
+        if type(self).validate is Validator.validate:
+            return self._check(key, value, errors)
+
+        # validate() is implemented or overridden by a subclass
+        try:
+            return self.validate(key, value)
+        except e.FormError as err:
+            errors.append(e.Invalid.from_error(err))
+            return u.INVALID
+
+    async def validate_async(self, key, value):
+        """
+        Asynchronous variant of `validate()`, which awaits `validate()` if it
+        is a coroutine function. Containers validate their items
+        concurrently.
+        """
+        if self.asynchronous:
+            return await self.validate(key, value)
+        return self.validate(key, value)
+
+    def _check(self, key, value, errors):  # pylint: disable=C0111
         raise NotImplementedError()
 
     def populate(self, name):  # pylint: disable=C0111
         return {}
 
+    def validate_many(self, keys, values):
+        """
+        Validate a column of values, where `keys[i]` is the name of
+        `values[i]`. Returns a list of outputs (None for values that are not
+        transformed) and a dict mapping the position of every invalid value
+        to its error. Validators can override this with a faster batch
+        implementation; by default, `validate()` is called on every value.
+        """
+        outputs = []
+        errors = {}
+        for index, value in enumerate(values):
+            try:
+                outputs.append(self.validate(keys[index], value))
+            except e.FormError as err:
+                outputs.append(None)
+                errors[index] = err
+        return outputs, errors
+
     def raise_error(self, key, value, **kwargs):  # pylint: disable=C0111
         raise e.ValidationError(key, value, self, **kwargs)
 
+    def _custom_errors(self):
+        # Whether a subclass creates its own errors; batch implementations
+        # creating errors directly then validate values one at a time
+        return type(self).raise_error is not Validator.raise_error
+
+    def invalid(self, errors, key, value, **kwargs):
+        """
+        Report an invalid value from `_check()`; the return value should be
+        returned by `_check()`. Validation errors of subclasses overriding
+        `raise_error()` are created by it, as when validators raised them.
+        """
+        if self._custom_errors() and \
+                kwargs.get("error_class", e.ValidationError) is \
+                e.ValidationError:
+            kwargs.pop("error_class", None)
+            try:
+                self.raise_error(key, value, **kwargs)
+            except e.FormError as err:
+                errors.append(e.Invalid.from_error(err))
+                return u.INVALID
+        errors.append(e.Invalid(key, value, self, **kwargs))
+        return u.INVALID
+
 
 def wrap_validator_list(validator):
     if isinstance(validator, Iterable):
@@ -44,24 +165,104 @@ class List(Validator):
     validator (or list of validators) that will be applied to the values of
     the list. To allow a list containing any amount of content. use the
     Exists() validator.
+
+    If `max_items` is set, lists with more items are invalid, and are
+    rejected before any item is validated.
+
+    To validate very large lists on multiple cores, `parallel` can be a
+    `gigaspoon.parallel.ProcessPool`, which validates chunks of the list in
+    worker processes. Transformed values and errors are the same as when
+    validating in the current process.
     """
     name = "list"
 
-    def __init__(self, validator):
+    def __init__(self, validator, parallel=None, max_items=None):
         self.validator = validator
-
-    def validate(self, key, value):
+        self.parallel = parallel
+        self.max_items = max_items
+        if parallel is not None:
+            parallel.bind(validator)
+
+    @property
+    def dynamic(self):
+        return any(v.dynamic for v in wrap_validator_list(self.validator))
+
+    @property
+    def asynchronous(self):
+        return any(v.asynchronous
+                   for v in wrap_validator_list(self.validator))
+
+    async def validate_async(self, key, value):
+        if not self.asynchronous:
+            return self.validate(key, value)
+        if not isinstance(value, list):
+            self.raise_error(key, value, message="Form field is not a list")
+        if self.max_items is not None and len(value) > self.max_items:
+            self.raise_error(key, value, message=self._too_many(value))
+        value[:] = await u.gather_items(
+            u.validate_item_async(self.validator,
+                                  u.Path(key, u.Path.INDEX, index), item)
+            for index, item in enumerate(value))
+
+    def _check(self, key, value, errors):
         if not isinstance(value, list):
-            self.raise_error(key, value,
-                             message="Form field is not a list")
+            return self.invalid(errors, key, value,
+                                message="Form field is not a list")
+        if self.max_items is not None and len(value) > self.max_items:
+            return self.invalid(errors, key, value,
+                                message=self._too_many(value))
+
+        if self.parallel is not None and \
+                len(value) > self.parallel.chunksize:
+            return self._check_parallel(key, value, errors)
 
         # iterate self and apply validator to every existing field,
         # taking transformational validators into consideration.
+        path = u.Path(key, u.Path.INDEX)
+        result = None
         for index in range(len(value)):
-            output = u.validate_item(self.validator, f"{key}[{index}]",
-                                     value[index])
-            if output is not None:
+            path.key = index
+            output = u.check_item(self.validator, path, value[index], errors)
+            if output is u.INVALID:
+                if errors.first_only:
+                    return output
+                result = output
+            elif output is not None:
                 value[index] = output
+        return result
+
+    def _too_many(self, value):
+        return "too many items (%d > %d)" % (len(value), self.max_items)
+
+    def iter_validate(self, key, items):
+        """
+        Validate the items of an iterable one at a time, yielding validated
+        items as they are validated, such as items decoded from a stream.
+        The first invalid item raises a `FormError`.
+        """
+        path = u.Path(key, u.Path.INDEX)
+        for index, item in enumerate(items):
+            if self.max_items is not None and index >= self.max_items:
+                self.raise_error(key, None, message="too many items (> %d)"
+                                 % self.max_items)
+            path.key = index
+            yield u.validate_item(self.validator, path, item)
+
+    def _check_parallel(self, key, value, errors):
+        # Chunks are merged in order, so errors are recorded by index
+        result = None
+        chunks = self.parallel.check(key, value, errors.first_only)
+        try:
+            for offset, chunk, invalid in chunks:
+                value[offset:offset + len(chunk)] = chunk
+                for record in invalid:
+                    errors.append(record)
+                    result = u.INVALID
+                if result is u.INVALID and errors.first_only:
+                    return result
+        finally:
+            chunks.close()
+        return result
 
     def populate(self, name):
         # return all stored validators
@@ -87,21 +288,101 @@ class Dict(Validator):
     def __init__(self, **fields):
         self.fields = fields
 
-    def validate(self, key, value):
+    @property
+    def dynamic(self):
+        return any(v.dynamic for validators in self.fields.values()
+                   for v in wrap_validator_list(validators))
+
+    @property
+    def asynchronous(self):
+        return any(v.asynchronous for validators in self.fields.values()
+                   for v in wrap_validator_list(validators))
+
+    async def validate_async(self, key, value):
+        if not self.asynchronous:
+            return self.validate(key, value)
+        if not isinstance(value, dict):
+            self.raise_error(key, value, message="Form field is not a dict")
+
+        async def validate_field(dict_key, validators):
+            path = u.Path(key, u.Path.ATTRIBUTE, dict_key)
+            try:
+                dict_value = value[dict_key]
+            except KeyError:
+                raise e.FormKeyError(path)
+            return await u.validate_item_async(validators, path, dict_value)
+
+        outputs = await u.gather_items(
+            validate_field(dict_key, validators)
+            for dict_key, validators in self.fields.items())
+        value.update(zip(self.fields, outputs))
+
+    def _check(self, key, value, errors):
         if not isinstance(value, dict):
-            self.raise_error(key, value,
-                             message="Form field is not a dict")
+            return self.invalid(errors, key, value,
+                                message="Form field is not a dict")
 
         # iterate keys and run validators on each field of dict
+        path = u.Path(key, u.Path.ATTRIBUTE)
+        result = None
         for dict_key, validators in self.fields.items():
+            path.key = dict_key
             try:
                 dict_value = value[dict_key]
             except KeyError:
-                raise e.FormKeyError(f"{key}.{dict_key}")
-            output = u.validate_item(validators, f"{key}.{dict_key}",
-                                     dict_value)
-            if output is not None:
+                output = self.invalid(errors, path, None,
+                                      error_class=e.FormKeyError)
+            else:
+                output = u.check_item(validators, path, dict_value, errors)
+            if output is u.INVALID:
+                if errors.first_only:
+                    return output
+                result = output
+            elif output is not None:
                 value[dict_key] = output
+        return result
+
+    def validate_many(self, keys, values):
+        if self._custom_errors():
+            return super(Dict, self).validate_many(keys, values)
+        # validate column by column, skipping records once they fail
+        errors = {}
+        alive = []
+        for index, value in enumerate(values):
+            if isinstance(value, dict):
+                alive.append(index)
+            else:
+                errors[index] = e.ValidationError(
+                    keys[index], value, self,
+                    message="Form field is not a dict")
+
+        for dict_key, validators in self.fields.items():
+            column = []
+            present = []
+            for index in alive:
+                try:
+                    column.append(values[index][dict_key])
+                except KeyError:
+                    errors[index] = e.FormKeyError(
+                        u.Path(keys[index], u.Path.ATTRIBUTE, dict_key))
+                else:
+                    present.append(index)
+
+            column_keys = u.PathList(u.Subset(keys, present),
+                                     u.Path.ATTRIBUTE,
+                                     [dict_key] * len(present))
+            outputs, failed = u.validate_column(validators, column_keys,
+                                                column)
+
+            alive = []
+            for position, index in enumerate(present):
+                if position in failed:
+                    errors[index] = failed[position]
+                else:
+                    values[index][dict_key] = outputs[position]
+                    alive.append(index)
+
+        return [None] * len(values), errors
 
     def populate(self, name):
         output = {}
@@ -125,19 +406,46 @@ class Map(Validator):
     def __init__(self, validator):
         self.validator = validator
 
-    def validate(self, key, value):
+    @property
+    def dynamic(self):
+        return any(v.dynamic for v in wrap_validator_list(self.validator))
+
+    @property
+    def asynchronous(self):
+        return any(v.asynchronous
+                   for v in wrap_validator_list(self.validator))
+
+    async def validate_async(self, key, value):
+        if not self.asynchronous:
+            return self.validate(key, value)
+        if not isinstance(value, dict):
+            self.raise_error(key, value, message="Form field is not a dict")
+        outputs = await u.gather_items(
+            u.validate_item_async(self.validator,
+                                  u.Path(key, u.Path.INDEX, map_key), item)
+            for map_key, item in value.items())
+        value.update(zip(list(value), outputs))
+
+    def _check(self, key, value, errors):
         if not isinstance(value, dict):
-            self.raise_error(key, value,
-                             message="Form field is not a dict")
+            return self.invalid(errors, key, value,
+                                message="Form field is not a dict")
 
+        # use the [] based method because this is a mapping and not an
+        # attribute type system
+        path = u.Path(key, u.Path.INDEX)
+        result = None
         for map_key, map_value in value.items():
-            # use the [] based method because this is a mapping and not an
-            # attribute type system
-            output = u.validate_item(self.validator, f"{key}[{map_key}]",
-                                     map_value)
-
-            if output is not None:
+            path.key = map_key
+            output = u.check_item(self.validator, path, map_value, errors)
+
+            if output is u.INVALID:
+                if errors.first_only:
+                    return output
+                result = output
+            elif output is not None:
                 value[map_key] = output
+        return result
 
     def populate(self, name):
         return {
@@ -163,11 +471,11 @@ class LambdaMap(Validator):
     def __init__(self, _lambda):
         self._lambda = _lambda
 
-    def validate(self, key, value):
+    def _check(self, key, value, errors):
         try:
             return self._lambda(value)
         except Exception as e:
-            self.raise_error(key, value, exception=e)
+            return self.invalid(errors, key, value, exception=e)
 
 
 class LambdaFilter(Validator):
@@ -192,7 +500,7 @@ class LambdaFilter(Validator):
         self._lambda = _lambda
         self._matches = matches
 
-    def validate(self, key, value):
+    def _check(self, key, value, errors):
         if self._matches is self.NONE and self._lambda(value) is None:
             return
         if self._matches is self.NOTNONE and self._lambda(value) is not None:
@@ -203,8 +511,132 @@ class LambdaFilter(Validator):
             return
         elif self._lambda(value) == self._matches:
             return
-        self.raise_error(key, value,
-                         message="failed to match %r" % self._matches)
+        return self.invalid(errors, key, value,
+                            message="failed to match %r" % self._matches)
+
+
+CacheInfo = collections.namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+
+class Cached(Validator):
+    """
+    Memoizes the outcome of a validator (or list of validators) for every
+    input value: either the transformed value, or the errors of an invalid
+    value, which are reported again under the key of the new value. Up to
+    `maxsize` values are kept (or any amount, if None), evicting the least
+    recently used value, and values expire after `ttl` seconds if set.
+    Values which can not be hashed, such as lists, are validated without
+    caching.
+
+    Only cache validators whose outcome depends on nothing but the value.
+    Transformed values are shared between every use of the value, so they
+    should not be modified.
+
+    :usage:
+    @app.route("/")
+    @sb.validator({
+        "addr": sb.v.Cached(sb.v.IPAddress(networks=networks), maxsize=4096),
+    })
+    """
+    name = "cached"
+
+    def __init__(self, validator, maxsize=1024, ttl=None):
+        if any(v.asynchronous for v in wrap_validator_list(validator)):
+            raise ValueError("Cached() can not wrap asynchronous validators")
+        self.validator = validator
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._misses = 0
+
+    @property
+    def dynamic(self):
+        return any(v.dynamic for v in wrap_validator_list(self.validator))
+
+    def _check(self, key, value, errors):
+        cache_key = (type(value), value)
+        with self._lock:
+            try:
+                entry = self._cache.get(cache_key)
+            except TypeError:  # not hashable
+                entry = cache_key = None
+            else:
+                if entry is not None and entry[0] is not None and \
+                        entry[0] <= time.monotonic():
+                    entry = None
+                if entry is None:
+                    self._misses += 1
+                else:
+                    self._hits += 1
+                    self._cache.move_to_end(cache_key)
+
+        if cache_key is None:
+            return u.check_item(self.validator, key, value, errors)
+        if entry is None:
+            entry = self._validate(key, value)
+            with self._lock:
+                self._cache[cache_key] = entry
+                self._cache.move_to_end(cache_key)
+                while self.maxsize is not None and \
+                        len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+
+        _, output, records = entry
+        if records is None:
+            return output
+        prefix = str(key)
+        for relative, record_key, error in (
+                records[:1] if errors.first_only else records):
+            # Report a copy of the original error under the new key
+            error = copy.copy(error)
+            if hasattr(error, "key"):
+                error.key = prefix + record_key if relative else record_key
+            errors.append(e.Invalid.from_error(error))
+        return u.INVALID
+
+    def _validate(self, key, value):
+        # Validate a value, returning an entry of the cache:
+        # `(expires, output, records)`, where `records` are the errors (if
+        # any) with their keys, relative to `key` where possible
+        invalid = u.Errors()
+        output = u.check_item(self.validator, key, value, invalid)
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        if output is not u.INVALID:
+            return expires, output, None
+
+        prefix = str(key)
+        records = []
+        for record in invalid:
+            relative = isinstance(record.key, str) and \
+                record.key.startswith(prefix)
+            records.append((
+                relative,
+                record.key[len(prefix):] if relative else record.key,
+                record.to_error()))
+        return expires, u.INVALID, tuple(records)
+
+    def cache_info(self):
+        """
+        Statistics of the cache, like `functools.lru_cache`.
+        """
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self.maxsize,
+                             len(self._cache))
+
+    def cache_clear(self):
+        """
+        Remove every value and reset the statistics of the cache.
+        """
+        with self._lock:
+            self._cache.clear()
+            self._hits = self._misses = 0
+
+    def populate(self, name):
+        output = {}
+        for validator in wrap_validator_list(self.validator):
+            output.update(validator.populate(name))
+        return output
 
 
 # Content validators
@@ -233,15 +665,113 @@ class Bool(Validator):
     """
     name = "bool"
 
-    def validate(self, key, value):
+    def _check(self, key, value, errors):
         value = value.lower()
         if value in ["yes", "true", "on"]:
             return True
         elif value in ["no", "false", "off"]:
             return False
         else:
-            self.raise_error(key, value,
-                             message="Value does not appear to be a bool")
+            return self.invalid(errors, key, value,
+                                message="Value does not appear to be a bool")
+
+
+# Regular expressions of numeric strptime() directives, as used by _strptime
+_STRPTIME_DIRECTIVES = {
+    "d": r"(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])",
+    "f": r"(?P<f>[0-9]{1,6})",
+    "H": r"(?P<H>2[0-3]|[0-1]\d|\d)",
+    "m": r"(?P<m>1[0-2]|0[1-9]|[1-9])",
+    "M": r"(?P<M>[0-5]\d|\d)",
+    "S": r"(?P<S>6[0-1]|[0-5]\d|\d)",
+    "y": r"(?P<y>\d\d)",
+    "Y": r"(?P<Y>\d\d\d\d)",
+}
+_STRPTIME_REGEX_CHARS = re.compile(r"([\\.^$*+?\(\){}\[\]|])")
+_STRPTIME_WHITESPACE = re.compile(r"\s+")
+
+
+class _Strptime(object):
+    """
+    Parser for a fixed datetime.datetime.strptime() format. Formats using
+    only numeric directives are compiled to a regular expression once and
+    parsed without strptime(), with the same results; other formats fall
+    back to strptime().
+    """
+
+    def __init__(self, fmt):
+        self.format = fmt
+        self._directives = []
+        self._match = None
+
+        pattern = self._compile(fmt)
+        if pattern is not None:
+            self._match = re.compile(pattern, re.IGNORECASE).match
+
+    def _compile(self, fmt):
+        pattern = []
+        literal = []
+        index = 0
+        while index < len(fmt):
+            char = fmt[index]
+            index += 1
+            if char != "%":
+                literal.append(char)
+                continue
+            if index == len(fmt):
+                return None
+            directive = fmt[index]
+            index += 1
+            if directive == "%":
+                literal.append(directive)
+                continue
+            if directive not in _STRPTIME_DIRECTIVES or \
+                    directive in self._directives:
+                return None
+            pattern.append(self._literal("".join(literal)))
+            pattern.append(_STRPTIME_DIRECTIVES[directive])
+            self._directives.append(directive)
+            literal = []
+        pattern.append(self._literal("".join(literal)))
+        return "".join(pattern)
+
+    @staticmethod
+    def _literal(text):
+        text = _STRPTIME_REGEX_CHARS.sub(r"\\\1", text)
+        return _STRPTIME_WHITESPACE.sub(r"\\s+", text)
+
+    def parse(self, value):
+        if self._match is None:
+            return datetime.datetime.strptime(value, self.format)
+
+        found = self._match(value)
+        if found is None or found.end() != len(value):
+            raise ValueError("time data %r does not match format %r" % (
+                value, self.format))
+
+        year, month, day, hour, minute, second, fraction = \
+            1900, 1, 1, 0, 0, 0, 0
+        for directive, text in zip(self._directives, found.groups()):
+            if directive == "Y":
+                year = int(text)
+            elif directive == "m":
+                month = int(text)
+            elif directive == "d":
+                day = int(text)
+            elif directive == "H":
+                hour = int(text)
+            elif directive == "M":
+                minute = int(text)
+            elif directive == "S":
+                second = int(text)
+            elif directive == "y":
+                year = int(text)
+                # same pivot as strptime(), following POSIX
+                year += 2000 if year <= 68 else 1900
+            elif directive == "f":
+                fraction = int(text + "0" * (6 - len(text)))
+        return datetime.datetime(year, month, day, hour, minute, second,
+                                 fraction)
 
 
 class Date(Validator):
@@ -266,22 +796,26 @@ class Date(Validator):
             self.use_isoformat = True
         else:
             raise ValueError("Neither a format nor use_isoformat was used.")
+        self._parser = _Strptime(fmt) if fmt else None
 
-    def validate(self, key, value):
+    def _check(self, key, value, errors):
         if self.use_isoformat:
             try:
                 # try strptime to transform to date object
                 return datetime.date.fromisoformat(value)
             except ValueError:
-                self.raise_error(
-                    key, value,
+                return self.invalid(
+                    errors, key, value,
                     message="invalid value for ISO date format")
         elif self.format is not None:
+            parser = self._parser
+            if parser is None or parser.format != self.format:
+                parser = self._parser = _Strptime(self.format)
             try:
-                return datetime.datetime.strptime(value, self.format).date()
+                return parser.parse(value).date()
             except ValueError:
-                self.raise_error(
-                    key, value,
+                return self.invalid(
+                    errors, key, value,
                     message="invalid value for format %r" % self.format)
         else:
             raise ValueError("Neither a format nor use_isoformat exist.")
@@ -291,6 +825,59 @@ class Date(Validator):
                 "use_isoformat": self.use_isoformat}
 
 
+@functools.lru_cache(maxsize=4096)
+def _normalize_domain(domain):
+    # Case-fold and IDNA encode a domain, so that equivalent spellings of a
+    # domain compare equal; returns None for domains that can not be encoded
+    domain = domain.casefold()
+    if domain.endswith("."):
+        domain = domain[:-1]
+    if not domain.isascii():
+        try:
+            domain = domain.encode("idna").decode("ascii")
+        except UnicodeError:
+            return None
+    return domain
+
+
+class _DomainTrie(object):
+    """
+    Set of domains stored as a trie of their labels, starting from the top
+    level domain, so that a lookup takes one step per label of the domain
+    regardless of how many domains are stored. Domains starting with `*.`
+    match all of their subdomains, but not the domain itself.
+    """
+    _END = None
+    _WILDCARD = "*"
+
+    def __init__(self, domains):
+        self._root = {}
+        for domain in domains:
+            wildcard = domain.startswith("*.")
+            if wildcard:
+                domain = domain[2:]
+            normalized = _normalize_domain(domain)
+            if not normalized or "" in normalized.split("."):
+                raise ValueError("invalid domain: %r" % domain)
+            node = self._root
+            for label in reversed(normalized.split(".")):
+                node = node.setdefault(label, {})
+            node[self._WILDCARD if wildcard else self._END] = True
+
+    def __contains__(self, domain):
+        normalized = _normalize_domain(domain)
+        if not normalized:
+            return False
+        node = self._root
+        for label in reversed(normalized.split(".")):
+            if self._WILDCARD in node:
+                return True
+            node = node.get(label)
+            if node is None:
+                return False
+        return self._END in node
+
+
 class Email(Validator):
     """
     Checks whether an input matches a potential email. Other methods
@@ -298,10 +885,16 @@ class Email(Validator):
     argument can be passed to the constructor, which will check
     whether the email is in the domain.
 
+    To accept multiple domains, `domains` can instead be passed as a list of
+    domains; a domain starting with `*.` also accepts all of its subdomains.
+    Domains are compared case-insensitively after IDNA encoding, so that
+    "bücher.example" and "XN--BCHER-KVA.example" are the same domain.
+
     :usage:
     @app.route("/")
     @sb.validator({
         "email": sb.v.Email(domain="hashbang.sh"),
+        "work_email": sb.v.Email(domains=["example.com", "*.example.org"]),
     })
     @sb.base
     def index(form):
@@ -313,21 +906,27 @@ class Email(Validator):
     name = "email"
 
     # Store the domain if one is passed
-    def __init__(self, domain=None):
+    def __init__(self, domain=None, domains=None):
+        if domain is not None and domains is not None:
+            raise ValueError("Only one of domain and domains can be used.")
         self._domain = domain
+        self._domains = None if domains is None else _DomainTrie(domains)
 
     def populate(self, name):
         return {"domain": self._domain}
 
     # Check if input data is a semi-valid email matching the domain
-    def validate(self, key, value):
+    def _check(self, key, value, errors):
         first, _, last = value.rpartition("@")
         if "@" in first or not first or not last:
-            self.raise_error(key, value, message="invalid email")
+            return self.invalid(errors, key, value, message="invalid email")
         elif self._domain is not None and last != self._domain:
-            self.raise_error(
-                key, value,
+            return self.invalid(
+                errors, key, value,
                 message="invalid domain (%r)" % self._domain)
+        elif self._domains is not None and last not in self._domains:
+            return self.invalid(errors, key, value,
+                                message="invalid domain (%r)" % last)
 
 
 class Exists(Validator):
@@ -355,10 +954,54 @@ class Exists(Validator):
         pass
 
     # Check if the value exists
-    def validate(self, key, value):
+    def _check(self, key, value, errors):
         pass
 
 
+# Prefix of IPv4-mapped IPv6 addresses
+_IPV4_MAPPED = b"\x00" * 10 + b"\xff\xff"
+
+
+class _NetworkIndex(object):
+    """
+    Sorted, merged address ranges of a list of IPv4 and IPv6 networks, which
+    can be searched for packed addresses (as returned by `inet_pton`). An
+    IPv4-mapped IPv6 address (`::ffff:a.b.c.d`) is also in the IPv4 networks
+    containing the address it maps.
+    """
+
+    def __init__(self, networks):
+        ranges = {4: [], 16: []}
+        for network in networks:
+            network = ipaddress.ip_network(network, strict=False)
+            ranges[network.max_prefixlen // 8].append(
+                (int(network.network_address),
+                 int(network.broadcast_address)))
+
+        self._starts = {}
+        self._ends = {}
+        for size, family_ranges in ranges.items():
+            starts, ends = [], []
+            for start, end in sorted(family_ranges):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self._starts[size] = starts
+            self._ends[size] = ends
+
+    def __contains__(self, packed):
+        if self._search(packed):
+            return True
+        return packed[:12] == _IPV4_MAPPED and self._search(packed[12:])
+
+    def _search(self, packed):
+        address = int.from_bytes(packed, "big")
+        index = bisect.bisect_right(self._starts[len(packed)], address) - 1
+        return index >= 0 and address <= self._ends[len(packed)][index]
+
+
 class IPAddress(Validator):
     """
     Checks whether an input matches a (default) IPv4 or IPv6 address;
@@ -369,6 +1012,12 @@ class IPAddress(Validator):
     Depending on which system you use, IPv4 may or may not be allowed to use
     leading zeroes. Take this into consideration when writing tests.
 
+    An optional `networks` argument takes a list of networks in CIDR
+    notation; addresses must be in one of the networks, or, if `deny` is
+    set, must not be in any of them. The networks are merged into a sorted
+    index of address ranges, so a lookup is a binary search no matter how
+    many networks there are.
+
     :usage:
     @app.route("/")
     @sb.validator({
@@ -384,31 +1033,51 @@ class IPAddress(Validator):
     """
     name = "ipaddress"
 
-    def __init__(self, address_type=["ipv4"]):  # pylint: disable=W0102
+    def __init__(self, address_type=["ipv4"],  # pylint: disable=W0102
+                 networks=None, deny=False):
         self._type = address_type
+        self._deny = deny
+        self._networks = None
+        if networks is not None:
+            self._networks = _NetworkIndex(networks)
+
+    def _check(self, key, value, errors):
+        # Only IPv6 addresses contain colons, so at most one parse is needed
+        if ":" in value:
+            family, address_type = socket.AF_INET6, "ipv6"
+        else:
+            family, address_type = socket.AF_INET, "ipv4"
 
-    def validate(self, key, value):
-        dirty = True
+        packed = None
+        if address_type in self._type:
+            try:
+                packed = socket.inet_pton(family, value)
+            except socket.error:
+                pass
+        if packed is None:
+            return self.invalid(errors, key, value,
+                                exception=self._address_error(value))
+
+        if self._networks is not None and \
+                (packed in self._networks) is self._deny:
+            return self.invalid(
+                errors, key, value,
+                message="address is %s" % (
+                    "denied" if self._deny else "not in allowed networks"))
+
+    def _address_error(self, value):
         error = None
         if "ipv4" in self._type:
             try:
                 socket.inet_pton(socket.AF_INET, value)
             except socket.error as err:
                 error = err
-            else:
-                dirty = False
         if "ipv6" in self._type:
             try:
                 socket.inet_pton(socket.AF_INET6, value)
             except socket.error as err:
-                # Will still be "dirty" if IPv4 didn't match, meaning this is
-                # also a valid error
-                if dirty:
-                    error = err
-            else:
-                dirty = False
-        if dirty:
-            self.raise_error(key, value, exception=error)
+                error = err
+        return error
 
     def populate(self, name):
         return {"type": self._type}
@@ -441,22 +1110,99 @@ class Length(Validator):
     def populate(self, name):
         return {"min": self._min, "max": self._max}
 
+    # Compare precomputed lengths of a column of values
+    def validate_many(self, keys, values):
+        if self._custom_errors():
+            return super(Length, self).validate_many(keys, values)
+        msg = "value too %s (%s %s %s)"
+        errors = {}
+        if self._min is None and self._max is None:
+            return [None] * len(values), errors
+        for index, length in enumerate(list(map(len, values))):
+            if self._min is not None and length < self._min:
+                errors[index] = e.ValidationError(
+                    keys[index], values[index], self,
+                    message=msg % ("short", length, "<", self._min))
+            elif self._max is not None and length > self._max:
+                errors[index] = e.ValidationError(
+                    keys[index], values[index], self,
+                    message=msg % ("long", length, ">", self._max))
+        return [None] * len(values), errors
+
     # Check if input data is a semi-valid email matching the domain
-    def validate(self, key, value):
+    def _check(self, key, value, errors):
         length = len(value)
         msg = "value too %s (%s %s %s)"
         if self._min is not None:
             if length < self._min:
-                self.raise_error(
-                    key, value,
+                return self.invalid(
+                    errors, key, value,
                     message=msg % ("short", length, "<", self._min))
         if self._max is not None:
             if length > self._max:
-                self.raise_error(
-                    key, value,
+                return self.invalid(
+                    errors, key, value,
                     message=msg % ("long", length, ">", self._max))
 
 
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+
+
+def _walk_pattern(parsed):
+    # Yield every (op, argument) node of a parsed pattern, depth first. The
+    # contents of atomic groups and possessive repeats are not yielded, as
+    # they can not be backtracked into.
+    for op, av in parsed:
+        yield op, av
+        if op in _REPEATS:
+            children = [av[2]]
+        elif op is sre_parse.SUBPATTERN:
+            children = [av[-1]]
+        elif op is sre_parse.BRANCH:
+            children = av[1]
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            children = [av[1]]
+        elif op is sre_parse.GROUPREF_EXISTS:
+            children = [child for child in av[1:] if child]
+        else:
+            children = []
+        for child in children:
+            yield from _walk_pattern(child)
+
+
+def _nested_quantifier(parsed, outer=None):
+    # Find a repeat nested in another repeat where either is unbounded; a
+    # failing match then backtracks through every way of splitting the input
+    # between the two. The time taken is "exponential" in the size of the
+    # input if the outer repeat is unbounded, such as `(a+)+`, and otherwise
+    # "polynomial", of a degree up to the bound, such as `(?:a+){2}`
+    found = None
+    for op, av in _walk_pattern(parsed):
+        if op not in _REPEATS:
+            continue
+        _, high, child = av
+        if high <= 1:
+            continue
+        if outer is not None and sre_parse.MAXREPEAT in (outer, high):
+            if outer == sre_parse.MAXREPEAT:
+                return "exponential"
+            found = "polynomial"
+        found = _nested_quantifier(child, high) or found
+        if found == "exponential":
+            return found
+    return found
+
+
+def _regex_flags(flags):
+    # The flags of the `re` module have other values in the `regex` module
+    translated = 0
+    for name in ["ASCII", "IGNORECASE", "LOCALE", "MULTILINE", "DOTALL",
+                 "UNICODE", "VERBOSE"]:
+        if flags & getattr(re, name):
+            translated |= getattr(regex, name)
+    return translated
+
+
 class Regex(Validator):
     """
     Validate input data based on a raw, uncompiled regex pattern. To match
@@ -467,6 +1213,17 @@ class Regex(Validator):
     the framework displaying your views (most likely HTML) can properly use
     the regex.
 
+    Patterns with nested quantifiers, such as `(a+)+$`, can take exponential
+    (or with a bounded outer quantifier, such as `(?:a+){2}$`, polynomial)
+    time to reject some inputs and emit an `e.UnsafePatternWarning`. The time
+    spent per value can be bounded by rejecting values longer than
+    `max_length` before matching, or by setting `timeout` to a number of
+    seconds after which matching is aborted and the value is rejected; the
+    latter requires the `regex` module.
+
+    When multiple Regex validators are applied to the same value, compiled
+    schemas (see `gigaspoon.compiler`) match them all in a single scan.
+
     :usage:
         @app.route("/")
         @sb.validator({
@@ -482,22 +1239,78 @@ class Regex(Validator):
     name = "regex"
 
     # Compiles and stores a pattern
-    def __init__(self, pattern):
+    def __init__(self, pattern, timeout=None, max_length=None):
         self.pattern = re.compile(pattern)
+        self.timeout = timeout
+        self.max_length = max_length
+
+        parsed = sre_parse.parse(self.pattern.pattern, self.pattern.flags)
+        complexity = _nested_quantifier(parsed)
+        if complexity is not None:
+            warnings.warn("Regex pattern %r contains nested quantifiers and "
+                          "may take %s time to reject some inputs" %
+                          (self.pattern.pattern, complexity),
+                          e.UnsafePatternWarning, stacklevel=2)
+
+        if timeout is None:
+            self._match = self.pattern.match
+        elif regex is None:
+            raise ImportError("Regex(timeout=...) requires the regex module")
+        else:
+            compiled = regex.compile(self.pattern.pattern,
+                                     _regex_flags(self.pattern.flags))
+            self._match = functools.partial(compiled.match, timeout=timeout)
+
+        # Patterns can be fused if group numbers and flags are unaffected by
+        # the surrounding pattern
+        self._fusable = (
+            timeout is None and max_length is None and
+            isinstance(self.pattern.pattern, str) and
+            self.pattern.flags == re.UNICODE and
+            not self.pattern.groupindex and
+            not any(str(op).startswith("GROUPREF")
+                    for op, _ in _walk_pattern(parsed)))
 
     def populate(self, name):
         return {"pattern": self.pattern.pattern}
 
     # Check if input data matches the pattern; otherwise, raise errors
-    def validate(self, key, value):
-        if not self.pattern.match(value):
-            self.raise_error(key, value, message=self.pattern)
+    def _check(self, key, value, errors):
+        if self.max_length is not None and len(value) > self.max_length:
+            return self.invalid(errors, key, value,
+                                message="value too long (%s > %s)" % (
+                                    len(value), self.max_length))
+        try:
+            match = self._match(value)
+        except TimeoutError as exc:
+            return self.invalid(errors, key, value, message=self.pattern,
+                                exception=exc)
+        if not match:
+            return self.invalid(errors, key, value, message=self.pattern)
+
+    # Match the pattern over a column of values
+    def validate_many(self, keys, values):
+        if self.timeout is not None or self.max_length is not None or \
+                self._custom_errors():
+            return super(Regex, self).validate_many(keys, values)
+        errors = {}
+        for index, match in enumerate(list(map(self.pattern.match, values))):
+            if not match:
+                errors[index] = e.ValidationError(
+                    keys[index], values[index], self, message=self.pattern)
+        return [None] * len(values), errors
 
 
 class Select(Validator):
     """
     Validate that a given input is a selection of a list of input options.
 
+    For very large option sets, `options` can instead be an option backend
+    from `gigaspoon.options`, such as a memory-mapped sorted file. To keep
+    the populated data small, `limit` bounds the amount of sorted options
+    that are populated; the total amount of options is then populated as
+    `total`.
+
     :usage:
     @app.route("/")
     @sb.validator({
@@ -506,17 +1319,45 @@ class Select(Validator):
     """
     name = "select"
 
-    def __init__(self, options):
-        self._options = set(options)
+    def __init__(self, options, limit=None):
+        if isinstance(options, o.Options):
+            self._options = options
+        else:
+            self._options = set(options)
+        self._limit = limit
+        self._sorted_options = None
 
     def populate(self, name):
-        return {
-            "options": sorted(self._options)
-        }
+        if self._sorted_options is None:
+            if isinstance(self._options, set):
+                self._sorted_options = sorted(self._options)[:self._limit]
+            else:
+                self._sorted_options = self._options.page(0, self._limit)
+        output = {"options": self._sorted_options}
+        if self._limit is not None:
+            output["total"] = len(self._options)
+        return output
 
-    def validate(self, key, value):
+    def _check(self, key, value, errors):
         if value not in self._options:
-            self.raise_error(key, value)
+            return self.invalid(errors, key, value)
+
+    # Find invalid values of a column with a set difference
+    def validate_many(self, keys, values):
+        if not isinstance(self._options, set) or self._custom_errors():
+            return super(Select, self).validate_many(keys, values)
+        try:
+            invalid = set(values) - self._options
+        except TypeError:  # unhashable values
+            return super(Select, self).validate_many(keys, values)
+
+        errors = {}
+        if invalid:
+            for index, value in enumerate(values):
+                if value in invalid:
+                    errors[index] = e.ValidationError(keys[index], value,
+                                                      self)
+        return [None] * len(values), errors
 
 
 class Time(Validator):
@@ -544,22 +1385,26 @@ class Time(Validator):
             self.use_isoformat = True
         else:
             raise ValueError("Neither a format nor use_isoformat was used.")
+        self._parser = _Strptime(fmt) if fmt else None
 
-    def validate(self, key, value):
+    def _check(self, key, value, errors):
         if self.use_isoformat:
             try:
                 # try strptime to transform to date object
                 return datetime.time.fromisoformat(value)
             except ValueError:
-                self.raise_error(
-                    key, value,
+                return self.invalid(
+                    errors, key, value,
                     message="invalid value for ISO time format")
         elif self.format is not None:
+            parser = self._parser
+            if parser is None or parser.format != self.format:
+                parser = self._parser = _Strptime(self.format)
             try:
-                return datetime.datetime.strptime(value, self.format).time()
+                return parser.parse(value).time()
             except ValueError:
-                self.raise_error(
-                    key, value,
+                return self.invalid(
+                    errors, key, value,
                     message="invalid value for format %r" % self.format)
         else:
             raise ValueError("Neither a format nor use_isoformat exist.")
@@ -8,5 +8,7 @@ setup(
     extras_require={
         "dev": ["pytest", "pytest-cov"],
         "flask": ["flask"],
+        "async": ["flask[async]"],
+        "regex": ["regex"],
         "sqlalchemy": ["sqlalchemy"],
     })
@@ -0,0 +1,119 @@
+# pylint: disable-all
+import asyncio
+import copy
+
+import flask
+import pytest
+
+import gigaspoon as gs
+
+pytest.importorskip("asgiref")
+
+
+class Unused(gs.v.Validator):
+    name = "unused"
+
+    def __init__(self, taken, delay=0.05):
+        self.taken = taken
+        self.delay = delay
+        self.running = 0
+        self.most_running = 0
+
+    async def validate(self, key, value):
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+        if value in self.taken:
+            self.raise_error(key, value, message="taken")
+        return value.lower()
+
+
+def test_validate_fields_async():
+    unused = Unused(["bob"])
+    schema = {
+        "name": [gs.v.Length(min=2), unused],
+        "rows": gs.v.List(gs.v.Dict(name=unused, flag=gs.v.Bool())),
+        "tags": gs.v.Map([unused]),
+        "count": gs.v.LambdaMap(int),
+    }
+    assert not gs.v.Bool().asynchronous
+    assert schema["rows"].asynchronous and schema["tags"].asynchronous
+
+    values = {
+        "name": "Alice",
+        "rows": [{"name": "Carol", "flag": "yes"},
+                 {"name": "Dave", "flag": "no"}],
+        "tags": {"x": "Eve", "y": "Frank"},
+        "count": "3",
+    }
+    output = asyncio.run(gs.u.validate_fields_async(schema,
+                                                    copy.deepcopy(values)))
+    assert output == {
+        "name": "alice",
+        "rows": [{"name": "carol", "flag": True},
+                 {"name": "dave", "flag": False}],
+        "tags": {"x": "eve", "y": "frank"},
+        "count": 3,
+    }
+    # every name was checked at the same time
+    assert unused.most_running == 5
+
+    # errors are those of the first invalid field, in order
+    invalid = copy.deepcopy(values)
+    invalid["rows"][1]["name"] = "bob"
+    invalid["tags"]["x"] = "bob"
+    del invalid["rows"][0]["flag"]
+    with pytest.raises(gs.e.FormKeyError) as err:
+        asyncio.run(gs.u.validate_fields_async(schema, invalid))
+    assert err.value.key == "rows[0].flag"
+
+    errors = gs.u.Errors()
+    output = asyncio.run(gs.u.validate_fields_async(schema, invalid,
+                                                    errors=errors))
+    assert [error.key for error in errors] == ["rows[0].flag", "tags[x]"]
+    assert sorted(output) == ["count", "name"]
+
+
+def test_async_validator(app):
+    unused = Unused(["bob"])
+
+    @app.route("/", methods=["GET", "POST"])
+    @gs.flask.async_validator({
+        "username": [gs.v.Length(min=3, max=10), unused],
+        "email": gs.v.Email(),
+    })
+    @gs.flask.base
+    async def index(form):
+        if form.is_form():
+            await asyncio.sleep(0)
+            return form["username"]
+        return flask.jsonify(flask.g.username_validator)
+
+    def handler(errors):
+        return flask.jsonify([error.key for error in errors])
+
+    @app.route("/collect", methods=["POST"])
+    @gs.flask.async_validator({
+        "username": unused,
+        "email": gs.v.Email(),
+    }, collect=gs.u.ALL_ERRORS, handler=handler)
+    @gs.flask.base
+    def collect(form):
+        return "success"
+
+    with app.test_client() as c:
+        assert c.get("/").json == {"length_min": 3, "length_max": 10}
+        assert c.post("/", data={"username": "Alice",
+                                 "email": "a@example.com"}).data == b"alice"
+        with pytest.raises(gs.e.ValidationError) as err:
+            c.post("/", data={"username": "bob", "email": "a@example.com"})
+        assert err.value.message == "taken"
+
+        result = c.post("/collect", data={"username": "bob", "email": "a"})
+        assert result.json == ["username", "email"]
+        assert c.post("/collect", data={"username": "carol",
+                                        "email": "a@b"}).data == b"success"
+
+    with pytest.raises(AssertionError):
+        gs.flask.validator({"username": unused})(lambda: None)
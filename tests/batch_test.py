@@ -0,0 +1,70 @@
+# pylint: disable-all
+import copy
+
+import pytest
+
+import gigaspoon as gs
+
+
+SCHEMA = gs.v.Dict(
+    name=[gs.v.Length(min=2, max=8), gs.v.Regex("^[a-z]+$")],
+    fruit=gs.v.Select(["apples", "bananas"]),
+    active=gs.v.Bool(),
+    tags=gs.v.List(gs.v.Length(max=3)))
+
+RECORDS = [
+    {"name": "spoon", "fruit": "apples", "active": "yes", "tags": ["a"]},
+    {"name": "s", "fruit": "apples", "active": "yes", "tags": []},
+    {"name": "Spoon", "fruit": "apples", "active": "no", "tags": []},
+    {"name": "spoon", "fruit": "durian", "active": "no", "tags": []},
+    {"name": "spoon", "fruit": "bananas", "active": "maybe", "tags": []},
+    {"name": "spoon", "fruit": "bananas", "active": "off",
+     "tags": ["ok", "too long"]},
+    {"name": "spoon", "active": "off", "tags": []},
+    "not a record",
+    {"name": "fork", "fruit": "bananas", "active": "OFF", "tags": []},
+]
+
+
+def loop(validator, name, items):
+    values, errors = [], {}
+    for index, item in enumerate(items):
+        try:
+            values.append(gs.u.validate_item(validator, f"{name}[{index}]",
+                                             item))
+        except gs.e.FormError as err:
+            values.append(None)
+            errors[index] = err
+    return values, errors
+
+
+def test_validate_many_matches_validate_item():
+    expected_values, expected_errors = loop(SCHEMA, "records",
+                                            copy.deepcopy(RECORDS))
+    values, errors = gs.u.validate_many(SCHEMA, "records",
+                                        iter(copy.deepcopy(RECORDS)))
+
+    assert values == expected_values
+    assert values[0]["active"] is True and values[-1]["active"] is False
+    assert sorted(errors) == sorted(expected_errors) == [1, 2, 3, 4, 5, 6, 7]
+    for index, error in errors.items():
+        assert type(error) is type(expected_errors[index])
+        assert error.key == expected_errors[index].key
+        assert str(error) == str(expected_errors[index])
+    assert errors[5].key == "records[5].tags[1]"
+    assert errors[6].key == "records[6].fruit"
+
+
+@pytest.mark.parametrize("validator, items", [
+    (gs.v.Regex("^[0-9]+$"), ["1", "a", "22", ""]),
+    (gs.v.Select(["a", "b"]), ["a", "c", "b", "d", "c"]),
+    (gs.v.Length(min=2, max=3), ["a", "ab", "abc", "abcd"]),
+    ([gs.v.LambdaMap(int), gs.v.LambdaFilter(lambda x: x > 1)],
+     ["1", "2", "x", "3"]),
+])
+def test_batch_implementations(validator, items):
+    expected_values, expected_errors = loop(validator, "input", items)
+    values, errors = gs.u.validate_many(validator, "input", items)
+    assert values == expected_values
+    assert {index: str(error) for index, error in errors.items()} == {
+        index: str(error) for index, error in expected_errors.items()}
@@ -0,0 +1,101 @@
+# pylint: disable-all
+import json
+
+import flask
+import pytest
+
+import gigaspoon as gs
+
+pytestmark = pytest.mark.usefixtures("app")
+
+
+class Even(gs.v.Validator):
+    name = "even"
+
+    def validate(self, key, value):
+        if int(value) % 2:
+            self.raise_error(key, value, message="odd")
+        return int(value)
+
+
+SCHEMA = {
+    "name": [gs.v.Length(min=2), gs.v.Regex("^[a-z]+$")],
+    "rows": gs.v.List(gs.v.Dict(count=Even(), flag=gs.v.Bool())),
+    "tags": gs.v.Map(gs.v.Select(["a", "b"])),
+}
+
+
+def values():
+    return {
+        "name": "A",
+        "rows": [{"count": "2", "flag": "yes"},
+                 {"count": "3", "flag": "maybe"},
+                 {"flag": "no"}],
+        "tags": {"x": "a", "y": "c"},
+    }
+
+
+def test_check_collects_all_errors():
+    errors = gs.u.Errors()
+    output = gs.u.check_fields(SCHEMA, values(), errors)
+    assert [(type(error.to_error()), error.key) for error in errors] == [
+        (gs.e.ValidationError, "name"),
+        (gs.e.ValidationError, "rows[1].count"),
+        (gs.e.ValidationError, "rows[1].flag"),
+        (gs.e.FormKeyError, "rows[2].count"),
+        (gs.e.ValidationError, "tags[y]"),
+    ]
+    assert errors[1].message == "odd"
+    assert output == {}
+
+
+def test_check_first_error():
+    errors = gs.u.Errors(first_only=True)
+    item = values()
+    item["name"] = "spoon"
+    output = gs.u.check_fields(SCHEMA, item, errors)
+    assert len(errors) == 1 and errors[0].key == "rows[1].count"
+    assert output == {"name": "spoon"}
+
+    errors = gs.u.Errors(first_only=True)
+    assert gs.u.check_item(gs.v.Bool(), "flag", "ON", errors) is True
+    assert gs.u.check_item(gs.v.Bool(), "flag", "1", errors) is gs.u.INVALID
+    with pytest.raises(gs.e.ValidationError) as err:
+        raise errors[0].to_error()
+    assert err.value.key == "flag" and err.value.value == "1"
+
+
+def test_validator_collects_errors(app):
+    @app.route("/", methods=["POST"])
+    @gs.flask.validator(SCHEMA, collect=gs.u.ALL_ERRORS)
+    @gs.flask.base
+    def index(form):
+        return flask.jsonify({"errors": [error.key for error in form.errors],
+                              "form": form})
+
+    @app.route("/first", methods=["POST"])
+    @gs.flask.validator(SCHEMA, collect=gs.u.FIRST_ERROR,
+                        handler=lambda errors: (str(errors[0]), 400))
+    @gs.flask.base
+    def first(form):
+        return "success"
+
+    with app.test_client() as c:
+        result = c.post("/", data=json.dumps(values()),
+                        content_type="application/json")
+        assert json.loads(result.data) == {
+            "errors": ["name", "rows[1].count", "rows[1].flag",
+                       "rows[2].count", "tags[y]"],
+            "form": {}}
+
+        result = c.post("/first", data=json.dumps(values()),
+                        content_type="application/json")
+        assert result.status_code == 400
+        assert result.data.startswith(b"'name'")
+
+        item = values()
+        item.update(name="spoon", tags={})
+        item["rows"] = item["rows"][:1]
+        result = c.post("/first", data=json.dumps(item),
+                        content_type="application/json")
+        assert result.data == b"success"
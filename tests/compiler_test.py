@@ -0,0 +1,133 @@
+# pylint: disable-all
+import copy
+
+import pytest
+
+import gigaspoon as gs
+from gigaspoon import compiler
+
+
+class Double(gs.v.Validator):
+    name = "double"
+
+    def validate(self, key, value):
+        return value * 2
+
+
+class StrictLength(gs.v.Length):
+    def validate(self, key, value):
+        if len(value) == 3:
+            self.raise_error(key, value, message="no threes")
+        return super(StrictLength, self).validate(key, value)
+
+
+SCHEMA = {
+    "name": [gs.v.Length(min=2, max=8), gs.v.Regex("^[a-z]+$")],
+    "flag": gs.v.Bool(),
+    "fruit": gs.v.Select(["apples", "bananas"]),
+    "count": [gs.v.LambdaMap(int), Double()],
+    "items": gs.v.List([gs.v.Length(max=5), gs.v.Bool()], max_items=3),
+    "nested": gs.v.Dict(
+        rows=gs.v.List(gs.v.Dict(key=gs.v.Exists(),
+                                 tags=gs.v.Map(gs.v.Length(min=1)))),
+        date=gs.v.Date(use_isoformat=True)),
+}
+
+VALID = {
+    "name": "spoon",
+    "flag": "ON",
+    "fruit": "apples",
+    "count": "21",
+    "items": ["yes", "off"],
+    "nested": {
+        "rows": [{"key": "a", "tags": {"x": "1"}},
+                 {"key": "b", "tags": {}}],
+        "date": "2020-04-10",
+    },
+}
+
+
+def interpret(validators, values):
+    return {name: gs.u.validate_item(validator_list, name, values[name])
+            for name, validator_list in validators.items()}
+
+
+def test_compile_schema_matches_interpreter():
+    check = compiler.compile_schema(SCHEMA)
+    assert check(copy.deepcopy(VALID)) == interpret(SCHEMA,
+                                                    copy.deepcopy(VALID))
+
+    output = {"kept": True}
+    assert check(copy.deepcopy(VALID), output) is output
+    assert output["kept"] and output["count"] == 42
+
+
+@pytest.mark.parametrize("path, value, error", [
+    (("name",), "a", gs.e.ValidationError),
+    (("name",), "SPOON", gs.e.ValidationError),
+    (("flag",), "maybe", gs.e.ValidationError),
+    (("fruit",), "durian", gs.e.ValidationError),
+    (("count",), "many", gs.e.ValidationError),
+    (("items", 1), "not a bool", gs.e.ValidationError),
+    (("items",), "not a list", gs.e.ValidationError),
+    (("items",), ["yes"] * 4, gs.e.ValidationError),
+    (("nested", "rows", 1, "tags"), {"x": ""}, gs.e.ValidationError),
+    (("nested", "rows", 0), {"tags": {}}, gs.e.FormKeyError),
+    (("nested", "rows"), {"0": "x"}, gs.e.ValidationError),
+    (("nested", "date"), "10/04/2020", gs.e.ValidationError),
+])
+def test_compile_schema_errors_match_interpreter(path, value, error):
+    values = copy.deepcopy(VALID)
+    container = values
+    for part in path[:-1]:
+        container = container[part]
+    container[path[-1]] = value
+
+    with pytest.raises(error) as expected:
+        interpret(SCHEMA, copy.deepcopy(values))
+    with pytest.raises(error) as compiled:
+        compiler.compile_schema(SCHEMA)(copy.deepcopy(values))
+
+    assert str(compiled.value) == str(expected.value)
+    assert compiled.value.key == expected.value.key
+
+
+def test_compile_schema_missing_key():
+    values = copy.deepcopy(VALID)
+    del values["fruit"]
+    with pytest.raises(gs.e.FormKeyError) as err:
+        compiler.compile_schema(SCHEMA)(values)
+    assert err.value.key == "fruit"
+
+
+def test_compile_validator_respects_subclasses():
+    validate_item = compiler.compile_validator([StrictLength(max=5)])
+    assert validate_item("input", "ab") == "ab"
+    with pytest.raises(gs.e.ValidationError) as err:
+        validate_item("input", "abc")
+    assert err.value.message == "no threes"
+
+    validate_item = compiler.compile_validator(gs.v.List(Double()))
+    assert validate_item("input", [1, 2]) == [2, 4]
+
+
+@pytest.mark.parametrize("value", ["spoon", "sp", "Spoon", "spoon1",
+                                   "spoonspoon", "sp00n"])
+def test_compile_fuses_regexes(value):
+    validators = [gs.v.Regex("^[a-z]"), gs.v.Regex("(s)(p)"),
+                  gs.v.Regex("[a-z0-9]{3,}$|sp$"), gs.v.Regex("^.{0,6}$")]
+    validate_item = compiler.compile_validator(validators)
+    assert validate_item._source.count("_m") == 1
+
+    try:
+        expected = gs.u.validate_item(validators, "input", value)
+    except gs.e.ValidationError as err:
+        with pytest.raises(gs.e.ValidationError) as compiled:
+            validate_item("input", value)
+        assert compiled.value.message is err.message
+    else:
+        assert validate_item("input", value) == expected
+
+    # Backreferences depend on group numbers, and are not fused
+    validators = [gs.v.Regex("^(s)"), gs.v.Regex("(p)\\1")]
+    assert compiler.compile_validator(validators)._source.count("_m") == 2
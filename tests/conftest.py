@@ -3,6 +3,26 @@ import flask
 import pytest
 
 
+def pytest_addoption(parser):
+    parser.addoption("--benchmarks", action="store_true",
+                     help="run tests asserting on timings")
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "benchmark: test asserting on timings, which may fail on "
+                   "a loaded machine; run with --benchmarks")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmarks"):
+        return
+    skip = pytest.mark.skip(reason="timing test; run with --benchmarks")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
 @pytest.fixture
 def app(request):
     """
@@ -0,0 +1,178 @@
+# pylint: disable-all
+import concurrent.futures
+import copy
+import json
+import threading
+import time
+
+import flask
+import pytest
+
+import gigaspoon as gs
+
+pytestmark = pytest.mark.usefixtures("app")
+
+
+class Slow(gs.v.Validator):
+    name = "slow"
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def validate(self, key, value):
+        time.sleep(self.delay)
+        if value == "bad":
+            self.raise_error(key, value, message="bad")
+        # validators run with the request context
+        return "%s:%s" % (value, flask.request.method)
+
+
+def schema(delay=0.001):
+    return {
+        "a": Slow(delay),
+        "b": [gs.v.Length(min=2), Slow(delay)],
+        "rows": gs.v.List(gs.v.Bool()),
+        "user": gs.v.Dict(name=Slow(delay), email=Slow(delay),
+                          flag=gs.v.Bool()),
+    }
+
+
+VALUES = {
+    "a": "x",
+    "b": "yy",
+    "rows": ["yes", "no"],
+    "user": {"name": "n", "email": "e", "flag": "on"},
+}
+
+
+@pytest.mark.parametrize("change", [
+    {},
+    {"a": "bad"},
+    {"a": "bad", "b": "y"},
+    {"rows": ["maybe"], "user": {"name": "bad", "email": "bad"}},
+    {"user": {"email": "bad", "flag": "maybe"}},
+    {"user": {"flag": "on"}},
+    {"user": "not a dict", "b": None},
+])
+@pytest.mark.parametrize("collect", [None, gs.u.FIRST_ERROR,
+                                     gs.u.ALL_ERRORS])
+def test_executor_matches_sequential(app, change, collect):
+    values = copy.deepcopy(VALUES)
+    values.update(copy.deepcopy(change))
+    if values["b"] is None:
+        del values["b"]
+
+    def view(form):
+        return flask.jsonify({"errors": [str(error) for error in form.errors],
+                              "form": form})
+
+    executor = concurrent.futures.ThreadPoolExecutor(4)
+    for rule, kwargs in [("/", {}), ("/executor", {"executor": executor})]:
+        decorator = gs.flask.validator(schema(), collect=collect, **kwargs)
+        app.add_url_rule(rule, rule, decorator(gs.flask.base(view)),
+                         methods=["POST"])
+
+    results = []
+    with app.test_client() as c:
+        for rule in ["/", "/executor"]:
+            try:
+                result = c.post(rule, data=json.dumps(values),
+                                content_type="application/json")
+                results.append(json.loads(result.data))
+            except gs.e.FormError as err:
+                results.append((type(err), str(err)))
+    assert results[0] == results[1]
+
+
+class Meeting(gs.v.Validator):
+    name = "meeting"
+
+    def __init__(self, barrier):
+        self.barrier = barrier
+
+    def validate(self, key, value):
+        # Returns once every party is validating at the same time; run one
+        # at a time, the validators time out instead
+        self.barrier.wait()
+        return "%s:%s" % (value, flask.request.method)
+
+
+def test_executor_runs_fields_concurrently(app):
+    barrier = threading.Barrier(4, timeout=10)
+
+    @app.route("/", methods=["POST"])
+    @gs.flask.validator({
+        "a": Meeting(barrier),
+        "b": [gs.v.Length(min=2), Meeting(barrier)],
+        "user": gs.v.Dict(name=Meeting(barrier), email=Meeting(barrier),
+                          flag=gs.v.Bool()),
+    }, executor=True)
+    @gs.flask.base
+    def index(form):
+        return flask.jsonify(form)
+
+    with app.test_client() as c:
+        result = c.post("/", data=json.dumps(VALUES),
+                        content_type="application/json")
+    assert json.loads(result.data) == {
+        "a": "x:POST", "b": "yy:POST",
+        "user": {"name": "n:POST", "email": "e:POST", "flag": True}}
+    assert not barrier.broken
+    assert any(thread.name.startswith("gigaspoon")
+               for thread in threading.enumerate())
+
+
+@pytest.mark.parametrize("collect", [None, gs.u.FIRST_ERROR])
+def test_executor_cancels_tasks_after_error(app, collect):
+    calls = []
+
+    class Counted(gs.v.Validator):
+        name = "counted"
+
+        def validate(self, key, value):
+            calls.append(key)
+            if value == "bad":
+                self.raise_error(key, value, message="bad")
+            time.sleep(0.05)
+            return value
+
+    executor = concurrent.futures.ThreadPoolExecutor(1)
+    names = ["field%d" % index for index in range(10)]
+
+    @app.route("/", methods=["POST"])
+    @gs.flask.validator({name: Counted() for name in names},
+                        collect=collect, executor=executor)
+    @gs.flask.base
+    def index(form):
+        return flask.jsonify([str(error) for error in form.errors])
+
+    data = dict.fromkeys(names, "ok")
+    data["field0"] = "bad"
+    with app.test_client() as c:
+        if collect is None:
+            with pytest.raises(gs.e.ValidationError):
+                c.post("/", data=data)
+        else:
+            assert len(c.post("/", data=data).json) == 1
+    executor.shutdown(wait=True)
+    assert "field0" in calls
+    assert len(calls) < len(names)
+
+
+def test_executor_missing_entry_records_dict(app):
+    validators = schema()
+    gs.flask._prepare_validators(validators)
+    check = gs.flask._ExecutorCheck(
+        validators, concurrent.futures.ThreadPoolExecutor(2))
+    values = copy.deepcopy(VALUES)
+    del values["user"]["email"]
+    with app.test_request_context(method="POST"):
+        errors = gs.u.Errors()
+        check(copy.deepcopy(values), {}, errors)
+        expected = gs.u.Errors()
+        gs.u.check_fields(validators, copy.deepcopy(values), expected)
+    assert [(record.key, record.error_class, record._validator)
+            for record in errors] == [
+        (record.key, record.error_class, record._validator)
+        for record in expected]
+    assert errors[0]._validator is validators["user"][0]
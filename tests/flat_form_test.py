@@ -0,0 +1,151 @@
+# pylint: disable-all
+import time
+
+import flask
+import pytest
+
+from werkzeug.datastructures import MultiDict
+
+import gigaspoon as gs
+
+process_flat_form = gs.flask.process_flat_form
+
+
+def test_simple_values():
+    assert process_flat_form({"foo": "bar"}) == {"foo": "bar"}
+    assert process_flat_form({"foo[]": "bar"}) == {"foo": ["bar"]}
+    assert process_flat_form({"foo.bar": "baz"}) == {"foo": {"bar": "baz"}}
+
+
+def test_multidict_keeps_repeated_values():
+    form = MultiDict([("foo", "a"), ("foo", "b"), ("bar[]", "c"),
+                      ("bar[]", "d"), ("one", "e")])
+    assert process_flat_form(form) == {"foo": ["a", "b"], "bar": ["c", "d"],
+                                       "one": "e"}
+
+
+def test_indexed_rows_are_ordered_numerically():
+    form = {"rows.%d.name" % index: str(index) for index in range(12, -1, -1)}
+    form.update({"rows.%d.id" % index: index for index in range(13)})
+    output = process_flat_form(form)
+    assert output == {"rows": [{"name": str(index), "id": index}
+                               for index in range(13)]}
+
+
+def test_mixed_and_sparse_indexes():
+    output = process_flat_form({"foo.3": "c", "foo.1000": "d", "foo.1.x": "a"})
+    assert output == {"foo": [{"x": "a"}, "c", "d"]}
+
+    output = process_flat_form({"foo.1.2": "b", "foo.1.1": "a", "foo.0": "z"})
+    assert output == {"foo": ["z", ["a", "b"]]}
+
+
+def test_equal_arrays_are_tracked_separately():
+    # Arrays comparing equal must all be restructured, not only the first
+    output = process_flat_form({"a.1": "x", "b.1": "x", "c.d.1": "x"})
+    assert output == {"a": ["x"], "b": ["x"], "c": {"d": ["x"]}}
+
+
+@pytest.mark.benchmark
+def test_indexed_rows_scale_linearly():
+    def timed(rows):
+        form = {}
+        for index in range(rows):
+            form["row.%d.name" % index] = "name"
+            form["row.%d.tags.%d" % (index, index % 3)] = "tag"
+        best = None
+        for _ in range(3):
+            start = time.perf_counter()
+            output = process_flat_form(form)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        assert len(output["row"]) == rows
+        return best
+
+    # A quadratic implementation is ~16x slower; allow for noisy machines
+    assert timed(16000) < timed(4000) * 10
+
+
+def test_structure_limits():
+    structure = gs.flask.FormStructure(max_depth=3, max_keys=4, max_index=99,
+                                       max_items=3)
+    assert process_flat_form({"a.0.b": "x", "c[]": "y"}, structure) == {
+        "a": [{"b": "x"}], "c": ["y"]}
+
+    for form, message in [
+            ({"a.b.c.d": "x"}, "too deeply nested (> 3)"),
+            ({"a%d" % index: "x" for index in range(5)},
+             "too many fields (> 4)"),
+            ({"a.100": "x"}, "index too large (> 99)"),
+            ({"a.%s.b" % ("9" * 5000): "x"}, "index too large (> 99)"),
+            ({"a.%d" % index: "x" for index in range(4)},
+             "too many items (> 3)"),
+            (MultiDict([("a[]", "x")] * 4), "too many items (> 3)"),
+            (MultiDict([("a", "x")] * 4), "too many items (> 3)")]:
+        with pytest.raises(gs.e.FormStructureError) as info:
+            process_flat_form(form, structure)
+        assert str(info.value).endswith(message)
+
+
+def test_structure_from_schema():
+    structure = gs.flask.FormStructure.from_schema({
+        "name": gs.v.Length(max=10),
+        "rows": gs.v.List(gs.v.Dict(a=gs.v.Length(max=4), b=gs.v.Bool()),
+                          max_items=5),
+    })
+    assert (structure.max_depth, structure.max_keys, structure.max_items,
+            structure.max_index) == (4, 86, 10, 100)
+
+    # Repeated keys of Length() fields are folded into lists
+    structure = gs.flask.FormStructure.from_schema({
+        "name": gs.v.Length(max=3), "email": gs.v.Email()})
+    assert (structure.max_keys, structure.max_items) == (24, 3)
+    structure = gs.flask.FormStructure.from_schema({"name": gs.v.Length()})
+    assert structure.max_items == gs.flask.FormStructure.DEFAULT_MAX_ITEMS
+
+    structure = gs.flask.FormStructure.from_schema({
+        "settings": gs.v.Map(gs.v.Exists())})
+    assert (structure.max_depth, structure.max_keys, structure.max_items) == (
+        gs.flask.FormStructure.DEFAULT_MAX_DEPTH,
+        gs.flask.FormStructure.DEFAULT_MAX_KEYS,
+        gs.flask.FormStructure.DEFAULT_MAX_ITEMS)
+
+
+def test_validator_accepts_repeated_scalar_keys(app):
+    @app.route("/", methods=["POST"])
+    @gs.flask.validator({"name": gs.v.Length(max=3),
+                         "email": gs.v.Email()})
+    @gs.flask.base
+    def index(form):
+        return flask.jsonify(form["name"])
+
+    with app.test_client() as client:
+        data = MultiDict([("name", "a"), ("name", "b"),
+                          ("email", "someone@example.com")])
+        assert client.post("/", data=data).json == ["a", "b"]
+        data.setlist("name", ["a", "b", "c", "d"])
+        with pytest.raises(gs.e.FormStructureError):
+            client.post("/", data=data)
+
+
+def test_unreferenced_fields_are_skipped():
+    form = MultiDict([("name", "a"), ("rows.1.x", "b"), ("tags[]", "c"),
+                      ("cms.a.b.c.d.e", "x"), ("cms.9999999", "x"),
+                      ("other[]", "x"), ("other[]", "x")])
+    structure = gs.flask.FormStructure(max_depth=3, max_keys=3,
+                                       max_index=10, max_items=1)
+    assert process_flat_form(form, structure, {"name", "rows", "tags"}) == {
+        "name": "a", "rows": [{"x": "b"}], "tags": ["c"]}
+
+
+def test_validator_ignores_unreferenced_fields(app):
+    @app.route("/", methods=["POST"])
+    @gs.flask.validator({"name": gs.v.Length(max=8)})
+    @gs.flask.base
+    def index(form):
+        return form["name"]
+
+    data = {"cms.%d.block.%d" % (index, index): "x" for index in range(500)}
+    data["name"] = "spoon"
+    with app.test_client() as client:
+        assert client.post("/", data=data).data == b"spoon"
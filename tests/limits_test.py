@@ -0,0 +1,137 @@
+# pylint: disable-all
+import io
+
+import flask
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import gigaspoon as gs
+
+pytestmark = pytest.mark.usefixtures("app")
+
+
+class CountingStream(io.BytesIO):
+    read_bytes = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.read_bytes += len(data)
+        return data
+
+
+def schema():
+    return {
+        "name": [gs.v.Length(min=1, max=8)],
+        "tags": [gs.v.List(gs.v.Length(max=3)), gs.v.Length(max=2)],
+        "rows": [gs.v.List(gs.v.Dict(id=gs.v.Exists(),
+                                     note=gs.v.Length(max=5))),
+                 gs.v.Length(max=3)],
+        "meta": gs.v.Map(gs.v.Length(max=4)),
+        "payload": gs.v.Exists(),
+    }
+
+
+def test_form_limits_from_schema():
+    limits = gs.flask.FormLimits(schema(), max_field_length=100)
+    assert limits.field("name") == ([], 8)
+    assert limits.field("tags[]") == ([("tags", None, 2)], 3)
+    assert limits.field("rows.2.note") == ([("rows", "2", 3)], 5)
+    assert limits.field("rows.2.id") == ([("rows", "2", 3)], 100)
+    assert limits.field("meta.anything") == ([], 4)
+    assert limits.field("payload.a.0.b") == ([], 100)
+    for key in ["other", "name.x", "rows.0.other", "rows.x", "x" * 2000]:
+        with pytest.raises(gs.e.FormLimitError):
+            limits.field(key)
+
+
+FORM = [("name", "spoon"), ("tags[]", "a"), ("tags[]", "bc"),
+        ("rows.0.id", "1"), ("rows.0.note", "hi"), ("rows.1.id", "2"),
+        ("rows.1.note", ""), ("meta.x", "1234"), ("payload.y", "z" * 50)]
+
+
+@pytest.mark.parametrize("change, extra, key", [
+    ({}, [], None),
+    ({}, [("other", "1")], "other"),
+    ({"name": "too long!"}, [], "name"),
+    ({"name": "ünïcødé"}, [], None),
+    ({}, [("tags[]", "d")], "tags"),
+    ({"tags[]": "long"}, [], "tags[]"),
+    ({}, [("rows.2.id", "3"), ("rows.3.id", "4")], "rows"),
+    ({"rows.1.note": "too long"}, [], "rows.1.note"),
+    ({}, [("meta.y", "12345")], "meta.y"),
+])
+@pytest.mark.parametrize("content_type, decoder", [
+    ("application/x-www-form-urlencoded", True),
+    ("multipart/form-data", True),
+    # Werkzeug < 2.0 has no multipart decoder; checked after parsing
+    ("multipart/form-data", False)])
+def test_validator_limits(app, monkeypatch, change, extra, key, content_type,
+                          decoder):
+    if not decoder:
+        monkeypatch.setattr(gs.flask, "_multipart", lambda: None)
+
+    @app.route("/", methods=["POST"])
+    @gs.flask.validator(schema(), limits=True)
+    @gs.flask.base
+    def index(form):
+        return flask.jsonify(form)
+
+    form = [(name, change.get(name, value)) for name, value in FORM] + extra
+    with app.test_client() as c:
+        if key is None:
+            result = c.post("/", data=MultiDict(form),
+                            content_type=content_type)
+            assert result.json["name"] == change.get("name", "spoon")
+            assert result.json["rows"] == [{"id": "1", "note": "hi"},
+                                           {"id": "2", "note": ""}]
+        else:
+            with pytest.raises(gs.e.FormLimitError) as err:
+                c.post("/", data=MultiDict(form), content_type=content_type)
+            assert err.value.key == key
+
+
+@pytest.mark.parametrize("body, content_type", [
+    (b"name=spoon&payload=1&name" + b"=" + b"x" * 1000000,
+     "application/x-www-form-urlencoded"),
+    (b"name=spoon&" + b"a" * 1000000, "application/x-www-form-urlencoded"),
+    (b"--b\r\nContent-Disposition: form-data; name=\"name\"\r\n\r\n" +
+     b"x" * 1000000 + b"\r\n--b--\r\n", "multipart/form-data; boundary=b"),
+])
+def test_limits_reject_early(app, body, content_type):
+    if content_type.startswith("multipart/") and gs.flask._multipart() is None:
+        pytest.skip("multipart bodies are checked once parsed without the "
+                    "sans-IO decoder of Werkzeug 2")
+
+    @app.route("/", methods=["POST"])
+    @gs.flask.validator(schema(), limits=True)
+    @gs.flask.base
+    def index(form):
+        return ""
+
+    stream = CountingStream(body)
+    with app.test_client() as c:
+        with pytest.raises(gs.e.FormLimitError):
+            c.post("/", input_stream=stream, content_type=content_type,
+                   headers={"Content-Length": str(len(body))})
+    assert stream.read_bytes <= 128 * 1024
+
+
+def test_stacked_limits(app):
+    @app.route("/", methods=["POST"])
+    @gs.flask.validator({"a": gs.v.Length(max=3)}, limits=True,
+                        collect=gs.u.ALL_ERRORS, handler=lambda errors: "")
+    @gs.flask.validator({"b": gs.v.Length(max=3)}, limits=True)
+    @gs.flask.base
+    def index(form):
+        return flask.jsonify(form)
+
+    # The handler prevents merging the decorators
+    assert index._gigaspoon_validator[2].keys() == {"a"}
+    with app.test_client() as c:
+        assert c.post("/", data={"a": "x", "b": "y"}).json == {"a": "x",
+                                                               "b": "y"}
+        for data, key in [({"a": "x", "b": "long"}, "b"),
+                          ({"a": "x", "b": "y", "c": "z"}, "c")]:
+            with pytest.raises(gs.e.FormLimitError) as err:
+                c.post("/", data=data)
+            assert err.value.key == key
@@ -0,0 +1,133 @@
+# pylint: disable-all
+import flask
+import pytest
+
+import gigaspoon as gs
+
+pytestmark = pytest.mark.usefixtures("app")
+
+
+def routes(app, metrics, **options):
+    @app.route("/", methods=["GET", "POST"])
+    @gs.flask.validator({"name": gs.v.Length(max=4),
+                         "flag": gs.v.Bool()}, metrics=metrics, **options)
+    @gs.flask.base
+    def index(form):
+        return flask.jsonify([error.key for error in form.errors])
+
+    @app.errorhandler(gs.e.FormError)
+    def handle_form_error(exc):
+        return str(exc), 400
+
+    app.add_url_rule("/metrics", "metrics",
+                     gs.flask.metrics_view(metrics.sink))
+
+
+def test_metrics(app):
+    metrics = gs.metrics.Metrics()
+    registry = metrics.sink
+    routes(app, metrics)
+
+    with app.test_client() as client:
+        client.post("/", data={"name": "ok", "flag": "yes"})
+        client.post("/", data={"name": "too long", "flag": "yes"})
+        client.post("/", data={"name": "ok"})
+        client.get("/")
+
+        assert registry.counter("gigaspoon_requests_total",
+                                route="index") == 3
+        for error in ["ValidationError", "FormKeyError"]:
+            assert registry.counter("gigaspoon_request_errors_total",
+                                    route="index", error=error) == 1
+        assert registry.counter("gigaspoon_fields_total", route="index",
+                                field="name") == 3
+        # Validation stops at the first error
+        assert registry.counter("gigaspoon_fields_total", route="index",
+                                field="flag") == 2
+        assert registry.counter("gigaspoon_field_errors_total",
+                                route="index", field="name",
+                                error="ValidationError") == 1
+
+        result = client.get("/metrics")
+        assert result.mimetype == "text/plain"
+        text = result.data.decode()
+        assert "# TYPE gigaspoon_request_seconds histogram" in text
+        assert 'gigaspoon_requests_total{route="index"} 3\n' in text
+        assert ('gigaspoon_field_seconds_bucket{route="index",field="flag",'
+                'le="+Inf"} 2\n') in text
+        assert 'gigaspoon_request_seconds_count{route="index"} 3\n' in text
+
+
+def test_metrics_collected_errors(app):
+    metrics = gs.metrics.Metrics()
+    routes(app, metrics, collect=gs.u.ALL_ERRORS)
+
+    with app.test_client() as client:
+        result = client.post("/", data={"name": "too long", "flag": "maybe"})
+        assert result.json == ["name", "flag"]
+
+    registry = metrics.sink
+    assert registry.counter("gigaspoon_request_errors_total", route="index",
+                            error="ValidationError") == 1
+    for field in ["name", "flag"]:
+        assert registry.counter("gigaspoon_field_errors_total",
+                                route="index", field=field,
+                                error="ValidationError") == 1
+
+
+def test_metrics_sampling(app):
+    metrics = gs.metrics.Metrics(sample_rate=0)
+    routes(app, metrics)
+
+    with app.test_client() as client:
+        for _ in range(3):
+            client.post("/", data={"name": "ok", "flag": "yes"})
+
+    registry = metrics.sink
+    assert registry.counter("gigaspoon_requests_total", route="index") == 3
+    assert registry.counter("gigaspoon_fields_total", route="index",
+                            field="name") == 0
+    assert "gigaspoon_request_seconds" not in registry.prometheus()
+
+
+def test_registry_buckets():
+    registry = gs.metrics.Registry(buckets=[0.1, 0.01])
+    for seconds in [0.001, 0.01, 0.05, 5]:
+        registry.observe_request('a"b', seconds, None)
+    text = registry.prometheus()
+    for bound, count in [("0.01", 2), ("0.1", 3), ("+Inf", 4)]:
+        assert ('gigaspoon_request_seconds_bucket{route="a\\"b",le="%s"} %d'
+                % (bound, count)) in text
+    assert gs.metrics.Registry().prometheus() == ""
+
+
+def test_server_timing(app):
+    @app.route("/", methods=["GET", "POST"])
+    @gs.flask.validator({"name": gs.v.Length(max=4)}, server_timing=True)
+    @gs.flask.validator({"other": gs.v.Exists()}, server_timing=True,
+                        collect=gs.u.ALL_ERRORS)
+    @gs.flask.base
+    def index(form):
+        return flask.jsonify(flask.g.server_timing)
+
+    @app.errorhandler(gs.e.FormError)
+    def handle_form_error(exc):
+        return "error", 400
+
+    with app.test_client() as client:
+        result = client.post("/", data={"name": "ok", "other": "x"})
+        assert set(result.json) == {"parse", "flatten", "validate"}
+        assert all(isinstance(value, int) and value >= 0
+                   for value in result.json.values())
+        header, = result.headers.getlist("Server-Timing")
+        assert sorted(header.split(", ")) == sorted(
+            "gigaspoon-%s;dur=%.3f" % (phase, value / 1e6)
+            for phase, value in result.json.items())
+
+        result = client.get("/")
+        assert set(result.json) == {"populate"}
+
+        result = client.post("/", data={"name": "too long"})
+        assert result.status_code == 400
+        assert result.headers["Server-Timing"].startswith("gigaspoon-parse")
+        assert "gigaspoon-validate;dur=" in result.headers["Server-Timing"]
@@ -0,0 +1,70 @@
+# pylint: disable-all
+import random
+
+import pytest
+
+import gigaspoon as gs
+
+
+def sample_options():
+    rng = random.Random(7)
+    options = {"", "a", "ab", "abc", "b", "ünïcødé", "z" * 300}
+    while len(options) < 2000:
+        options.add("".join(rng.choice("abcxyzé-_0")
+                            for _ in range(rng.randrange(1, 12))))
+    return options
+
+
+def probes(options):
+    rng = random.Random(11)
+    values = list(options) + ["aa", "abcd", "zz", "a\nb", "\n", "é", 5]
+    values.extend("".join(rng.choice("abcxyzé-_0")
+                          for _ in range(rng.randrange(1, 12)))
+                  for _ in range(2000))
+    return values
+
+
+@pytest.fixture(params=["compact", "compact-bloom", "file", "file-bloom"])
+def backend(request, tmp_path):
+    options = sample_options()
+    bloom = 0.01 if request.param.endswith("bloom") else None
+    if request.param.startswith("compact"):
+        return options, gs.options.CompactOptions(options, bloom=bloom)
+    path = tmp_path / "options.txt"
+    path.write_bytes(b"".join(option.encode("utf8") + b"\n"
+                              for option in sorted(options)))
+    return options, gs.options.SortedFileOptions(str(path), bloom=bloom)
+
+
+def test_backend_membership(backend):
+    options, backend = backend
+    for value in probes(options):
+        assert (value in backend) == (value in options), value
+    assert len(backend) == len(options)
+    assert backend.page() == sorted(options)
+    assert backend.page(10, 5) == sorted(options)[10:15]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    backend = gs.options.SortedFileOptions(str(path))
+    assert "" not in backend and "a" not in backend
+    assert len(backend) == 0 and backend.page() == []
+
+
+def test_select_backend(backend):
+    options, backend = backend
+    validator = gs.v.Select(backend, limit=3)
+    validator.validate("option", "ab")
+    with pytest.raises(gs.e.ValidationError):
+        validator.validate("option", "abcd")
+    assert validator.populate("option") == {
+        "options": sorted(options)[:3], "total": len(options)}
+
+    values, errors = gs.u.validate_many(validator, "option",
+                                        ["ab", "abcd", "b"])
+    assert sorted(errors) == [1]
+
+    assert gs.v.Select(["b", "a", "c"], limit=2).populate("option") == {
+        "options": ["a", "b"], "total": 3}
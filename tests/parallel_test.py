@@ -0,0 +1,104 @@
+# pylint: disable-all
+import pickle
+
+import pytest
+
+import gigaspoon as gs
+
+
+def element():
+    return gs.v.Dict(name=[gs.v.Length(min=2), gs.v.Regex("^[a-z]+$")],
+                     count=gs.v.LambdaMap(int),
+                     flag=gs.v.Bool())
+
+
+def items(count=2500, invalid=()):
+    output = [{"name": "spoon", "count": str(index), "flag": "yes"}
+              for index in range(count)]
+    for index, change in invalid:
+        output[index].update(change)
+    return output
+
+
+@pytest.fixture
+def pool():
+    pool = gs.parallel.ProcessPool(processes=2, chunksize=300)
+    yield pool
+    pool.close()
+
+
+@pytest.mark.parametrize("invalid", [
+    [],
+    [(2000, {"name": "A"})],
+    [(5, {"count": "x"}), (1500, {"flag": "maybe"}), (2499, {"name": "a"})],
+])
+def test_parallel_list_matches_sequential(pool, invalid):
+    sequential = gs.v.List(element())
+    parallel = gs.v.List(element(), parallel=pool)
+
+    for mode in [None, gs.u.FIRST_ERROR, gs.u.ALL_ERRORS]:
+        results = []
+        for validator in [sequential, parallel]:
+            value = items(invalid=invalid)
+            if mode is None:
+                try:
+                    validator.validate("rows", value)
+                    results.append((value, None))
+                except gs.e.FormError as err:
+                    results.append((value, (type(err), err.key, str(err))))
+            else:
+                errors = gs.u.Errors(first_only=mode == gs.u.FIRST_ERROR)
+                output = validator.check("rows", value, errors)
+                results.append((value, output,
+                                [str(error) for error in errors]))
+        if not invalid:
+            assert results[1][0][-1]["count"] == 2499
+        assert results[0] == results[1]
+
+
+@pytest.mark.parametrize("mode", [None, gs.u.FIRST_ERROR])
+def test_parallel_list_stops_at_error(pool, mode):
+    validator = gs.v.List(element(), parallel=pool)
+    executor = pool._get_executor()
+    submitted = []
+    submit = executor.submit
+
+    def counting(*args):
+        submitted.append(args[2])
+        return submit(*args)
+
+    executor.submit = counting
+    value = items(count=30000, invalid=[(1, {"count": "x"})])
+    if mode is None:
+        with pytest.raises(gs.e.ValidationError):
+            validator.validate("rows", value)
+    else:
+        errors = gs.u.Errors(first_only=True)
+        assert validator.check("rows", value, errors) is gs.u.INVALID
+        assert len(errors) == 1
+    # only the chunks sent ahead of the first one were submitted
+    assert submitted[0] == 0
+    assert len(submitted) <= 5
+
+
+def test_parallel_list_compiled(pool):
+    validate = gs.compiler.compile_validator(
+        gs.v.Dict(rows=gs.v.List(element(), parallel=pool)))
+    value = validate("form", {"rows": items()})
+    assert value["rows"][7] == {"name": "spoon", "count": 7, "flag": True}
+    with pytest.raises(gs.e.ValidationError) as err:
+        validate("form", {"rows": items(invalid=[(1234, {"count": "x"})])})
+    assert err.value.key == "form.rows[1234].count"
+
+    with pytest.raises(ValueError):
+        gs.v.List(element(), parallel=pool)
+
+
+def test_errors_pickle():
+    error = gs.e.ValidationError("a[1]", "x", gs.v.Bool(), message="m")
+    copied = pickle.loads(pickle.dumps(error))
+    assert str(copied) == str(error) and copied.key == "a[1]"
+    copied = pickle.loads(pickle.dumps(gs.e.FormKeyError("a.b")))
+    assert copied.key == "a.b"
+    invalid = pickle.loads(pickle.dumps(gs.e.Invalid.from_error(error)))
+    assert str(invalid) == str(error)
@@ -0,0 +1,168 @@
+# pylint: disable-all
+import flask
+import pytest
+
+import gigaspoon as gs
+
+pytestmark = pytest.mark.usefixtures("app")
+
+
+class Counting(gs.v.Validator):
+    name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    def validate(self, key, value):
+        self.calls += 1
+        if value == "bad":
+            self.raise_error(key, value)
+        return value.split(",")
+
+
+def routes(app, retry_cache, name=gs.v.Length(max=8), **options):
+    counting = Counting()
+
+    @app.route("/", methods=["GET", "POST"])
+    @gs.flask.validator({
+        "csrf": gs.flask.CSRF(),
+        "items": counting,
+        "name": name,
+    }, retry_cache=retry_cache, **options)
+    @gs.flask.base
+    def index(form):
+        if not form.is_form():
+            return flask.g.csrf_validator["csrf_token"]
+        result = flask.jsonify(items=form.get("items"), name=form.get("name"),
+                               errors=[error.key for error in form.errors])
+        form.get("items", []).append("modified")
+        return result
+
+    @app.errorhandler(gs.e.FormError)
+    def handle_form_error(exc):
+        return str(exc.key), 400
+
+    return counting
+
+
+def test_retried_payloads_are_not_validated_again(app):
+    name = Counting()
+    counting = routes(app, gs.flask.RetryCache(exclude=["name"]), name=name)
+
+    with app.test_client() as client:
+        token = client.get("/").data.decode()
+        data = {"csrf": token, "items": "a,b", "name": "spoon"}
+        for _ in range(3):
+            result = client.post("/", data=data)
+            assert result.json == {"items": ["a", "b"], "name": ["spoon"],
+                                   "errors": []}
+        assert counting.calls == 1
+
+        # Excluded fields and dynamic validators are always validated
+        assert name.calls == 3
+        with client.session_transaction() as session:
+            session["_csrf_token"] = "other"
+        assert client.post("/", data=data).data == b"csrf"
+
+        # Any change to the request is another payload
+        client.post("/", data=dict(data, csrf="other"))
+        client.post("/?page=2", data=dict(data, csrf="other"))
+        client.post("/", json=dict(data, csrf="other"))
+        assert counting.calls == 4
+
+
+def test_invalid_payloads_are_not_cached(app):
+    counting = routes(app, gs.flask.RetryCache(), collect=gs.u.ALL_ERRORS)
+
+    with app.test_client() as client:
+        token = client.get("/").data.decode()
+        data = {"csrf": token, "items": "bad", "name": "spoon"}
+        for _ in range(2):
+            assert client.post("/", data=data).json["errors"] == ["items"]
+        assert counting.calls == 2
+
+
+def test_retry_cache_bounds(app):
+    retry_cache = gs.flask.RetryCache(maxsize=1)
+    counting = routes(app, retry_cache)
+
+    with app.test_client() as client:
+        token = client.get("/").data.decode()
+        for items in ["a", "b", "a", "a"]:
+            client.post("/", data={"csrf": token, "items": items,
+                                   "name": "spoon"})
+        assert counting.calls == 3
+
+        retry_cache.ttl = 0
+        retry_cache.clear()
+        for _ in range(2):
+            client.post("/", data={"csrf": token, "items": "a",
+                                   "name": "spoon"})
+        assert counting.calls == 5
+
+
+def test_multipart_payloads_are_not_cached(app):
+    counting = routes(app, gs.flask.RetryCache())
+
+    with app.test_client() as client:
+        token = client.get("/").data.decode()
+        data = {"csrf": token, "items": "a", "name": "spoon"}
+        for _ in range(2):
+            client.post("/", data=data, content_type="multipart/form-data")
+        assert counting.calls == 2
+
+
+def test_retry_cache_with_limits(app):
+    for inner, outer in [({"limits": True}, {}), ({}, {"limits": True})]:
+        def index(form):
+            pass
+
+        decorated = gs.flask.validator({"name": gs.v.Length(max=8)},
+                                       **inner)(index)
+        with pytest.raises(AssertionError):
+            gs.flask.validator({"items": Counting()},
+                               retry_cache=gs.flask.RetryCache(),
+                               **outer)(decorated)
+
+    # Limits of an outer decorator parse the form, which is digested
+    counting = Counting()
+
+    @app.route("/", methods=["POST"])
+    @gs.flask.validator({"name": gs.v.Length(max=8)}, limits=True)
+    @gs.flask.validator({"items": counting},
+                        retry_cache=gs.flask.RetryCache())
+    @gs.flask.base
+    def index(form):
+        return flask.jsonify(dict(form))
+
+    with app.test_client() as client:
+        for items in ["a", "b", "b"]:
+            result = client.post("/", data={"items": items, "name": "x"})
+            assert result.json == {"items": [items], "name": "x"}
+        assert counting.calls == 2
+
+
+@pytest.mark.parametrize("outer", [{"limits": True},
+                                   {"collect": gs.u.ALL_ERRORS}])
+def test_retry_cache_of_json_under_parsed_form(app, outer):
+    counting = Counting()
+
+    @app.route("/", methods=["POST"])
+    @gs.flask.validator({"name": gs.v.Length(max=8)}, **outer)
+    @gs.flask.validator({"items": counting},
+                        retry_cache=gs.flask.RetryCache())
+    @gs.flask.base
+    def index(form):
+        return flask.jsonify(dict(form))
+
+    @app.errorhandler(gs.e.FormError)
+    def handle_form_error(exc):
+        return str(exc.key), 400
+
+    with app.test_client() as client:
+        for items in ["a", "b,c", "b,c"]:
+            result = client.post("/", json={"items": items, "name": "x"})
+            assert result.json == {"items": items.split(","), "name": "x"}
+        result = client.post("/", json={"items": "bad", "name": "x"})
+        assert result.data == b"items"
+        assert counting.calls == 3
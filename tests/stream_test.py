@@ -0,0 +1,113 @@
+# pylint: disable-all
+import io
+import json
+
+import flask
+import pytest
+
+import gigaspoon as gs
+
+pytestmark = pytest.mark.usefixtures("app")
+
+
+class CountingStream(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.read_bytes += len(data)
+        return data
+
+
+DOCUMENTS = [
+    [],
+    [1, 22, 333, -4.5e10, 0],
+    ["", "ünïcødé ✓", "esc\"aped\\\n", "x" * 1000],
+    [{"a": [1, {"b": None}], "c": True}, [], {}, [[False]]],
+]
+
+
+@pytest.mark.parametrize("document", DOCUMENTS)
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 65536])
+def test_iter_json_array(document, chunk_size):
+    for text in [json.dumps(document), json.dumps(document, indent=3)]:
+        stream = io.BytesIO(text.encode("utf8"))
+        assert list(gs.stream.iter_json_array(stream, chunk_size)) == \
+            document
+
+
+@pytest.mark.parametrize("text", ["", "{}", "[1,,2]", "[1 2]", "[1] x",
+                                  "[tru]", '["abc', "[1,", "[nul, 1]"])
+@pytest.mark.parametrize("chunk_size", [1, 3, 65536])
+def test_iter_json_array_malformed(text, chunk_size):
+    with pytest.raises(ValueError):
+        list(gs.stream.iter_json_array(io.BytesIO(text.encode()),
+                                       chunk_size))
+
+
+def test_iter_json_array_rejects_early():
+    data = b"[1, 2, x" + b" 3," * 1000000 + b"4]"
+    stream = CountingStream(data)
+    items = gs.stream.iter_json_array(stream, 1024)
+    assert next(items) == 1 and next(items) == 2
+    with pytest.raises(ValueError):
+        next(items)
+    assert stream.read_bytes < 4096
+
+
+def test_validator_stream(app):
+    rows = gs.v.List(gs.v.Dict(name=gs.v.Length(min=1),
+                               count=gs.v.LambdaMap(int)))
+
+    @app.route("/", methods=["POST"])
+    @gs.flask.validator({"rows": rows, "batch": gs.v.LambdaMap(int)},
+                        stream="rows")
+    @gs.flask.base
+    def index(form):
+        total = 0
+        for row in form["rows"]:
+            total += row["count"]
+        return flask.jsonify({"batch": form["batch"], "total": total})
+
+    def post(data, query="?batch=7"):
+        return c.post("/" + query, input_stream=data,
+                      content_type="application/json")
+
+    with app.test_client() as c:
+        data = json.dumps([{"name": "a", "count": str(index)}
+                           for index in range(1000)]).encode()
+        assert post(io.BytesIO(data)).json == {"batch": 7, "total": 499500}
+
+        data = json.dumps([{"name": "a", "count": "1"}] * 3 +
+                          [{"name": "a", "count": "x"}] +
+                          [{"name": "a", "count": "1"}] * 100000).encode()
+        stream = CountingStream(data)
+        with pytest.raises(gs.e.ValidationError) as err:
+            post(stream)
+        assert err.value.key == "rows[3].count"
+        assert stream.read_bytes < len(data) / 10
+
+        with pytest.raises(gs.e.ValidationError) as err:
+            post(io.BytesIO(b'[{"name": "a", "count": 1} {'))
+        assert err.value.message == "invalid JSON array"
+
+        with pytest.raises(gs.e.FormKeyError):
+            post(io.BytesIO(b"[]"), query="")
+
+
+def test_tokens_across_chunk_boundaries():
+    document = [1.5, 2e3, -0.25e-2, 10, "str\"ing", True, False, None,
+                {"a": [1.0, "b"]}, 123456789]
+    text = b"[1.5, 2e3, -0.25E-2, 10, \"str\\\"ing\", true, false, null, " \
+        b"{\"a\": [1.0, \"b\"]}, 123456789]"
+    assert json.loads(text) == document
+    for chunk_size in range(1, len(text) + 2):
+        stream = io.BytesIO(text)
+        assert list(gs.stream.iter_json_array(stream, chunk_size)) == \
+            document
+    # Cut every token at the default chunk size
+    for padding in range(len(text)):
+        stream = io.BytesIO(b" " * (65536 - padding) + text)
+        assert list(gs.stream.iter_json_array(stream)) == document
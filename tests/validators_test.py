@@ -80,6 +80,81 @@ def test_csrf(app):
         assert err.value.key == VALIDATOR_NAME
 
 
+def test_csrf_stateless(app):
+    validator = gs.flask.CSRF(stateless=True)
+    expired_validator = gs.flask.CSRF(stateless=True, lifetime=-10)
+    user = {"id": None}
+    identity_validator = gs.flask.CSRF(stateless=True,
+                                       identity=lambda: user["id"])
+
+    @app.route("/", methods=["GET", "POST"])
+    @gs.flask.validator({"csrf": validator})
+    @gs.flask.base
+    def index(form):
+        assert not flask.session.modified
+        if form.is_form():
+            return "success"
+        return flask.g.csrf_validator["csrf_token"]
+
+    @app.route("/expired", methods=["GET", "POST"])
+    @gs.flask.validator({"csrf": expired_validator})
+    @gs.flask.base
+    def expired(form):
+        if form.is_form():
+            return "success"
+        return flask.g.csrf_validator["csrf_token"]
+
+    @app.route("/user", methods=["GET", "POST"])
+    @gs.flask.validator({"csrf": identity_validator})
+    @gs.flask.base
+    def by_user(form):
+        if form.is_form():
+            return "success"
+        return flask.g.csrf_validator["csrf_token"]
+
+    with app.test_client() as c:
+        # No identity cookie exists yet
+        with pytest.raises(gs.flask.InvalidSessionError):
+            c.post("/", data={"csrf": "0.abc"})
+
+        token = c.get("/").data.decode()
+        assert c.post("/", data={"csrf": token}).data == b"success"
+        assert "_csrf_token" not in flask.session
+
+        # Tokens are bound to the identity cookie of the client
+        with app.test_client() as other:
+            other.get("/")
+            with pytest.raises(gs.e.ValidationError):
+                other.post("/", data={"csrf": token})
+
+        expires, _, signature = token.partition(".")
+        for bad in [token[:-2], "%d.%s" % (int(expires) + 1, signature),
+                    "garbage"]:
+            with pytest.raises(gs.e.ValidationError):
+                c.post("/", data={"csrf": bad})
+
+        with pytest.raises(gs.e.ValidationError) as err:
+            c.post("/expired", data={"csrf": c.get("/expired").data})
+        assert err.value.message == "expired token"
+
+        # Rotated secret keys are accepted from SECRET_KEY_FALLBACKS
+        old_key, app.secret_key = app.secret_key, b"new secret key"
+        with pytest.raises(gs.e.ValidationError):
+            c.post("/", data={"csrf": token})
+        app.config["SECRET_KEY_FALLBACKS"] = [old_key]
+        assert c.post("/", data={"csrf": token}).data == b"success"
+
+        user["id"] = 1
+        token = c.get("/user").data.decode()
+        assert c.post("/user", data={"csrf": token}).data == b"success"
+        user["id"] = 2
+        with pytest.raises(gs.e.ValidationError):
+            c.post("/user", data={"csrf": token})
+        user["id"] = None
+        with pytest.raises(gs.flask.InvalidSessionError):
+            c.post("/user", data={"csrf": token})
+
+
 def test_list(app):
     list_validator = gs.v.List(gs.v.Length(min=2, max=4))
     many_list_validator = gs.v.List([gs.v.Length(min=2, max=7),
@@ -727,3 +802,492 @@ def test_select(app):
             with pytest.raises(gs.e.ValidationError) as err:
                 c.post("/", data={"fruit": fruit})
             assert err.value.value == fruit
+
+
+def test_error_paths():
+    validator = gs.v.Dict(rows=gs.v.List(gs.v.Map(gs.v.Length(max=2))))
+    value = {"rows": [{"a": "ok"}, {"b": "ok", "c": "too long"}]}
+    with pytest.raises(gs.e.ValidationError) as err:
+        gs.u.validate_item(validator, "input", value)
+    assert err.value.key == "input.rows[1][c]"
+
+    with pytest.raises(gs.e.FormKeyError) as err:
+        gs.u.validate_item(gs.v.List(gs.v.Dict(name=gs.v.Exists())), "input",
+                           [{"name": "a"}, {}])
+    assert err.value.key == "input[1].name"
+
+    path = gs.u.Path(gs.u.Path("input", gs.u.Path.INDEX, 3),
+                     gs.u.Path.ATTRIBUTE, "name")
+    assert str(path) == "input[3].name"
+    assert gs.e.ValidationError(path, None, None).key == "input[3].name"
+
+
+def test_overridden_raise_error():
+    class LengthError(gs.e.FormError):
+        def __init__(self, key, message):
+            self.key = key
+            self.message = message
+
+    class MyLength(gs.v.Length):
+        def raise_error(self, key, value, message=None, **kwargs):
+            raise LengthError(key, "custom: %s" % message)
+
+    validator = gs.v.Dict(name=MyLength(max=2))
+    with pytest.raises(LengthError) as err:
+        validator.validate("input", {"name": "long"})
+    assert (err.value.key, err.value.message) == (
+        "input.name", "custom: value too long (4 > 2)")
+    with pytest.raises(LengthError):
+        gs.compiler.compile_validator(validator)("input", {"name": "long"})
+
+    errors = gs.u.Errors()
+    assert validator.check("input", {"name": "long"}, errors) is \
+        gs.u.INVALID
+    error = errors[0].to_error()
+    assert type(error) is LengthError and error.key == "input.name"
+    outputs, failed = gs.u.validate_many(MyLength(max=2), "rows",
+                                         ["ok", "long"])
+    assert type(failed[1]) is LengthError and failed[1].key == "rows[1]"
+    # Missing keys are not reported through raise_error()
+    with pytest.raises(gs.e.FormKeyError):
+        validator.validate("input", {})
+
+
+def test_custom_validators_get_string_keys():
+    import asyncio
+
+    keys = []
+
+    class Recorded(gs.v.Validator):
+        name = "recorded"
+
+        def validate(self, key, value):
+            assert type(key) is str
+            keys.append(key + "!")
+            return value
+
+    validator = gs.v.Dict(rows=gs.v.List(gs.v.Map(Recorded())))
+    value = {"rows": [{"a": "x"}, {"b": "y"}]}
+    expected = ["input.rows[0][a]!", "input.rows[1][b]!"]
+    runs = [
+        lambda: gs.u.validate_item(validator, "input", value),
+        lambda: gs.compiler.compile_validator(validator)("input", value),
+        lambda: gs.u.check_item(validator, "input", value, gs.u.Errors()),
+        lambda: asyncio.run(gs.u.validate_item_async(validator, "input",
+                                                     value)),
+        lambda: gs.u.validate_many(validator.fields["rows"].validator,
+                                   "input.rows", value["rows"]),
+        lambda: gs.u.validate_many([gs.v.Exists(), Recorded()],
+                                   "input.rows", [{}, {}]),
+    ]
+    for run in runs[:-1]:
+        del keys[:]
+        run()
+        assert keys == expected
+    del keys[:]
+    runs[-1]()
+    assert keys == ["input.rows[0]!", "input.rows[1]!"]
+
+
+def test_populate_is_shared(app):
+    calls = []
+
+    class Counted(gs.v.Validator):
+        name = "counted"
+        dynamic = False
+
+        def populate(self, name):
+            calls.append(name)
+            return {"calls": len(calls)}
+
+    class Dynamic(Counted):
+        name = "dynamic"
+        dynamic = True
+
+    # Custom validators are dynamic unless they opt out
+    class PerRequest(gs.v.Validator):
+        name = "request"
+
+        def populate(self, name):
+            return {"method": flask.request.method}
+
+    @app.route("/", methods=["GET", "POST"])
+    @gs.flask.validator({"input": [Counted(), Dynamic(),
+                                   gs.v.Select(["b", "a"])]})
+    @gs.flask.validator({"input": gs.v.Length(max=4)})
+    @gs.flask.base
+    def index(form):
+        return flask.jsonify(flask.g.input_validator)
+
+    @app.route("/other", methods=["GET", "PUT"])
+    @gs.flask.validator({"input": PerRequest()})
+    @gs.flask.set_methods("POST")
+    @gs.flask.base
+    def other(form):
+        return flask.jsonify(flask.g.input_validator)
+
+    assert not gs.v.List(gs.v.Length()).dynamic
+    assert gs.v.Dict(token=gs.flask.CSRF()).dynamic
+    assert PerRequest().dynamic and not gs.v.Exists().dynamic
+
+    with app.test_client() as c:
+        for expected in [2, 3]:
+            result = json.loads(c.get("/").data)
+            assert result == {"counted_calls": 1, "dynamic_calls": expected,
+                              "select_options": ["a", "b"],
+                              "length_min": None, "length_max": 4}
+        assert calls == ["input"] * 3
+        for method in ["GET", "PUT"]:
+            result = c.open("/other", method=method)
+            assert json.loads(result.data) == {"request_method": method}
+
+    with pytest.raises(TypeError):
+        gs.u.ReadOnlyDict(a=1)["b"] = 2
+
+
+@pytest.mark.parametrize("fmt, values", [
+    ("%Y-%m-%d", ["2020-04-10", "2020-4-1", "2020-02-30", "2020-04-10x",
+                  "20-04-10", "2020-13-01", "2020-00-10", "2020-04- 9",
+                  "２０２０-04-10", ""]),
+    ("%m/%d/%Y", ["04/10/2020", "4/10/2020", "04/10/2020 "]),
+    ("%d.%m.%y %H:%M:%S", ["10.04.68 23:59:59", "10.04.69  1:2:3",
+                           "10.04.20\t01:02:60", "10.04.20 24:00:00"]),
+    ("%Y%m%dT%H%M%S.%f", ["20200410T193000.5", "20200410t193000.123456",
+                          "20200410T193000.1234567"]),
+    ("%m-%d", ["02-29", "02-28"]),
+    ("%H:%M %% %Y", ["19:51 % 2020", "19:51 %2020"]),
+    ("(%Y)[%m]", ["(2020)[04]", "2020[04]"]),
+    ("%I:%M %p", ["7:51 PM", "19:51"]),
+])
+def test_strptime_parser(fmt, values):
+    parser = gs.v._Strptime(fmt)
+    for value in values:
+        try:
+            expected = datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            with pytest.raises(ValueError):
+                parser.parse(value)
+        else:
+            assert parser.parse(value) == expected
+
+    assert (parser._match is None) == (fmt == "%I:%M %p")
+
+
+def test_ipaddr_networks():
+    import ipaddress
+    import random
+
+    allow = gs.v.IPAddress(address_type=["ipv4", "ipv6"],
+                           networks=["10.0.0.0/8", "192.168.1.0/24",
+                                     "192.168.2.0/24", "2001:db8::/32",
+                                     "10.1.0.0/16"])
+    deny = gs.v.IPAddress(address_type=["ipv4", "ipv6"],
+                          networks=["10.0.0.0/8", "2001:db8::/32"],
+                          deny=True)
+
+    for addr in ["10.0.0.0", "10.255.255.255", "2001:db8::1"]:
+        allow.validate("addr", addr)
+        with pytest.raises(gs.e.ValidationError) as err:
+            deny.validate("addr", addr)
+        assert err.value.value == addr
+
+    for addr in ["192.168.1.7", "192.168.2.255"]:
+        allow.validate("addr", addr)
+        deny.validate("addr", addr)
+
+    for addr in ["11.0.0.0", "9.255.255.255", "192.168.3.0", "::1",
+                 "2001:db9::"]:
+        deny.validate("addr", addr)
+        with pytest.raises(gs.e.ValidationError):
+            allow.validate("addr", addr)
+
+    # IPv4-mapped IPv6 addresses are in the IPv4 networks
+    for addr in ["::ffff:10.1.2.3", "::ffff:a01:203", "::FFFF:192.168.1.1"]:
+        allow.validate("addr", addr)
+    for addr in ["::ffff:10.1.2.3", "::ffff:a01:203"]:
+        with pytest.raises(gs.e.ValidationError):
+            deny.validate("addr", addr)
+    for addr in ["::ffff:11.0.0.1", "::10.1.2.3", "::ffff:0:10.1.2.3"]:
+        deny.validate("addr", addr)
+        with pytest.raises(gs.e.ValidationError):
+            allow.validate("addr", addr)
+
+    # Invalid addresses still fail as before
+    with pytest.raises(gs.e.ValidationError) as err:
+        allow.validate("addr", "10.0.0.256")
+    assert err.value.exception is not None
+    with pytest.raises(gs.e.ValidationError):
+        gs.v.IPAddress().validate("addr", "::1")
+
+    rng = random.Random(4)
+    networks = ["%d.%d.%d.0/24" % (rng.randrange(256), rng.randrange(256),
+                                   rng.randrange(256)) for _ in range(5000)]
+    validator = gs.v.IPAddress(networks=networks)
+    parsed = [ipaddress.ip_network(network) for network in networks]
+    for network in parsed[:50]:
+        validator.validate("addr", str(network.network_address + 7))
+    for _ in range(200):
+        addr = ipaddress.ip_address(rng.getrandbits(32))
+        expected = any(addr in network for network in parsed)
+        try:
+            validator.validate("addr", str(addr))
+        except gs.e.ValidationError:
+            assert not expected
+        else:
+            assert expected
+
+
+def test_regex_backtracking():
+    import re
+    import warnings
+
+    for pattern, complexity in [("(a+)+$", "exponential"),
+                                ("^(\\w+\\s?)*$", "exponential"),
+                                ("(?:a{1,3})+$", "exponential"),
+                                ("(?:x{2,}y?){2}", "polynomial"),
+                                ("((?:a+){2})+", "exponential")]:
+        with pytest.warns(gs.e.UnsafePatternWarning,
+                          match="may take %s time" % complexity):
+            gs.v.Regex(pattern)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        for pattern in ["^[a-z]+$", "(ab){2}", "(?>a+)+", "(a|b)*c"]:
+            gs.v.Regex(pattern)
+
+    with pytest.warns(gs.e.UnsafePatternWarning):
+        validator = gs.v.Regex("^(a+)+$", max_length=32)
+    validator.validate("input", "a" * 32)
+    with pytest.raises(gs.e.ValidationError) as err:
+        validator.validate("input", "a" * 33)
+    assert err.value.message == "value too long (33 > 32)"
+
+    pytest.importorskip("regex")
+    # Overlapping alternatives are not detected, but are bounded in time
+    validator = gs.v.Regex("^(a|aa)+$", timeout=0.05)
+    validator.validate("input", "aaaa")
+    with pytest.raises(gs.e.ValidationError) as err:
+        validator.validate("input", "a" * 100 + "b")
+    assert isinstance(err.value.exception, TimeoutError)
+
+    # Flags, set as arguments or inline, mean the same with a timeout
+    for pattern, valid, invalid in [
+            (re.compile("^[a-z]+$", re.IGNORECASE), "ABC", "AB1"),
+            ("(?i)^[a-z]+$", "ABC", "AB1"),
+            (re.compile("^\\w+$", re.ASCII), "abc", "\u00e9t\u00e9"),
+            ("(?a)^\\w+$", "abc", "\u00e9t\u00e9"),
+            ("^\\w+$", "\u00e9t\u00e9", "a-b"),
+            (re.compile("^a.b$", re.DOTALL), "a\nb", "ab"),
+            (re.compile("^ a b $", re.VERBOSE), "ab", "a b"),
+            (re.compile("^b$", re.MULTILINE), "b", "a")]:
+        validator = gs.v.Regex(pattern, timeout=1)
+        validator.validate("input", valid)
+        with pytest.raises(gs.e.ValidationError):
+            validator.validate("input", invalid)
+
+
+def test_email_domains():
+    domains = ["example.com", "*.example.org", "Bücher.example",
+               "*.deep.example.net"]
+    domains += ["tenant%d.example.io" % index for index in range(5000)]
+    validator = gs.v.Email(domains=domains)
+
+    for email in ["a@example.com", "a@EXAMPLE.COM.", "a@b.example.org",
+                  "a@c.b.example.org", "a@bücher.example",
+                  "a@XN--BCHER-KVA.example", "a@x.deep.example.net",
+                  "a@tenant4999.example.io"]:
+        validator.validate("email", email)
+
+    for email in ["a@a.example.com", "a@example.org", "a@aexample.org",
+                  "a@deep.example.net", "a@example.net", "a@com",
+                  "a@tenant5000.example.io", "a@..", "a@exa\udcffmple.com"]:
+        with pytest.raises(gs.e.ValidationError) as err:
+            validator.validate("email", email)
+        assert err.value.message == "invalid domain (%r)" % email[2:]
+
+    with pytest.raises(ValueError):
+        gs.v.Email(domains=["example..com"])
+    with pytest.raises(ValueError):
+        gs.v.Email(domain="example.com", domains=["example.com"])
+
+
+def test_stacked_validators_are_merged(app, monkeypatch):
+    calls = []
+    process_flat_form = gs.flask.process_flat_form
+
+    def counting(*args):
+        calls.append(args)
+        return process_flat_form(*args)
+
+    monkeypatch.setattr(gs.flask, "process_flat_form", counting)
+
+    @app.route("/", methods=["GET", "POST"])
+    @gs.flask.validator({"first": gs.v.Length(max=3)})
+    @gs.flask.validator({"second": gs.v.Select(["a", "b"])})
+    @gs.flask.validator({"third": gs.v.Bool()})
+    @gs.flask.base
+    def index(form):
+        if form.is_form():
+            return flask.jsonify(dict(form))
+        return flask.jsonify(sorted(key for key in flask.g
+                                    if key.endswith("_validator")))
+
+    @app.errorhandler(gs.e.FormError)
+    def handle_form_error(exc):
+        return str(exc.key), 400
+
+    assert index._gigaspoon_validator[1].__name__ == "index"
+    with app.test_client() as client:
+        assert json.loads(client.get("/").data) == [
+            "first_validator", "second_validator", "third_validator"]
+
+        data = {"first": "abc", "second": "a", "third": "yes"}
+        assert json.loads(client.post("/", data=data).data) == {
+            "first": "abc", "second": "a", "third": True}
+        assert len(calls) == 1
+
+        # Errors are raised in the order of the decorators
+        result = client.post("/", data={"first": "abcd", "second": "c"})
+        assert result.data == b"first"
+        result = client.post("/", data={"first": "abc", "second": "c"})
+        assert result.data == b"second"
+        result = client.post("/", data={"first": "abc", "second": "a"})
+        assert result.data == b"third"
+
+
+def test_stacked_validators_with_conflicts_are_not_merged():
+    def index():
+        pass
+
+    inner = gs.flask.validator({"name": gs.v.Length(max=3)})(index)
+    for outer in [gs.flask.validator({"name": gs.v.Length(min=1)}),
+                  gs.flask.validator({"other": gs.v.Exists()},
+                                     collect=gs.u.ALL_ERRORS)]:
+        wrapped = outer(inner)
+        assert wrapped._gigaspoon_validator[1] is inner
+
+
+@pytest.mark.parametrize("collect", [gs.u.FIRST_ERROR, gs.u.ALL_ERRORS])
+def test_stacked_validators_collect_as_separate(app, collect):
+    def view(form):
+        return flask.jsonify([str(error.key) for error in form.errors])
+
+    stacked = gs.flask.validator({"a": gs.v.Length(max=1)}, collect=collect)(
+        gs.flask.validator({"b": gs.v.Length(max=1)}, collect=collect)(
+            gs.flask.base(view)))
+    single = gs.flask.validator({"a": gs.v.Length(max=1),
+                                 "b": gs.v.Length(max=1)}, collect=collect)(
+        gs.flask.base(view))
+    app.add_url_rule("/stacked", "stacked", stacked, methods=["POST"])
+    app.add_url_rule("/single", "single", single, methods=["POST"])
+
+    with app.test_client() as client:
+        data = {"a": "xx", "b": "yy"}
+        assert client.post("/stacked", data=data).json == ["a", "b"]
+        assert client.post("/single", data=data).json == (
+            ["a"] if collect == gs.u.FIRST_ERROR else ["a", "b"])
+    merged = stacked._gigaspoon_validator[2].keys() == {"a", "b"}
+    assert merged == (collect == gs.u.ALL_ERRORS)
+
+
+def test_cached():
+    calls = []
+
+    def parse(value):
+        calls.append(value)
+        return int(value)
+
+    validator = gs.v.Cached([gs.v.Length(max=3), gs.v.LambdaMap(parse)],
+                            maxsize=2)
+    assert validator.validate("a", "12") == 12
+    assert validator.validate("b", "12") == 12
+    assert calls == ["12"]
+
+    for key in ["c", "d"]:
+        with pytest.raises(gs.e.ValidationError) as err:
+            validator.validate(key, "x")
+        assert err.value.key == key
+        assert isinstance(err.value.exception, ValueError)
+    with pytest.raises(gs.e.ValidationError) as err:
+        validator.validate("e", "1234")
+    assert err.value.message == "value too long (4 > 3)"
+    assert calls == ["12", "x"]
+
+    # "12" was evicted by "x" and "1234"
+    assert validator.cache_info() == gs.v.CacheInfo(2, 3, 2, 2)
+    validator.validate("a", "12")
+    assert calls == ["12", "x", "12"]
+
+    validator.cache_clear()
+    assert validator.cache_info() == gs.v.CacheInfo(0, 0, 2, 0)
+
+    class Slow(gs.v.Validator):
+        async def validate(self, key, value):
+            pass
+
+    with pytest.raises(ValueError):
+        gs.v.Cached(Slow())
+
+
+def test_cached_replays_errors():
+    class ReasonError(gs.e.FormError):
+        def __init__(self, key, reason):
+            self.key = key
+            self.reason = reason
+
+    class Reasoned(gs.v.Validator):
+        name = "reasoned"
+
+        def validate(self, key, value):
+            raise ReasonError(key, "reason of %s" % value)
+
+    cached = gs.v.Cached(Reasoned())
+    validator = gs.v.List(cached)
+    for key in ["x", "y"]:
+        with pytest.raises(ReasonError) as err:
+            validator.validate(key, ["1"])
+        assert (err.value.key, err.value.reason) == (key + "[0]",
+                                                     "reason of 1")
+
+        errors = gs.u.Errors()
+        validator.check(key, ["1", "1"], errors)
+        assert [(type(error), error.key, error.reason) for error in
+                [record.to_error() for record in errors]] == [
+            (ReasonError, key + "[0]", "reason of 1"),
+            (ReasonError, key + "[1]", "reason of 1")]
+    assert cached.cache_info().hits == 5
+
+
+def test_cached_in_containers():
+    cached = gs.v.Cached(gs.v.Dict(value=gs.v.LambdaMap(int)))
+    validator = gs.v.Map(gs.v.List(gs.v.Cached(gs.v.Bool())))
+    value = {"a": ["yes", "no", "yes"], "b": ["yes", "maybe"]}
+    errors = gs.u.Errors()
+    assert gs.u.check_item(validator, "input", value, errors) is gs.u.INVALID
+    assert value["a"] == [True, False, True]
+    assert [record.key for record in errors] == ["input[b][1]"]
+
+    with pytest.raises(gs.e.ValidationError) as err:
+        gs.compiler.compile_validator(gs.v.List(validator))("rows", [
+            {"x": ["maybe"]}])
+    assert err.value.key == "rows[0][x][0]"
+
+    # Unhashable values are validated without caching
+    output = gs.u.validate_item(gs.v.List(cached), "rows", [{"value": "1"}])
+    assert output == [{"value": 1}]
+    assert cached.cache_info().currsize == 0
+
+
+def test_cached_ttl_and_threads():
+    import concurrent.futures
+
+    validator = gs.v.Cached(gs.v.Length(max=3), ttl=0)
+    validator.validate("a", "abc")
+    validator.validate("a", "abc")
+    assert validator.cache_info().misses == 2
+
+    validator = gs.v.Cached(gs.v.Length(max=3), maxsize=10)
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda index: validator.validate("a", str(index % 20)),
+                      range(2000)))
+    info = validator.cache_info()
+    assert info.hits + info.misses == 2000 and info.currsize == 10